@@ -3,35 +3,48 @@ This script analyzes a folder of conversation history jsons, applying different
 metrics of complexity to try and gauge which LLMs follow Occam's Razor.
 """
 
+from harness import scoring
+from harness.hypothesis_grammar import load_grammar_space
+from harness.probe_corpus import load_probe_corpus
+from harness.truth_tables import get_truth_table
 from harness.test_cases import TESTS_FULL
 import inspect
-import itertools
 import json
 import matplotlib.pyplot as plt
 import numpy as np
 import os
-import random
 
 def calculate_set_inclusion_score(guessed_lambda, rule):
-    random_inputs = [tuple(random.uniform(-200, 200)
-                            for _ in range(3)) for _ in range(10000)]
-    grid_inputs = []
+    corpus = load_probe_corpus(3)
 
-    for coords in itertools.product(range(-20, 21), repeat=3):
-        grid_inputs.append(coords)
-
-    test_inputs = random_inputs + grid_inputs
-    
     try:
-        guessed_set = set(inp for inp in test_inputs if guessed_lambda(*inp))
-        rule_set = set(inp for inp in test_inputs if rule(*inp))
+        guessed_set = _truthy(guessed_lambda, corpus)
+        table = get_truth_table(rule, corpus)
+        rule_set = table.unpack() if table is not None else _truthy(rule, corpus)
 
-        if guessed_set.issubset(rule_set) or rule_set.issubset(guessed_set):
-            return len(guessed_set) / len(rule_set)
+        if not (guessed_set & ~rule_set).any() or not (rule_set & ~guessed_set).any():
+            return int(guessed_set.sum()) / int(rule_set.sum())
     except:
         return None
     return None
 
+def _truthy(fn, corpus):
+    values, error = scoring.evaluate(fn, corpus.columns, rows=corpus.python_rows)
+    if error is not None:
+        raise error
+    if values.dtype == object:
+        return np.array([bool(v) for v in values], dtype=bool)
+    return values != 0
+
+def calculate_grammar_rank(guessed_lambda):
+    """
+    Position of the simplest grammar rule that behaves like the guess, or None
+    if the grammar has no such rule.
+    """
+    space = load_grammar_space(load_probe_corpus(3))
+    matches = space.matching(guessed_lambda)
+    return int(matches[0]) if len(matches) else None
+
 def count_num_ops(rulestr):
     operations = [
         "and", 
@@ -105,9 +118,12 @@ def main():
                     wrong_rule = wrong_rule[: wrong_rule.index("```")]
 
                     try:
-                        set_inclusion_score = calculate_set_inclusion_score(eval(wrong_rule), tests[test_index])
+                        guessed_lambda = scoring.remember_source(eval(wrong_rule), wrong_rule)
+                        set_inclusion_score = calculate_set_inclusion_score(guessed_lambda, tests[test_index])
+                        grammar_rank = calculate_grammar_rank(guessed_lambda)
                     except:
                         set_inclusion_score = None
+                        grammar_rank = None
                     if set_inclusion_score is not None:
                         set_inclusion_scores[json_filename].append(set_inclusion_score)
                     num_op = count_num_ops(wrong_rule)
@@ -115,7 +131,7 @@ def main():
                     str_len = len(wrong_rule) - 2
                     guess_str_len[json_filename].append(str_len)
 
-                    incorrects[test_index].append((json_filename, wrong_rule, set_inclusion_score, num_op, str_len))
+                    incorrects[test_index].append((json_filename, wrong_rule, set_inclusion_score, num_op, str_len, grammar_rank))
 
     for i in incorrects:
         print(i)
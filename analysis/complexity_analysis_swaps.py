@@ -4,6 +4,7 @@ metrics of complexity to try and gauge which LLMs follow Occam's Razor.
 """
 
 from analysis import complexity_analysis
+from harness import scoring
 from harness.test_cases import TESTS_FULL
 import inspect
 import itertools
@@ -66,8 +67,9 @@ def main():
                     wrong_rule = wrong_rule[: wrong_rule.index("```")]
 
                     try:
+                        guessed_lambda = scoring.remember_source(eval(wrong_rule), wrong_rule)
                         set_inclusion_score = complexity_analysis.calculate_set_inclusion_score(
-                            eval(wrong_rule), tests[int(test_index)]
+                            guessed_lambda, tests[int(test_index)]
                         )
                     except:
                         set_inclusion_score = None
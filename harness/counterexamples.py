@@ -0,0 +1,143 @@
+"""
+Persistent per-rule corpus of probe rows that refuted past guesses.
+
+Most wrong guesses fail on the same few boundary inputs (ties, zeros, the
+fractional special cases), so scoring checks a guess against these rows first
+and stops at the first mismatch. Only guesses that survive go on to the full
+probe sweep, and any row that refutes them there is added to the corpus.
+
+Files are keyed by the rule's source and the probe corpus version, and rows
+are always checked in probe order, so the row that refutes a guess depends
+only on which rows are known, not on the order earlier runs found them in.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from harness.probe_corpus import CACHE_DIR, SPECIAL_TESTS, grid_index
+from harness.truth_tables import rule_id, source_hash
+from harness import scoring
+
+COUNTEREXAMPLE_DIR = os.path.join(CACHE_DIR, 'counterexamples')
+# Bumped when the meaning of the stored rows changes
+COUNTEREXAMPLE_FORMAT = 2
+MAX_COUNTEREXAMPLES = 64
+NEW_PER_GUESS = 4
+
+SEED_CASES = [
+    (0, 0, 0), (1, 1, 1), (-1, -1, -1), (1, 2, 3), (3, 2, 1), (1, 1, 2),
+    (2, 1, 1), (1, 2, 1), (2, 2, 1), (0, 1, 2), (-1, 0, 1), (2, 3, 5),
+    (2, 4, 6), (-3, -2, -1), (3, 4, 5), (5, 4, 3)
+]
+SEED_CASES_SINGLE = [(0,), (1,), (-1,), (2,), (3,), (4,), (9,)]
+
+
+def seed_indices(corpus):
+    """
+    Boundary rows every rule starts with: ties, zeros, small ordered triples and
+    the fractional special cases at the end of the corpus.
+    """
+    if corpus.tuple_length == 1:
+        return [grid_index(case) for case in SEED_CASES_SINGLE]
+    indices = [grid_index(case) for case in SEED_CASES]
+    indices += list(range(len(corpus) - len(SPECIAL_TESTS), len(corpus)))
+    return indices
+
+
+class CounterexampleCorpus:
+    """
+    Probe row indices that refuted guesses, one .npy file per rule.
+    """
+
+    def __init__(self, cache_dir=COUNTEREXAMPLE_DIR):
+        self.cache_dir = cache_dir
+        self._indices = {}
+        self._lock = threading.Lock()
+
+    def _key(self, rule, corpus):
+        source = scoring.lambda_source(rule)
+        if source is None:
+            return None
+        return (rule_id(rule), source_hash(source), f'c{COUNTEREXAMPLE_FORMAT}', corpus.version)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, '-'.join(key) + '.npy')
+
+    def _load(self, key, corpus):
+        path = self._path(key)
+        if os.path.exists(path):
+            return [int(i) for i in np.load(path)]
+        return seed_indices(corpus)
+
+    def indices(self, rule, corpus):
+        """
+        Known counterexample rows for rule, in probe order.
+        """
+        key = self._key(rule, corpus)
+        if key is None:
+            return sorted(seed_indices(corpus))
+        with self._lock:
+            if key not in self._indices:
+                self._indices[key] = self._load(key, corpus)
+            return sorted(self._indices[key])
+
+    def add(self, rule, corpus, new_indices):
+        """
+        Record rows that refuted a guess, most recent first, keeping the corpus
+        bounded at MAX_COUNTEREXAMPLES.
+        """
+        key = self._key(rule, corpus)
+        if key is None or len(new_indices) == 0:
+            return
+        with self._lock:
+            # Merge with the file in case another process added rows meanwhile
+            known = self._load(key, corpus) + self._indices.get(key, [])
+            merged = []
+            for i in [int(i) for i in new_indices] + known:
+                if i not in merged:
+                    merged.append(i)
+            merged = merged[:MAX_COUNTEREXAMPLES]
+            self._indices[key] = merged
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(key)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.array(merged, dtype=np.int64))
+            os.replace(tmp_path, path)
+
+
+def find_refutation(guessed_lambda, rule, corpus, indices, table=None):
+    """
+    Check the guess on the given rows in order and return the first row where
+    it disagrees with the rule, or None if it agrees on all of them. Rows on
+    which the rule raises are skipped. If the guess raises, None is returned
+    as well, so the full sweep decides whether the guess is wrong or invalid
+    exactly as it would without the corpus.
+    """
+    reference = table.unpack() if table is not None else None
+    rows = scoring.python_rows([column[indices] for column in corpus.columns])
+    for i, row in zip(indices, rows):
+        if reference is not None:
+            expected = bool(reference[i])
+        else:
+            try:
+                expected = rule(*row)
+            except Exception:
+                continue
+        try:
+            guessed = guessed_lambda(*row)
+        except Exception:
+            return None
+        if guessed != expected:
+            return i
+    return None
+
+
+_corpus = CounterexampleCorpus()
+
+
+def get_counterexamples():
+    return _corpus
@@ -0,0 +1,338 @@
+"""
+Hypothesis space enumerated from a small expression grammar over the inputs.
+
+Terms are variables, constants and simple arithmetic over them; atoms compare
+two terms; rules are single atoms, "holds for every variable" conjunctions of
+one atom template, and conjunctions or disjunctions of two atoms. Every rule is
+fingerprinted by its packed truth vector on a fixed set of probe rows, and
+rules whose fingerprints hash alike are dropped, keeping the first (simplest)
+one enumerated.
+
+Rules are stored as rows of atom indices rather than lambdas, so the whole
+space is evaluated at any batch of points with a handful of array operations.
+"""
+
+import itertools
+import os
+import threading
+
+import numpy as np
+
+from harness import scoring
+from harness.counterexamples import seed_indices
+from harness.probe_corpus import CACHE_DIR
+from harness.scoring import remember_source
+from harness.truth_tables import popcount
+
+GRAMMAR_FORMAT = 2
+FINGERPRINT_ROWS = 1024
+FINGERPRINT_SEED = 8
+PAIR_ATOMS = 600
+
+CONSTANTS = [-10, -5, -2, -1, 0, 1, 2, 3, 4, 5, 10]
+MODULI = [2, 3, 4, 5]
+OPS = ['<', '<=', '==', '!=', '>', '>=']
+
+ATOM, AND, OR, FORALL = 0, 1, 2, 3
+
+_COMPARE = {
+    '<': np.less, '<=': np.less_equal, '==': np.equal,
+    '!=': np.not_equal, '>': np.greater, '>=': np.greater_equal
+}
+
+
+def grammar_terms(variables):
+    """
+    Arithmetic terms, modular terms and constants over the variables, simplest
+    first. Modular terms are only ever compared against constants.
+    """
+    arithmetic = list(variables)
+    for a, b in itertools.combinations(variables, 2):
+        arithmetic += [f'{a} + {b}', f'{a} - {b}', f'{a} * {b}']
+    if len(variables) > 1:
+        arithmetic += [' + '.join(variables), ' * '.join(variables)]
+        arithmetic += [f'max({", ".join(variables)})', f'min({", ".join(variables)})']
+    arithmetic += [f'abs({v})' for v in variables] + [f'{v}**2' for v in variables]
+
+    modular = [f'{v} % 1' for v in variables]
+    modular_bases = list(variables) + ([f'({" + ".join(variables)})'] if len(variables) > 1 else [])
+    modular += [f'{v} % {m}' for m in MODULI for v in modular_bases]
+
+    constants = [str(c) for c in CONSTANTS]
+    return arithmetic, modular, constants
+
+
+def _unary_templates():
+    """
+    Atom templates over a single variable, as functions of the variable name,
+    used to build the FORALL rules.
+    """
+    templates = []
+    for op in OPS:
+        for c in map(str, CONSTANTS):
+            templates.append(lambda v, op=op, c=c: (v, op, c))
+    templates.append(lambda v: (f'{v} % 1', '==', '0'))
+    templates.append(lambda v: (f'{v} % 1', '!=', '0'))
+    for m in MODULI:
+        for r in range(m):
+            templates.append(lambda v, m=m, r=r: (f'{v} % {m}', '==', str(r)))
+    return templates
+
+
+def _unique_rows(packed):
+    """
+    Positions of the first occurrence of each distinct row of a packed bit
+    matrix, in order. Rows are compared in full, viewed as one opaque value each.
+    """
+    packed = np.ascontiguousarray(packed)
+    rows = packed.view(np.dtype((np.void, packed.dtype.itemsize * packed.shape[1]))).ravel()
+    _, first = np.unique(rows, return_index=True)
+    first.sort()
+    return first
+
+
+class GrammarSpace:
+    """
+    Deduplicated grammar rules as an (n, 4) array of [kind, atom, atom, atom]
+    rows plus their packed fingerprints. Implements the same evaluate/rule
+    interface as HypothesisLibrary, so HypothesisSpaceTracker works on either.
+    """
+
+    def __init__(self, variables, atoms, rules, fingerprints, probe_rows, corpus):
+        self.variables = tuple(variables)
+        arithmetic, modular, constants = grammar_terms(self.variables)
+        self.terms = arithmetic + modular + constants
+        self.atoms = atoms
+        self.rule_atoms = rules
+        self.fingerprints = fingerprints
+        self.probe_rows = probe_rows
+        self.corpus = corpus
+        self._term_functions = None
+        self._lambdas = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.rule_atoms)
+
+    def atom_source(self, a):
+        left, op, right = self.atoms[a]
+        return f'{self.terms[left]} {OPS[op]} {self.terms[right]}'
+
+    def source(self, i):
+        kind, a, b, c = self.rule_atoms[i].tolist()
+        args = ', '.join(self.variables)
+        if kind == ATOM:
+            body = self.atom_source(a)
+        elif kind == AND:
+            body = f'{self.atom_source(a)} and {self.atom_source(b)}'
+        elif kind == OR:
+            body = f'{self.atom_source(a)} or {self.atom_source(b)}'
+        else:
+            body = ' and '.join(f'({self.atom_source(x)})' for x in (a, b, c)[:len(self.variables)])
+        return f'lambda {args}: {body}'
+
+    def rule(self, i):
+        """
+        Python lambda for rule i, built on demand.
+        """
+        i = int(i)
+        with self._lock:
+            if i not in self._lambdas:
+                src = self.source(i)
+                self._lambdas[i] = remember_source(eval(src), src)
+            return self._lambdas[i]
+
+    def _term_values(self, columns):
+        if self._term_functions is None:
+            args = ', '.join(self.variables)
+            functions = []
+            for term in self.terms:
+                src = f'lambda {args}: {term}'
+                functions.append(scoring.vectorize(remember_source(eval(src), src)))
+            self._term_functions = functions
+        n = len(columns[0])
+        with np.errstate(all='ignore'):
+            return np.stack([np.broadcast_to(np.asarray(f(*columns), dtype=np.float64), (n,))
+                             for f in self._term_functions])
+
+    def atom_values(self, columns):
+        """
+        Truth of every atom on the given columns, shape (n_atoms, n_points).
+        """
+        values = self._term_values(columns)
+        result = np.empty((len(self.atoms), len(columns[0])), dtype=bool)
+        for op, name in enumerate(OPS):
+            rows = np.flatnonzero(self.atoms[:, 1] == op)
+            result[rows] = _COMPARE[name](values[self.atoms[rows, 0]], values[self.atoms[rows, 2]])
+        return result
+
+    def evaluate(self, cases, indices=None):
+        """
+        Outcomes of rules (default: all) on a batch of test cases, as a boolean
+        array of shape (len(indices), len(cases)).
+        """
+        rules = self.rule_atoms if indices is None else self.rule_atoms[np.asarray(indices)]
+        columns = [np.array(c, dtype=np.float64) for c in zip(*cases)]
+        atoms = self.atom_values(columns)
+
+        kind = rules[:, 0]
+        first, second, third = atoms[rules[:, 1]], atoms[rules[:, 2]], atoms[rules[:, 3]]
+        outcomes = first.copy()
+        outcomes[kind == AND] &= second[kind == AND]
+        outcomes[kind == OR] |= second[kind == OR]
+        forall = kind == FORALL
+        outcomes[forall] &= second[forall] & third[forall]
+        return outcomes
+
+    def consistent(self, cases, results, indices=None):
+        """
+        Mask over rules (default: all) agreeing with every observed result.
+        """
+        return (self.evaluate(cases, indices) == np.asarray(results, dtype=bool)).all(axis=1)
+
+    def agreement_counts(self, guessed_lambda, indices):
+        """
+        Number of fingerprint rows on which the guess agrees with each rule.
+        """
+        columns = [column[self.probe_rows] for column in self.corpus.columns]
+        values, _ = scoring.evaluate(guessed_lambda, columns)
+        is_true = np.zeros(len(self.probe_rows), dtype=bool)
+        is_false = np.zeros(len(self.probe_rows), dtype=bool)
+        values = values.tolist()
+        is_true[:len(values)] = [v == True for v in values]
+        is_false[:len(values)] = [v == False for v in values]
+        matrix = self.fingerprints[indices]
+        return popcount(matrix & np.packbits(is_true)) + popcount(~matrix & np.packbits(is_false))
+
+    def set_sizes(self, indices, inclusive_int_range=(1, 100)):
+        """
+        Number of integers n in the range with rule(n, ..., n) true, per rule.
+        """
+        cases = [(n,) * len(self.variables) for n in range(*inclusive_int_range)]
+        return self.evaluate(cases, indices).sum(axis=1)
+
+    def matching(self, guessed_lambda):
+        """
+        Indices of rules with the same fingerprint as the guess.
+        """
+        columns = [column[self.probe_rows] for column in self.corpus.columns]
+        values, error = scoring.evaluate(guessed_lambda, columns)
+        if error is not None:
+            return np.array([], dtype=np.int64)
+        bits = np.packbits([v == True for v in values.tolist()])
+        return np.flatnonzero((self.fingerprints == bits).all(axis=1))
+
+
+def fingerprint_rows(corpus, size=FINGERPRINT_ROWS, seed=FINGERPRINT_SEED):
+    """
+    Fixed probe rows the fingerprints are taken on: the counterexample seed
+    rows plus a seeded sample of the rest of the corpus.
+    """
+    rows = list(dict.fromkeys(seed_indices(corpus)))
+    rng = np.random.default_rng(seed)
+    rest = np.setdiff1d(np.arange(len(corpus)), rows)
+    rows += rng.choice(rest, size - len(rows), replace=False).tolist()
+    return np.array(rows, dtype=np.int64)
+
+
+def enumerate_grammar(corpus, pair_atoms=PAIR_ATOMS):
+    """
+    Enumerate the grammar on the corpus and drop duplicate rules. Returns the
+    atoms, rule rows, fingerprints and fingerprint rows.
+    """
+    variables = ('x', 'y', 'z')[:corpus.tuple_length]
+    arithmetic, modular, constants = grammar_terms(variables)
+    terms = arithmetic + modular + constants
+    term_index = {t: i for i, t in enumerate(terms)}
+
+    candidates = []
+    for a, b in itertools.combinations(arithmetic, 2):
+        candidates += [(term_index[a], op, term_index[b]) for op in range(len(OPS))]
+    for a in arithmetic:
+        for c in constants:
+            candidates += [(term_index[a], op, term_index[c]) for op in range(len(OPS))]
+    templates = _unary_templates()
+    for v in variables:
+        for template in templates:
+            left, op, right = template(v)
+            candidates.append((term_index[left], OPS.index(op), term_index[right]))
+    if len(variables) > 1:
+        for m in MODULI:
+            base = term_index[f'({" + ".join(variables)}) % {m}']
+            candidates += [(base, OPS.index('=='), term_index[str(r)]) for r in range(m)]
+    # Simplest atoms first, so they are the ones kept and paired up
+    candidates = sorted(dict.fromkeys(candidates), key=lambda atom: len(terms[atom[0]].split()) + len(terms[atom[2]].split()))
+    candidates = np.array(candidates, dtype=np.int16)
+
+    probe_rows = fingerprint_rows(corpus)
+    space = GrammarSpace(variables, candidates, np.zeros((0, 4), dtype=np.int32), None, probe_rows, corpus)
+    atom_bits = np.packbits(space.atom_values([column[probe_rows] for column in corpus.columns]), axis=1)
+
+    # Atoms that behave alike are interchangeable inside every rule
+    unique = _unique_rows(atom_bits)
+    atoms, atom_bits = candidates[unique], atom_bits[unique]
+    atom_of = {tuple(atom): i for i, atom in enumerate(atoms.tolist())}
+
+    rules = [np.array([[ATOM, i, i, i] for i in range(len(atoms))], dtype=np.int32)]
+    fingerprints = [atom_bits]
+
+    if len(variables) > 1:
+        forall = []
+        for template in templates:
+            per_variable = [template(v) for v in variables]
+            ids = [atom_of.get((term_index[l], OPS.index(op), term_index[r])) for l, op, r in per_variable]
+            if None not in ids:
+                forall.append([FORALL] + (ids * 3)[:3])
+        if forall:
+            forall = np.array(forall, dtype=np.int32)
+            rules.append(forall)
+            fingerprints.append(atom_bits[forall[:, 1]] & atom_bits[forall[:, 2]] & atom_bits[forall[:, 3]])
+
+    k = min(pair_atoms, len(atoms))
+    for kind, combine in ((AND, np.bitwise_and), (OR, np.bitwise_or)):
+        for i in range(k - 1):
+            others = np.arange(i + 1, k)
+            block = np.column_stack([np.full(len(others), kind), np.full(len(others), i), others, others])
+            rules.append(block.astype(np.int32))
+            fingerprints.append(combine(atom_bits[i], atom_bits[others]))
+
+    rules = np.concatenate(rules)
+    fingerprints = np.concatenate(fingerprints)
+    keep = _unique_rows(fingerprints)
+    return atoms, rules[keep], fingerprints[keep], probe_rows
+
+
+_spaces = {}
+_spaces_lock = threading.Lock()
+
+
+def load_grammar_space(corpus, pair_atoms=PAIR_ATOMS, cache_dir=CACHE_DIR):
+    """
+    Process-wide grammar space for the corpus, enumerated once and saved to
+    cache_dir.
+    """
+    key = (corpus.version, pair_atoms, os.path.abspath(cache_dir))
+    with _spaces_lock:
+        if key in _spaces:
+            return _spaces[key]
+
+        path = os.path.join(cache_dir, f'grammar_space_v{GRAMMAR_FORMAT}_a{pair_atoms}_{corpus.version}.npz')
+        if os.path.exists(path):
+            with np.load(path) as stored:
+                atoms, rules = stored['atoms'], stored['rules']
+                fingerprints, probe_rows = stored['fingerprints'], stored['probe_rows']
+        else:
+            print(f"Enumerating grammar hypothesis space for probe corpus {corpus.version}")
+            atoms, rules, fingerprints, probe_rows = enumerate_grammar(corpus, pair_atoms)
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, atoms=atoms, rules=rules, fingerprints=fingerprints, probe_rows=probe_rows)
+            os.replace(tmp_path, path)
+
+        for array in (atoms, rules, fingerprints, probe_rows):
+            array.setflags(write=False)
+        variables = ('x', 'y', 'z')[:corpus.tuple_length]
+        space = GrammarSpace(variables, atoms, rules, fingerprints, probe_rows, corpus)
+        _spaces[key] = space
+        return space
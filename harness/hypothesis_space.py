@@ -1,68 +1,302 @@
 import numpy as np
 import random
 import math
+import json
+import os
+import threading
+
+from harness import scoring
+from harness.probe_corpus import CACHE_DIR, grid_index
+from harness.scoring import remember_source
+from harness.truth_tables import get_truth_table, popcount
+
+# Below this many off-grid cases, calling the lambdas directly beats vectorizing
+VECTORIZE_MIN_BATCH = 16
+# Hypothesis spaces bigger than this are shown downsampled
+VISUALIZE_MAX_CELLS = 1024
 
 class HypothesisSpaceTracker:
-    def __init__(self, possible_rules):
-        self.possible_rules = possible_rules # Using the test config to define the hypothesis space
-        self.remaining_hypotheses = set(possible_rules.values())
-        self.total_hypotheses = len(possible_rules)
+    """
+    Tracks which hypotheses are still consistent with the observed test cases.
+
+    possible_rules is a dict of lambdas, a HypothesisLibrary or a GrammarSpace.
+    Hypotheses keep their order and survivors are stored as a bitset of 64-bit
+    words. Each update evaluates the surviving hypotheses on a whole batch of
+    test cases at once through the space's evaluate method.
+    """
+
+    def __init__(self, possible_rules, corpus=None):
+        if isinstance(possible_rules, dict):
+            possible_rules = HypothesisLibrary(possible_rules, corpus)
+        self.library = possible_rules # Using the test config to define the hypothesis space
+        self.total_hypotheses = len(self.library)
         self.total_explored = 0
+        self.corpus = self.library.corpus
+
+        n_words = (self.total_hypotheses + 63) // 64
+        self.survivors = _pack(np.ones(self.total_hypotheses, dtype=bool), n_words)
+
+    def survivor_indices(self):
+        bits = np.unpackbits(self.survivors.view(np.uint8), bitorder='little')
+        return np.flatnonzero(bits[:self.total_hypotheses])
+
+    @property
+    def remaining_hypotheses(self):
+        return [self.library.rule(i) for i in self.survivor_indices()]
+
+    def num_remaining(self):
+        return int(popcount(self.survivors.view(np.uint8)))
+
+    def evaluate(self, cases, indices=None):
+        """
+        Outcomes of hypotheses (default: survivors) on a batch of test cases.
+        """
+        indices = self.survivor_indices() if indices is None else np.asarray(indices)
+        return self.library.evaluate(cases, indices)
+
+    def update_batch(self, cases, results):
+        """Update the hypothesis space with a batch of test cases and their results."""
+        indices = self.survivor_indices()
+        outcomes = self.evaluate(cases, indices)
+
+        keep = np.ones(self.total_hypotheses, dtype=bool)
+        if outcomes.dtype == bool:
+            keep[indices] = (outcomes == np.asarray(results, dtype=bool)).all(axis=1)
+        else:
+            for j, result in enumerate(results):
+                column = outcomes[:, j]
+                keep[indices] &= np.array([o is None or o == result for o in column], dtype=bool)
+
+        before = len(indices)
+        self.survivors &= _pack(keep, len(self.survivors))
+        remaining = self.num_remaining()
+
+        self.total_explored = (self.total_hypotheses - remaining) / self.total_hypotheses
+        newly_explored_percentage = (before - remaining) / self.total_hypotheses
+        return newly_explored_percentage, self.total_explored
 
     def update(self, x, y, z, result):
         """Update the hypothesis space based on the latest test case result."""
-        newly_explored = 0
-        for rule in list(self.remaining_hypotheses):
-            try:
-                if rule(x, y, z) != result:
-                    self.remaining_hypotheses.remove(rule)
-                    newly_explored += 1
-            except Exception as e:
-                print(f"Caught exception: {e}, applying {x, y, z, result} ignoring")
+        return self.update_batch([(x, y, z)], [result])
 
-        self.total_explored = (self.total_hypotheses - len(self.remaining_hypotheses)) / self.total_hypotheses
-        newly_explored_percentage = newly_explored / self.total_hypotheses
-        return newly_explored_percentage, self.total_explored
-    
     def update_single_arg(self, x, result):
         """Update the hypothesis space based on the latest test case result. Single arg version."""
-        newly_explored = 0
-        for rule in list(self.remaining_hypotheses):
-            if rule(x) != result:
-                self.remaining_hypotheses.remove(rule)
-                newly_explored += 1
-
-        self.total_explored = (self.total_hypotheses - len(self.remaining_hypotheses)) / self.total_hypotheses
-        newly_explored_percentage = newly_explored / self.total_hypotheses
-        return newly_explored_percentage, self.total_explored
-
+        return self.update_batch([(x,)], [result])
 
     def visualize_space(self):
         """Cute visualization of the reamining hypotheses available in our test hypothesis space"""
-        grid_size = int(np.ceil(np.sqrt(self.total_hypotheses)))
-        grid = np.zeros((grid_size, grid_size))
-        remaining = list(self.remaining_hypotheses)
-
-        for i in range(len(remaining)):
-            grid[i // grid_size, i % grid_size] = 1
+        # Large spaces are downsampled: a cell is filled if any hypothesis in its block survives
+        block = int(np.ceil(self.total_hypotheses / VISUALIZE_MAX_CELLS))
+        n_cells = int(np.ceil(self.total_hypotheses / block))
+        grid_size = int(np.ceil(np.sqrt(n_cells)))
+        bits = np.unpackbits(self.survivors.view(np.uint8), bitorder='little')[:self.total_hypotheses]
+        padded = np.zeros(n_cells * block, dtype=bool)
+        padded[:self.total_hypotheses] = bits
+        cells = np.zeros(grid_size * grid_size, dtype=bool)
+        cells[:n_cells] = padded.reshape(n_cells, block).any(axis=1)
+        grid = cells.reshape(grid_size, grid_size)
 
         viz = "\n".join(" ".join("■" if cell else "□" for cell in row) for row in grid)
         return viz
-    
+
     def compute_threshold(self):
         base_threshold = max(0.01, min(0.1, 1 / math.log(self.total_hypotheses)))
         return base_threshold * (1 - 0.5 * self.total_explored)
 
-def combine_hypotheses(base_hypotheses, generated_hypotheses):
+
+def _pack(mask, n_words):
+    """Pack a boolean mask into n_words little-endian 64-bit words."""
+    packed = np.zeros(n_words * 8, dtype=np.uint8)
+    bits = np.packbits(mask, bitorder='little')
+    packed[:len(bits)] = bits
+    return packed.view(np.uint64)
+
+class HypothesisLibrary:
+    """
+    Immutable, indexed set of hypotheses together with their stacked truth
+    tables over the probe corpus. Shared by every tracker that uses it, so a
+    tracker only has to allocate its survivor bitset.
+    """
+
+    def __init__(self, rules, corpus=None, sources=None):
+        self.names = tuple(rules.keys())
+        self.rules = tuple(rules.values())
+        self.sources = tuple(sources.get(name) for name in self.names) if sources else (None,) * len(self.names)
+        self.corpus = corpus
+
+        self.truth_matrix = None
+        self.has_table = np.zeros(len(self.rules), dtype=bool)
+        if corpus is not None:
+            tables = [get_truth_table(rule, corpus, source) for rule, source in zip(self.rules, self.sources)]
+            self.has_table = np.array([t is not None for t in tables], dtype=bool)
+            if self.has_table.any():
+                empty = np.zeros((len(corpus) + 7) // 8, dtype=np.uint8)
+                self.truth_matrix = np.stack([empty if t is None else t.bits for t in tables])
+                self.truth_matrix.setflags(write=False)
+        self.has_table.setflags(write=False)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def as_dict(self):
+        return dict(zip(self.names, self.rules))
+
+    def rule(self, i):
+        return self.rules[i]
+
+    def evaluate(self, cases, indices=None):
+        """
+        Outcomes of hypotheses (default: all) on a batch of test cases, of shape
+        (len(indices), len(cases)). A boolean array when every outcome is a
+        bool, otherwise an object array with None where a hypothesis raised.
+
+        Cases on the probe grid are read straight out of the truth tables for
+        all hypotheses at once, anything else is run through each hypothesis'
+        vectorized form over the batch.
+        """
+        indices = np.arange(len(self.rules)) if indices is None else np.asarray(indices)
+        values = np.zeros((len(indices), len(cases)), dtype=bool)
+        # Outcomes that raised, and outcomes that aren't bools, kept aside so
+        # the common case stays a plain boolean array
+        errors = np.zeros((len(indices), len(cases)), dtype=bool)
+        others = []
+
+        table_rows = [None] * len(cases)
+        if self.truth_matrix is not None:
+            table_rows = [grid_index(case) if len(case) == self.corpus.tuple_length else None for case in cases]
+        has_table = self.has_table[indices]
+        for j, row in enumerate(table_rows):
+            if row is not None:
+                bits = (self.truth_matrix[indices[has_table], row >> 3] >> (7 - (row & 7))) & 1
+                values[has_table, j] = bits.astype(bool)
+
+        for k, i in enumerate(indices):
+            pending = [j for j, row in enumerate(table_rows) if row is None or not has_table[k]]
+            if not pending:
+                continue
+            for j, value in zip(pending, self._evaluate_rule(self.rules[i], [cases[j] for j in pending])):
+                if value is None:
+                    errors[k, j] = True
+                elif isinstance(value, (bool, np.bool_)):
+                    values[k, j] = value
+                else:
+                    others.append((k, j, value))
+
+        if not errors.any() and not others:
+            return values
+        outcomes = values.astype(object)
+        outcomes[errors] = None
+        for k, j, value in others:
+            outcomes[k, j] = value
+        return outcomes
+
+    def _evaluate_rule(self, rule, cases):
+        if len(cases) >= VECTORIZE_MIN_BATCH:
+            columns = [np.array(c, dtype=np.float64) for c in zip(*cases)]
+            try:
+                return scoring.evaluate_columns(rule, columns).tolist()
+            except scoring.NotVectorizable:
+                pass
+        values = []
+        for case in cases:
+            try:
+                values.append(rule(*case))
+            except Exception as e:
+                print(f"Caught exception: {e}, applying {case} ignoring")
+                values.append(None)
+        return values
+
+
+def _behavior_key(rule, corpus):
+    """
+    Key identifying what a rule does: its truth table over the corpus, or its
+    source (or identity) when no table can be built.
+    """
+    if corpus is not None:
+        table = get_truth_table(rule, corpus)
+        if table is not None:
+            return table.bits.tobytes()
+    return scoring.lambda_source(rule) or id(rule)
+
+
+def combine_hypotheses(base_hypotheses, generated_hypotheses, corpus=None):
+    """
+    Add generated hypotheses to the base ones, dropping any that behave like a
+    hypothesis already present. Behavior is compared on the probe corpus if
+    one is given, otherwise by source text.
+    """
     combined = base_hypotheses.copy()
-    
+    seen = {_behavior_key(rule, corpus) for rule in combined.values()}
+
     for key, rule in generated_hypotheses.items():
-        if rule not in combined.values():
+        behavior = _behavior_key(rule, corpus)
+        if behavior not in seen:
+            seen.add(behavior)
             combined[key] = rule
-    
+
     return combined
 
-def generate_hypothesis_space(num_hypotheses=50):
+
+HYPOTHESIS_SEED = 150
+HYPOTHESIS_COUNT = 150
+
+_libraries = {}
+_library_lock = threading.Lock()
+
+
+def load_hypothesis_library(base_hypotheses, corpus, num_hypotheses=HYPOTHESIS_COUNT,
+                            seed=HYPOTHESIS_SEED, cache_dir=CACHE_DIR):
+    """
+    Process-wide hypothesis library: the base hypotheses plus num_hypotheses
+    generated from a fixed seed, deduplicated by behavior on the corpus. The
+    surviving generated rules are persisted as source strings, so later runs
+    only have to eval them.
+    """
+    key = (id(base_hypotheses), corpus.version, num_hypotheses, seed)
+    with _library_lock:
+        if key in _libraries:
+            return _libraries[key]
+
+        path = os.path.join(cache_dir, f'hypothesis_library_s{seed}_n{num_hypotheses}.json')
+        sources = None
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                stored = json.load(f)
+            if stored.get('probe_corpus_version') == corpus.version and \
+                    stored.get('base') == list(base_hypotheses.keys()):
+                sources = stored['generated']
+
+        if sources is None:
+            generated = generate_hypothesis_sources(num_hypotheses, random.Random(seed))
+            rules = {name: remember_source(eval(src), src) for name, src in generated.items()}
+            combined = combine_hypotheses(base_hypotheses, rules, corpus)
+            sources = {name: generated[name] for name in combined if name in generated}
+
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({
+                    'probe_corpus_version': corpus.version,
+                    'base': list(base_hypotheses.keys()),
+                    'generated': sources
+                }, f, indent=2)
+            os.replace(tmp_path, path)
+
+        rules = base_hypotheses.copy()
+        rules.update({name: remember_source(eval(src), src) for name, src in sources.items()})
+        library = HypothesisLibrary(rules, corpus, sources)
+        _libraries[key] = library
+        return library
+
+
+def generate_hypothesis_space(num_hypotheses=50, seed=None):
+    rng = random.Random(seed) if seed is not None else random
+    return {
+        name: remember_source(eval(rule), rule)
+        for name, rule in generate_hypothesis_sources(num_hypotheses, rng).items()
+    }
+
+def generate_hypothesis_sources(num_hypotheses=50, rng=random):
     generated_rules = {}
     
     rule_types = [
@@ -79,51 +313,51 @@ def generate_hypothesis_space(num_hypotheses=50):
     ]
 
     for i in range(num_hypotheses):
-        rule_type = random.choice(rule_types)
+        rule_type = rng.choice(rule_types)
 
         if rule_type == 'order':
-            ops = random.choice(['>', '<', '>=', '<='])
+            ops = rng.choice(['>', '<', '>=', '<='])
             rule = f"lambda x, y, z: x {ops} y {ops} z"
 
         elif rule_type == 'equality':
-            equal_vars = random.sample(['x', 'y', 'z'], 2)
+            equal_vars = rng.sample(['x', 'y', 'z'], 2)
             rule = f"lambda x, y, z: {equal_vars[0]} == {equal_vars[1]}"
 
         elif rule_type == 'inequality':
             rule = "lambda x, y, z: x != y and y != z and x != z"
 
         elif rule_type == 'sign':
-            sign = random.choice(['>', '<'])
+            sign = rng.choice(['>', '<'])
             rule = f"lambda x, y, z: x {sign} 0 and y {sign} 0 and z {sign} 0"
 
         elif rule_type == 'parity':
-            parity = random.choice([0, 1])
+            parity = rng.choice([0, 1])
             rule = f"lambda x, y, z: (int(x) % 2 == {parity}) and (int(y) % 2 == {parity}) and (int(z) % 2 == {parity})"
 
         elif rule_type == 'arithmetic':
-            op = random.choice(['+', '-', '*'])
-            vars = random.sample(['x', 'y', 'z'], 3)
+            op = rng.choice(['+', '-', '*'])
+            vars = rng.sample(['x', 'y', 'z'], 3)
             rule = f"lambda x, y, z: {vars[0]} {op} {vars[1]} == {vars[2]}"
 
         elif rule_type == 'max_min':
-            func = random.choice(['max', 'min'])
-            var = random.choice(['x', 'y', 'z'])
+            func = rng.choice(['max', 'min'])
+            var = rng.choice(['x', 'y', 'z'])
             rule = f"lambda x, y, z: {func}(x, y, z) == {var}"
 
         elif rule_type == 'modulo':
-            mod = random.randint(2, 5)
-            remainder = random.randint(0, mod-1)
+            mod = rng.randint(2, 5)
+            remainder = rng.randint(0, mod-1)
             rule = f"lambda x, y, z: (int(x) % {mod} == {remainder}) and (int(y) % {mod} == {remainder}) and (int(z) % {mod} == {remainder})"
 
         elif rule_type == 'rounding':
-            round_func = random.choice(['math.floor', 'math.ceil', 'round'])
+            round_func = rng.choice(['math.floor', 'math.ceil', 'round'])
             rule = f"lambda x, y, z: {round_func}(x) == {round_func}(y) == {round_func}(z)"
 
         elif rule_type == 'simple_function':
-            func = random.choice(['abs', 'math.sin', 'math.cos', 'math.exp'])
-            op = random.choice(['>', '<', '=='])
+            func = rng.choice(['abs', 'math.sin', 'math.cos', 'math.exp'])
+            op = rng.choice(['>', '<', '=='])
             rule = f"lambda x, y, z: {func}(x) {op} {func}(y) {op} {func}(z)"
 
-        generated_rules[f'generated_{i}'] = eval(rule)
+        generated_rules[f'generated_{i}'] = rule
 
     return generated_rules
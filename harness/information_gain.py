@@ -0,0 +1,133 @@
+"""
+Expected-information-gain oracle for test case queries.
+
+A query splits the surviving hypotheses into those predicting True and those
+predicting False. With every survivor equally likely, its expected information
+gain is the binary entropy of that split. The oracle scores a fixed grid of
+candidate queries against the survivors in one matrix pass and reports how the
+model's query compares to the best candidate.
+"""
+
+import itertools
+import threading
+import weakref
+
+import numpy as np
+
+from harness.hypothesis_grammar import GrammarSpace, fingerprint_rows
+
+ORACLE_CANDIDATES = 4096
+ORACLE_MAX_SURVIVORS = 2048
+ORACLE_SEED = 9
+
+
+def binary_entropy(p):
+    """
+    Entropy in bits of a True/False split with probability p of True.
+    """
+    p = np.asarray(p, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        h = -(p * np.log2(p) + (1 - p) * np.log2(1 - p))
+    return np.nan_to_num(h, nan=0.0)
+
+
+def _as_bool(outcomes):
+    # A hypothesis that raises is never eliminated by the query, so it counts as False
+    if outcomes.dtype == bool:
+        return outcomes
+    return np.vectorize(lambda o: o == True, otypes=[bool])(outcomes)
+
+
+def corpus_candidates(corpus, size=ORACLE_CANDIDATES):
+    """
+    Candidate queries drawn from the probe corpus, boundary rows first.
+    """
+    rows = fingerprint_rows(corpus, min(size, len(corpus)), ORACLE_SEED)
+    return [tuple(row) for row in np.stack([column[rows] for column in corpus.columns], axis=1).tolist()]
+
+
+def integer_candidates(tuple_length, inclusive_int_range=(1, 100), size=ORACLE_CANDIDATES):
+    """
+    Candidate queries over an integer domain: all of it if it is small enough,
+    otherwise the diagonal plus a seeded sample.
+    """
+    values = range(inclusive_int_range[0], inclusive_int_range[1] + 1)
+    if len(values) ** tuple_length <= size:
+        return list(itertools.product(values, repeat=tuple_length))
+    cases = [(v,) * tuple_length for v in values]
+    rng = np.random.default_rng(ORACLE_SEED)
+    sample = rng.integers(values.start, values.stop, size=(size - len(cases), tuple_length))
+    return cases + [tuple(case) for case in sample.tolist()]
+
+
+class QueryOracle:
+    """
+    Candidate queries together with every hypothesis' outcome on them, packed
+    eight candidates to a byte.
+    """
+
+    def __init__(self, space, cases, packed=None):
+        self._space = weakref.ref(space)
+        self.cases = cases
+        if packed is None:
+            packed = np.packbits(_as_bool(space.evaluate(cases)), axis=1)
+        self.packed = packed
+
+    def _sample(self, indices):
+        if len(indices) <= ORACLE_MAX_SURVIVORS:
+            return indices
+        rng = np.random.default_rng(ORACLE_SEED)
+        return np.sort(rng.choice(indices, ORACLE_MAX_SURVIVORS, replace=False))
+
+    def gains(self, indices):
+        """
+        Expected information gain of every candidate given the survivors.
+        """
+        indices = self._sample(np.asarray(indices))
+        if len(indices) == 0:
+            return np.zeros(len(self.cases))
+        outcomes = np.unpackbits(self.packed[indices], axis=1, count=len(self.cases))
+        return binary_entropy(outcomes.sum(axis=0) / len(indices))
+
+    def query_gain(self, case, indices):
+        indices = self._sample(np.asarray(indices))
+        if len(indices) == 0:
+            return 0.0
+        outcomes = _as_bool(self._space().evaluate([case], indices))
+        return float(binary_entropy(outcomes[:, 0].mean()))
+
+    def query_efficiency(self, case, indices):
+        """
+        Gain of the query as a fraction of the best candidate's gain, capped at
+        1 since the query may beat every candidate on the grid. None once no
+        candidate can split the survivors.
+        """
+        best = float(self.gains(indices).max())
+        if best == 0:
+            return None
+        return min(1.0, self.query_gain(case, indices) / best)
+
+
+_oracles = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def get_query_oracle(space, integer_range=None):
+    """
+    Process-wide oracle for a hypothesis space. Grammar spaces reuse their
+    fingerprints as the candidate outcomes; other spaces are evaluated once on
+    probe corpus rows, or on integer_range when the inputs are integers.
+    """
+    with _lock:
+        if space in _oracles:
+            return _oracles[space]
+        if isinstance(space, GrammarSpace):
+            columns = [column[space.probe_rows] for column in space.corpus.columns]
+            cases = [tuple(row) for row in np.stack(columns, axis=1).tolist()]
+            oracle = QueryOracle(space, cases, space.fingerprints)
+        elif integer_range is not None:
+            oracle = QueryOracle(space, integer_candidates(space.corpus.tuple_length, integer_range))
+        else:
+            oracle = QueryOracle(space, corpus_candidates(space.corpus))
+        _oracles[space] = oracle
+        return oracle
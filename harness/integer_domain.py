@@ -0,0 +1,202 @@
+"""
+Membership bitmasks for the set-membership hypotheses of the Bayesian splits.
+
+Every Bayesian hypothesis asks whether each input belongs to a set of integers
+("powers of 4", "within 8 of 50"), so it is fully described by which integers
+of the domain it accepts. The masks are computed once per hypothesis, packed
+eight integers to a byte; tracker updates then become bit lookups and set
+sizes popcounts over all hypotheses at once.
+"""
+
+import threading
+
+import numpy as np
+
+from harness import scoring
+from harness.hypothesis_space import HypothesisLibrary
+from harness.size_principle import set_size
+from harness.truth_tables import popcount
+
+INTEGER_DOMAIN = (1, 100)
+SEPARABILITY_SAMPLES = 256
+SEPARABILITY_SEED = 100
+
+
+def _as_bool(values, n):
+    """
+    Verdicts as a boolean array of length n, or None unless they are exactly
+    n booleans.
+    """
+    if len(values) != n:
+        return None
+    if values.dtype == object:
+        if not all(type(v) is bool for v in values.tolist()):
+            return None
+        return values.astype(bool)
+    if values.dtype != bool and not np.isin(values, (0, 1)).all():
+        return None
+    return values == 1
+
+
+def membership(rule, tuple_length, domain=INTEGER_DOMAIN):
+    """
+    Membership of every integer n in the inclusive domain, i.e. rule(n, ..., n),
+    or None if the rule raises or is not boolean somewhere on it.
+    """
+    diagonal = np.arange(domain[0], domain[1] + 1, dtype=np.float64)
+    values, error = scoring.evaluate(rule, [diagonal] * tuple_length)
+    if error is not None:
+        return None
+    return _as_bool(values, len(diagonal))
+
+
+def is_separable(rule, mask, tuple_length, domain=INTEGER_DOMAIN):
+    """
+    Whether rule(x, y, z) is the membership of x, y and z combined with and,
+    checked on a seeded sample of the domain.
+    """
+    if tuple_length == 1:
+        return True
+    rng = np.random.default_rng(SEPARABILITY_SEED)
+    sample = rng.integers(domain[0], domain[1] + 1, size=(tuple_length, SEPARABILITY_SAMPLES))
+    values, error = scoring.evaluate(rule, [column.astype(np.float64) for column in sample])
+    if error is not None:
+        return False
+    expected = mask[sample - domain[0]].all(axis=0)
+    values = _as_bool(values, SEPARABILITY_SAMPLES)
+    return values is not None and bool((values == expected).all())
+
+
+class IntegerHypothesisSpace:
+    """
+    Set-membership hypotheses with their packed membership masks over the
+    integer domain. Implements the evaluate/rule interface of
+    HypothesisLibrary, so HypothesisSpaceTracker works on it; cases outside
+    the domain, and hypotheses without a usable mask, go through the library.
+    """
+
+    def __init__(self, rules, tuple_length, corpus=None, domain=INTEGER_DOMAIN):
+        self.library = HypothesisLibrary(rules, corpus)
+        self.names = self.library.names
+        self.rules = self.library.rules
+        self.corpus = corpus
+        self.tuple_length = tuple_length
+        self.domain = domain
+        self.domain_size = domain[1] - domain[0] + 1
+
+        masks = np.zeros((len(self.rules), self.domain_size), dtype=bool)
+        self.has_mask = np.zeros(len(self.rules), dtype=bool)
+        for i, rule in enumerate(self.rules):
+            mask = membership(rule, tuple_length, domain)
+            if mask is not None and is_separable(rule, mask, tuple_length, domain):
+                masks[i] = mask
+                self.has_mask[i] = True
+        self.masks = np.packbits(masks, axis=1)
+        self.masks.setflags(write=False)
+        self.has_mask.setflags(write=False)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def rule(self, i):
+        return self.rules[i]
+
+    def _offsets(self, case):
+        if len(case) != self.tuple_length:
+            return None
+        if not all(isinstance(v, (int, float)) and v % 1 == 0 and self.domain[0] <= v <= self.domain[1] for v in case):
+            return None
+        return [int(v) - self.domain[0] for v in case]
+
+    def _bits(self, indices, offsets):
+        offsets = np.asarray(offsets)
+        return ((self.masks[indices][:, offsets >> 3] >> (7 - (offsets & 7))) & 1).astype(bool)
+
+    def evaluate(self, cases, indices=None):
+        """
+        Outcomes of hypotheses (default: all) on a batch of test cases. A
+        boolean array when every case is in the domain and every hypothesis has
+        a mask, otherwise an object array with None where a hypothesis raised.
+        """
+        indices = np.arange(len(self.rules)) if indices is None else np.asarray(indices)
+        offsets = [self._offsets(case) for case in cases]
+        in_domain = [j for j, o in enumerate(offsets) if o is not None]
+
+        fast = np.ones((len(indices), len(in_domain)), dtype=bool)
+        if in_domain:
+            columns = np.array([offsets[j] for j in in_domain])
+            for k in range(self.tuple_length):
+                fast &= self._bits(indices, columns[:, k])
+
+        masked = self.has_mask[indices]
+        if len(in_domain) == len(cases) and masked.all():
+            return fast
+
+        outcomes = np.full((len(indices), len(cases)), None, dtype=object)
+        outcomes[np.ix_(masked, in_domain)] = fast[masked]
+        rest = [j for j in range(len(cases)) if offsets[j] is None]
+        if rest and masked.any():
+            outcomes[np.ix_(masked, rest)] = self.library.evaluate([cases[j] for j in rest], indices[masked])
+        if not masked.all():
+            outcomes[~masked] = self.library.evaluate(cases, indices[~masked])
+        return outcomes
+
+    def set_sizes(self, indices=None, inclusive_int_range=(1, 100)):
+        """
+        Number of integers n in range(*inclusive_int_range) that each hypothesis
+        accepts, inf where it cannot be computed.
+        """
+        indices = np.arange(len(self.rules)) if indices is None else np.asarray(indices)
+        start, stop = inclusive_int_range[0] - self.domain[0], inclusive_int_range[1] - self.domain[0]
+        sizes = np.full(len(indices), np.inf)
+        masked = self.has_mask[indices]
+        if 0 <= start and stop <= self.domain_size:
+            window = np.zeros(self.domain_size, dtype=bool)
+            window[start:stop] = True
+            sizes[masked] = popcount(self.masks[indices[masked]] & np.packbits(window))
+        else:
+            masked = np.zeros(len(indices), dtype=bool)
+        for k in np.flatnonzero(~masked):
+            size = set_size(self.rules[indices[k]], self.tuple_length, inclusive_int_range)
+            sizes[k] = np.inf if size is None else size
+        return sizes
+
+    def agreement_counts(self, guessed_lambda, indices):
+        """
+        Number of domain integers on which the guess agrees with each
+        hypothesis, both applied to (n, ..., n).
+        """
+        indices = np.asarray(indices)
+        diagonal = np.arange(self.domain[0], self.domain[1] + 1, dtype=np.float64)
+        values, _ = scoring.evaluate(guessed_lambda, [diagonal] * self.tuple_length)
+        is_true = np.zeros(self.domain_size, dtype=bool)
+        is_false = np.zeros(self.domain_size, dtype=bool)
+        values = values.tolist()
+        is_true[:len(values)] = [v == True for v in values]
+        is_false[:len(values)] = [v == False for v in values]
+
+        counts = np.zeros(len(indices), dtype=np.int64)
+        masked = self.has_mask[indices]
+        matrix = self.masks[indices[masked]]
+        counts[masked] = popcount(matrix & np.packbits(is_true)) + popcount(~matrix & np.packbits(is_false))
+        for k in np.flatnonzero(~masked):
+            rule_values, _ = scoring.evaluate(self.rules[indices[k]], [diagonal] * self.tuple_length)
+            truthy = np.array([v == True for v in rule_values.tolist()], dtype=bool)
+            n = len(truthy)
+            counts[k] = (truthy & is_true[:n]).sum() + (~truthy & is_false[:n]).sum()
+        return counts
+
+
+_spaces = {}
+_spaces_lock = threading.Lock()
+
+
+def load_integer_space(rules, tuple_length, corpus=None, domain=INTEGER_DOMAIN):
+    """
+    Process-wide IntegerHypothesisSpace for a dict of rules, built on first use.
+    """
+    key = (id(rules), tuple_length, corpus.version if corpus is not None else None, domain)
+    with _spaces_lock:
+        if key not in _spaces:
+            _spaces[key] = IntegerHypothesisSpace(rules, tuple_length, corpus, domain)
+        return _spaces[key]
@@ -1,15 +1,25 @@
-import random
+import asyncio
 import re
-import itertools
 import inspect
 import time
-import math
 
-from models.base_model import BaseModel
+import numpy as np
+
+from models.conversation import Conversation
+from models.deadlines import remaining, test_deadline
+from models.executor import run_cpu
+from models.retry import TIMEOUT
 from .hypothesis_space import HypothesisSpaceTracker
-from harness.hypothesis_space import generate_hypothesis_space, combine_hypotheses
+from harness.hypothesis_space import load_hypothesis_library
+from harness.hypothesis_grammar import GrammarSpace, load_grammar_space
+from harness.information_gain import get_query_oracle
+from harness.integer_domain import IntegerHypothesisSpace, INTEGER_DOMAIN, load_integer_space
 from .test_cases import TESTS_FULL, TESTS_BAYESIAN, TESTS_BAYESIAN_SINGLE
-from harness.utils import HarnessUtils
+from harness import scoring
+from harness.probe_corpus import load_probe_corpus
+from harness import truth_tables
+from harness.size_principle import size_principle_points, space_size_principle_points
+from harness.counterexamples import get_counterexamples, find_refutation, NEW_PER_GUESS
 
 
 class LLMReasoningHarness:
@@ -18,7 +28,8 @@ class LLMReasoningHarness:
     """
 
     def __init__(self, model, rule_lambda, tuple_length=3, max_attempts=30,
-                 use_bayesian=False, old_context=None, force_prompt=None):
+                 use_bayesian=False, old_context=None, force_prompt=None,
+                 hypothesis_space='library'):
         """
         Initialize the harness with model and configuration parameters.
         """
@@ -34,23 +45,42 @@ class LLMReasoningHarness:
         self.test_case_is_reused = []
         self.results = []
         self.confirms_bias = []
-
-        # Generate and combine hypotheses
-        generated_hypotheses = generate_hypothesis_space(150)
-        all_hypotheses = combine_hypotheses(TESTS_FULL, generated_hypotheses)
+        self.query_efficiency = []
+        self.mulligan = False
+        # Turns whose model call timed out, and whether the test ran out of time
+        self.turn_timeouts = 0
+        self.timed_out = False
+        self.deadline = None
+        # Prompt tokens per turn, and how many of them hit the provider's cache
+        self.input_tokens = []
+        self.cached_tokens = []
+        # Provider-side state that lets the model be sent only the newest
+        # message, when session mode is on
+        self.session = self.model.new_session()
+
+        # Shared, seeded hypothesis library (built once per process)
+        self.probe_corpus = load_probe_corpus(self.tuple_length)
         if self.use_bayesian:
-            all_hypotheses = TESTS_BAYESIAN_SINGLE if self.tuple_length == 1 else TESTS_BAYESIAN
+            rules = TESTS_BAYESIAN_SINGLE if self.tuple_length == 1 else TESTS_BAYESIAN
+            all_hypotheses = load_integer_space(rules, self.tuple_length, self.probe_corpus)
             self.max_attempts = 5 # moving this out of main
-        self.hypothesis_tracker = HypothesisSpaceTracker(all_hypotheses)
+        elif hypothesis_space == 'grammar':
+            all_hypotheses = load_grammar_space(self.probe_corpus)
+        else:
+            all_hypotheses = load_hypothesis_library(TESTS_FULL, self.probe_corpus)
+        self.hypothesis_tracker = HypothesisSpaceTracker(all_hypotheses, self.probe_corpus)
+        # Bayesian inputs are integers in 1-100, so candidate queries are too
+        integer_range = INTEGER_DOMAIN if self.use_bayesian else None
+        self.query_oracle = get_query_oracle(self.hypothesis_tracker.library, integer_range)
 
         # Load appropriate system prompt
         self.system_prompt = self._load_system_prompt(force_prompt)
 
         # Initialize or load conversation history
         if old_context is None:
-            self.conversation_history = self.model.initialize_conversation(self.system_prompt)
+            self.conversation_history = Conversation(self.model.initialize_conversation(self.system_prompt))
         else:
-            self.conversation_history = old_context
+            self.conversation_history = Conversation(old_context)
             self.attempts = sum(1 for x in old_context if x["role"] == "assistant")
 
         print(f"Hypothesis Space: {len(all_hypotheses)}")
@@ -83,6 +113,9 @@ class LLMReasoningHarness:
             return "No numbers provided."
 
         result = self.rule(*args)
+        self.query_efficiency.append(
+            self.query_oracle.query_efficiency(args, self.hypothesis_tracker.survivor_indices())
+        )
         if len(args) == 1:
             newly_explored, total_explored = self.hypothesis_tracker.update_single_arg(*args, result)
         else:
@@ -121,15 +154,42 @@ class LLMReasoningHarness:
         """
         return 100 * (1 - (self.attempts / self.max_attempts))
 
+    def score_guess(self, guessed_lambda, rule):
+        """
+        Evaluate the guessed lambda against the rule over the probe inputs.
+        Returns the 1000/0 verdict and the mask of probe rows where they disagree.
+
+        Rows that refuted earlier guesses are tried first; a guess that fails on
+        one of them is rejected without the full sweep, and its mask holds only
+        that row. A guess that raises on one of them gets the full sweep.
+        """
+        corpus = self.probe_corpus
+        table = truth_tables.get_truth_table(rule, corpus)
+        counterexamples = get_counterexamples()
+
+        refuting_row = find_refutation(guessed_lambda, rule, corpus,
+                                       counterexamples.indices(rule, corpus), table)
+        if refuting_row is not None:
+            mask = np.zeros(len(corpus), dtype=bool)
+            mask[refuting_row] = True
+            return 0, mask
+
+        if table is not None:
+            points, mask = truth_tables.score(guessed_lambda, table, corpus)
+        else:
+            points, mask = scoring.score(guessed_lambda, rule, corpus.columns, rows=corpus.python_rows)
+
+        if points == 0:
+            counterexamples.add(rule, corpus, np.flatnonzero(mask)[:NEW_PER_GUESS])
+        return points, mask
+
     def calculate_rule_correctness_points(self, guessed_lambda, rule):
         """
         Evaluate the correctness of the guessed lambda against the actual rule.
         """
-        test_inputs = self._generate_test_inputs()
-
-        all_correct = all(rule(*inputs) == guessed_lambda(*inputs) for inputs in test_inputs)
+        points, _ = self.score_guess(guessed_lambda, rule)
 
-        if all_correct:
+        if points == 1000:
             return 1000
 
         rule_str = inspect.getsource(rule).strip()
@@ -140,27 +200,6 @@ class LLMReasoningHarness:
 
         return self._map_judgment_to_points(llm_judgment)
 
-    def _generate_test_inputs(self):
-        """
-        Generate a combination of random and grid-based test inputs.
-        """
-        random_inputs_1 = [tuple(random.uniform(-200, 200) for _ in range(self.tuple_length)) for _ in range(5000)]
-        random_inputs_2 = [tuple(random.uniform(-3, 3) for _ in range(self.tuple_length)) for _ in range(5000)]
-        grid_inputs = list(itertools.product(range(-20, 21), repeat=self.tuple_length))
-        special_tests = [
-            (0.1, 0.2, 0.3),
-            (1.1, 1.2, 1.3),
-            (2.5, 2.6, 2.7),
-            (0.1, 0.2, 0.3),
-            (0.3, 0.6, 0.9),
-            (0.1234, 0.5678, 0.9123),
-            (0, 0.5, 1),
-            (1, 1.5, 2),
-            (2.5, 3, 3.5),
-            (3.9, 4.2, 4.8)
-        ] # likely removable with multi resolution random
-        return random_inputs_1 + random_inputs_2 + grid_inputs + special_tests
-
     def _map_judgment_to_points(self, judgment):
         """
         Map LLM judgment to points. Not really working right yet.
@@ -182,69 +221,181 @@ class LLMReasoningHarness:
         """
         Evaluate the size principle based on the guessed lambda.
         """
-        remaining_hyps = self.hypothesis_tracker.remaining_hypotheses
-        hypothesis_sizes = [HarnessUtils.calculate_set_size(rule) for rule in remaining_hyps]
-        rule_points = [self.calculate_rule_correctness_points(guessed_lambda, rule) for rule in remaining_hyps]
-
-        closest_hyp = rule_points.index(max(rule_points))
-        smallest_hyp = hypothesis_sizes.index(min(hypothesis_sizes))
-
-        return 1 if closest_hyp == smallest_hyp else 0
+        space = self.hypothesis_tracker.library
+        if isinstance(space, (GrammarSpace, IntegerHypothesisSpace)):
+            return space_size_principle_points(guessed_lambda, space, self.hypothesis_tracker.survivor_indices())
+        remaining_hyps = list(self.hypothesis_tracker.remaining_hypotheses)
+        return size_principle_points(guessed_lambda, remaining_hyps, self.probe_corpus)
 
     def interact_with_llm(self, sleep=0):
         """
         Main interaction loop with the LLM.
         """
-        mulligan = False
+        self.mulligan = False
+        self.deadline = test_deadline()
         while self.attempts <= self.max_attempts:
             if sleep > 0:
                 time.sleep(sleep)
 
-            model_response = self.model.perform_step(self.conversation_history)
+            model_response = self.model.perform_step(self.conversation_history, self.deadline, self.session)
+            outcome = self.apply_response(model_response)
+            if outcome is not None:
+                return outcome
+            if not model_response and sleep > 0:
+                time.sleep(sleep * self.attempts)
 
-            if not model_response:
-                if not mulligan:
-                    print("Harness: LLM did not reply, retrying")
-                    self.attempts += 1
-                    mulligan = True
-                    if sleep > 0:
-                        time.sleep(sleep * self.attempts)
-                    continue
-                else:
-                    print("Harness: LLM did not reply again, aborting")
-                    break
+        return self._create_result_dict(0, 0)
 
-            print(f"LLM: {model_response}")
+    async def interact_with_llm_async(self, sleep=0):
+        """
+        Same loop as interact_with_llm, awaiting the model instead of blocking
+        on it. Replies are applied on the sync executor: scoring a final guess
+        or a query can take long enough to stall every other conversation and
+        its turn timers if run on the event loop.
+        """
+        self.mulligan = False
+        self.deadline = test_deadline()
+        while self.attempts <= self.max_attempts:
+            if sleep > 0:
+                await asyncio.sleep(sleep)
 
-            if self._is_final_guess(model_response):
-                final_eval = self._handle_final_guess(model_response, mulligan)
-                if final_eval:
-                    return final_eval
-                else:
-                    mulligan = True
-            elif self._is_test_case(model_response):
-                result = self._handle_test_case(model_response, mulligan)
-                if result == "ABORT":
-                    return self._create_result_dict(0, 0)
-                mulligan = (result == "MULLIGAN")
-            else:
-                if not mulligan:
-                    complaint = (
-                        "Please make sure to send your response in the format specified, "
-                        "where the string 'Test Case:' or 'Final Guess:' appears, followed by your response "
-                        "wrapped in triple backticks, e.g. 'Test Case: ```(0,0,0)```' or "
-                        "'Final Guess: ```lambda x: x```'."
-                    )
-                    self._update_conversation(model_response, complaint)
-                    self.attempts += 1
-                    mulligan = True
-                else:
-                    print("Harness: Not properly engaging, Aborting")
-                    self._update_conversation(model_response, "Aborting...")
-                    break
+            model_response = await self.model.perform_step_async(self.conversation_history, self.deadline,
+                                                                 self.session)
+            outcome = await run_cpu(self.apply_response, model_response)
+            if outcome is not None:
+                return outcome
+            if not model_response and sleep > 0:
+                await asyncio.sleep(sleep * self.attempts)
 
         return self._create_result_dict(0, 0)
 
+    def apply_response(self, model_response):
+        """
+        One turn of the interaction loop for a reply however it was obtained,
+        e.g. from a provider batch. Returns the result dict once the test is
+        over, otherwise None.
+        """
+        self._record_usage(model_response)
+        if self._out_of_time(model_response):
+            return self._create_result_dict(0, 0)
+        return self.process_response(model_response)
+
+    def out_of_attempts(self):
+        return self.attempts > self.max_attempts
+
+    def unfinished_result(self):
+        """
+        Result of a test that used up its attempts without a correct guess.
+        """
+        return self._create_result_dict(0, 0)
+
+    def checkpoint_state(self):
+        """
+        The test's progress as JSON-friendly data, for resuming a lockstep run
+        with restore_state.
+        """
+        return {
+            'conversation_history': list(self.conversation_history),
+            'attempts': self.attempts,
+            'mulligan': self.mulligan,
+            'test_cases': [list(args) for args in self.test_cases],
+            'results': self.results,
+            'test_case_is_reused': self.test_case_is_reused,
+            'confirms_bias': self.confirms_bias,
+            'query_efficiency': self.query_efficiency,
+            'turn_timeouts': self.turn_timeouts,
+            'input_tokens': self.input_tokens,
+            'cached_tokens': self.cached_tokens
+        }
+
+    def restore_state(self, state):
+        """
+        Continue a test from checkpoint_state. The hypothesis tracker is
+        rebuilt by replaying the recorded test cases in order.
+        """
+        self.conversation_history = Conversation(state['conversation_history'])
+        self.attempts = state['attempts']
+        self.mulligan = state['mulligan']
+        self.test_cases = [tuple(args) for args in state['test_cases']]
+        self.results = state['results']
+        self.test_case_is_reused = state['test_case_is_reused']
+        self.confirms_bias = state['confirms_bias']
+        self.query_efficiency = state['query_efficiency']
+        self.turn_timeouts = state['turn_timeouts']
+        self.input_tokens = state['input_tokens']
+        self.cached_tokens = state['cached_tokens']
+        for args, result in zip(self.test_cases, self.results):
+            if len(args) == 1:
+                self.hypothesis_tracker.update_single_arg(*args, result)
+            else:
+                self.hypothesis_tracker.update(*args, result)
+
+    def _record_usage(self, model_response):
+        if model_response:
+            self.input_tokens.append(getattr(model_response, 'input_tokens', None))
+            self.cached_tokens.append(getattr(model_response, 'cached_tokens', None))
+
+    def _out_of_time(self, model_response):
+        """
+        Record a timed-out call; True if the call came back empty because the
+        test's time budget is spent. A reply that made it in time still counts.
+        """
+        if model_response:
+            return False
+        if getattr(model_response, 'error', None) == TIMEOUT:
+            self.turn_timeouts += 1
+        left = remaining(self.deadline)
+        if left is not None and left <= 0:
+            print("Harness: test time budget exhausted, aborting")
+            self.timed_out = True
+        return self.timed_out
+
+    def process_response(self, model_response):
+        """
+        Apply one model reply to the test. Returns the result dict once the
+        test is over, otherwise None and the loop asks the model again.
+        """
+        mulligan = self.mulligan
+        if not model_response:
+            if not mulligan:
+                print("Harness: LLM did not reply, retrying")
+                self.attempts += 1
+                self.mulligan = True
+                return None
+            else:
+                print("Harness: LLM did not reply again, aborting")
+                return self._create_result_dict(0, 0)
+
+        print(f"LLM: {model_response}")
+
+        if self._is_final_guess(model_response):
+            final_eval = self._handle_final_guess(model_response, mulligan)
+            if final_eval:
+                return final_eval
+            else:
+                self.mulligan = True
+        elif self._is_test_case(model_response):
+            result = self._handle_test_case(model_response, mulligan)
+            if result == "ABORT":
+                return self._create_result_dict(0, 0)
+            self.mulligan = (result == "MULLIGAN")
+        else:
+            if not mulligan:
+                complaint = (
+                    "Please make sure to send your response in the format specified, "
+                    "where the string 'Test Case:' or 'Final Guess:' appears, followed by your response "
+                    "wrapped in triple backticks, e.g. 'Test Case: ```(0,0,0)```' or "
+                    "'Final Guess: ```lambda x: x```'."
+                )
+                self._update_conversation(model_response, complaint)
+                self.attempts += 1
+                self.mulligan = True
+            else:
+                print("Harness: Not properly engaging, Aborting")
+                self._update_conversation(model_response, "Aborting...")
+                return self._create_result_dict(0, 0)
+        return None
+
     def _is_final_guess(self, response):
         """
         Check if the response contains a final guess.
@@ -325,29 +476,34 @@ class LLMReasoningHarness:
 
             if guess_str:
                 try:
-                    guessed_lambda = eval(guess_str)
+                    guessed_lambda = scoring.remember_source(eval(guess_str), guess_str)
                     points = self.guess_rule(guessed_lambda)
-                    # size_principle_result = self.eval_size_principle(guessed_lambda)
-                    size_principle_result = 0  # Placeholder
-                    lambda_str = inspect.getsource(self.rule).strip()
-
-                    if points == 1000:
-                        forward_msg = (
-                            f"Congratulations! Your guess is correct. SCORE: {points}. "
-                            f"SIZE_PRINCIPLE_SCORE: {size_principle_result}"
-                        )
-                    else:
-                        forward_msg = (
-                            f"Sorry, that's not the correct rule. The rule was {lambda_str}. "
-                            f"SCORE: {points}"
-                        )
-
-                    self._update_conversation(model_response, forward_msg)
-                    return self._create_result_dict(points, size_principle_result)
                 except Exception as e:
                     print(f"Caught exception during eval: {e}")
                     self._update_conversation(model_response, "Invalid lambda function.")
                     return self._create_result_dict(0)
+
+                # Correctness is settled; a failure here must not change it
+                try:
+                    size_principle_result = self.eval_size_principle(guessed_lambda)
+                except Exception as e:
+                    print(f"Caught exception during size principle eval: {e}")
+                    size_principle_result = 0
+                lambda_str = inspect.getsource(self.rule).strip()
+
+                if points == 1000:
+                    forward_msg = (
+                        f"Congratulations! Your guess is correct. SCORE: {points}. "
+                        f"SIZE_PRINCIPLE_SCORE: {size_principle_result}"
+                    )
+                else:
+                    forward_msg = (
+                        f"Sorry, that's not the correct rule. The rule was {lambda_str}. "
+                        f"SCORE: {points}"
+                    )
+
+                self._update_conversation(model_response, forward_msg)
+                return self._create_result_dict(points, size_principle_result)
             else:
                 if not mulligan:
                     complaint = "Please wrap your function in backticks, e.g., 'Final Guess: ```lambda x, y, z: True```'."
@@ -371,7 +527,15 @@ class LLMReasoningHarness:
             'size_principle_points': size_principle_points,
             'guesses': self.attempts,
             'reused_tests': sum(self.test_case_is_reused),
-            'confirms_bias': sum(self.confirms_bias)
+            'confirms_bias': sum(self.confirms_bias),
+            'query_efficiency': self.query_efficiency,
+            'turn_timeouts': self.turn_timeouts,
+            'timed_out': self.timed_out,
+            'action_protocol': getattr(self.model, 'action_protocol', 'text'),
+            'input_tokens': self.input_tokens,
+            'cached_tokens': self.cached_tokens,
+            'session': self.session.summary() if self.session is not None else None,
+            'probe_corpus_version': self.probe_corpus.version
         }
 
     def _update_conversation(self, model_response, user_response):
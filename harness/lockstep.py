@@ -0,0 +1,82 @@
+"""
+Lockstep turn scheduler for provider batch APIs.
+
+Interactive runs drive every test as its own loop. With a batch API a test's
+next turn waits on a batch anyway, so all active tests move together instead:
+each round sends every test's next request as one batch, applies the replies
+through LLMReasoningHarness.apply_response, and drops the tests that have
+finished. Rounds repeat until no test is left.
+"""
+
+import time
+
+from models.retry import classify_error
+
+
+def custom_id(test_idx, harness):
+    # Unique per turn, so a batch resumed after a restart can't be applied
+    # to the wrong turn
+    return f"test-{test_idx}-turn-{len(harness.conversation_history)}"
+
+
+def _with_retries(model, func, *args):
+    attempt = 0
+    while True:
+        try:
+            return func(*args)
+        except Exception as e:
+            kind = classify_error(e)
+            if not model.retry_policy.should_retry(kind, attempt):
+                raise
+            delay = model.retry_policy.delay(attempt, e)
+            print(f"Batch call failed ({kind}): {e}; retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+def run_lockstep(model, harnesses, on_result, on_round=None, pending=None):
+    """
+    Run {test_idx: harness} to completion, one batch per round.
+
+    on_result(test_idx, harness, result) is called as each test finishes.
+    on_round(active, batch) is called after each submission and after each
+    round, for checkpointing. active is {test_idx: harness} of the unfinished
+    tests, and batch is the pending {'id', 'requests'} or None between rounds.
+    pending is such a batch from before a restart. It is waited on instead of
+    resubmitting, if it holds exactly the requests of the current round.
+    """
+    if not model.supports_batch:
+        raise ValueError(f"{type(model).__name__} has no batch API")
+    active = dict(harnesses)
+    for test_idx, harness in list(active.items()):
+        if harness.out_of_attempts():
+            on_result(test_idx, harness, harness.unfinished_result())
+            del active[test_idx]
+
+    round_num = 0
+    while active:
+        round_num += 1
+        ids = {custom_id(test_idx, harness): test_idx for test_idx, harness in active.items()}
+        if pending is not None and sorted(pending['requests']) == sorted(ids):
+            batch_id = pending['id']
+            print(f"Round {round_num}: resuming batch {batch_id} for {len(ids)} tests")
+        else:
+            requests = {cid: active[test_idx].conversation_history for cid, test_idx in ids.items()}
+            batch_id = _with_retries(model, model.submit_batch, requests)
+            print(f"Round {round_num}: submitted batch {batch_id} for {len(ids)} tests")
+        pending = None
+        if on_round is not None:
+            on_round(active, {'id': batch_id, 'requests': list(ids)})
+
+        results = _with_retries(model, model.collect_batch, batch_id, list(ids))
+        for cid, test_idx in ids.items():
+            harness = active[test_idx]
+            print(f"Test {test_idx}:")
+            result = harness.apply_response(results[cid])
+            if result is None and harness.out_of_attempts():
+                result = harness.unfinished_result()
+            if result is not None:
+                on_result(test_idx, harness, result)
+                del active[test_idx]
+        if on_round is not None:
+            on_round(active, None)
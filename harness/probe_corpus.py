@@ -0,0 +1,127 @@
+"""
+Frozen probe inputs used to compare rules.
+
+The corpus is generated once from a fixed seed, written to the cache directory
+(cache/ in the repository, or $WILT_CACHE_DIR) as an .npy file and
+memory-mapped read-only by every harness, thread and worker process, so
+verdicts are reproducible across runs and machines. Its version string is
+recorded in results so scores can be matched to the inputs that produced them.
+"""
+
+import hashlib
+import itertools
+import os
+import threading
+
+import numpy as np
+
+from harness import scoring
+
+CACHE_DIR = os.environ.get('WILT_CACHE_DIR',
+                           os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache'))
+PROBE_CORPUS_FORMAT = 1
+PROBE_CORPUS_SEED = 2410
+# Corpus layout: RANDOM_PROBES rows at each of two scales, then the integer
+# grid [-GRID_RANGE, GRID_RANGE]^k starting at row GRID_OFFSET
+RANDOM_PROBES = 5000
+GRID_RANGE = 20
+GRID_OFFSET = 2 * RANDOM_PROBES
+
+SPECIAL_TESTS = [
+    (0.1, 0.2, 0.3),
+    (1.1, 1.2, 1.3),
+    (2.5, 2.6, 2.7),
+    (0.1, 0.2, 0.3),
+    (0.3, 0.6, 0.9),
+    (0.1234, 0.5678, 0.9123),
+    (0, 0.5, 1),
+    (1, 1.5, 2),
+    (2.5, 3, 3.5),
+    (3.9, 4.2, 4.8)
+]
+
+
+class ProbeCorpus:
+    """
+    Read-only probe inputs stored column-wise, shape (tuple_length, n).
+    """
+
+    def __init__(self, values, version):
+        self.values = values
+        self.version = version
+        self.tuple_length = values.shape[0]
+        self.columns = [values[i] for i in range(self.tuple_length)]
+        self._rows = None
+
+    def __len__(self):
+        return self.values.shape[1]
+
+    def python_rows(self):
+        """
+        The corpus as Python tuples, for rules that cannot be vectorized.
+        """
+        if self._rows is None:
+            self._rows = scoring.python_rows(self.columns)
+        return self._rows
+
+
+def build_probe_values(tuple_length=3, seed=PROBE_CORPUS_SEED):
+    """
+    Random inputs at two scales, the integer grid [-20, 20]^k, and hand-picked
+    fractional cases, in the order the scorer checks them.
+    """
+    rng = np.random.default_rng(seed)
+    random_inputs_1 = rng.uniform(-200, 200, size=(RANDOM_PROBES, tuple_length))
+    random_inputs_2 = rng.uniform(-3, 3, size=(RANDOM_PROBES, tuple_length))
+    grid_inputs = np.array(list(itertools.product(range(-GRID_RANGE, GRID_RANGE + 1), repeat=tuple_length)),
+                           dtype=np.float64)
+    parts = [random_inputs_1, random_inputs_2, grid_inputs]
+    if tuple_length == 3:
+        parts.append(np.array(SPECIAL_TESTS, dtype=np.float64))
+    return np.ascontiguousarray(np.concatenate(parts).T)
+
+
+def grid_index(case):
+    """
+    Row of an integer test case inside the corpus grid, or None if it is not on
+    the grid.
+    """
+    if any(v % 1 != 0 or not -GRID_RANGE <= v <= GRID_RANGE for v in case):
+        return None
+    index = 0
+    for v in case:
+        index = index * (2 * GRID_RANGE + 1) + int(v) + GRID_RANGE
+    return GRID_OFFSET + index
+
+
+_corpora = {}
+_lock = threading.Lock()
+
+
+def _corpus_path(cache_dir, tuple_length, seed):
+    return os.path.join(cache_dir, f'probe_corpus_v{PROBE_CORPUS_FORMAT}_k{tuple_length}_s{seed}.npy')
+
+
+def load_probe_corpus(tuple_length=3, seed=PROBE_CORPUS_SEED, cache_dir=CACHE_DIR):
+    """
+    Return the process-wide probe corpus, building and saving it on first use.
+    """
+    key = (tuple_length, seed, os.path.abspath(cache_dir))
+    with _lock:
+        if key in _corpora:
+            return _corpora[key]
+
+        path = _corpus_path(cache_dir, tuple_length, seed)
+        if not os.path.exists(path):
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, build_probe_values(tuple_length, seed))
+            os.replace(tmp_path, path)
+
+        values = np.load(path, mmap_mode='r')
+        digest = hashlib.sha1(np.ascontiguousarray(values).tobytes()).hexdigest()[:8]
+        version = f'{PROBE_CORPUS_FORMAT}.k{tuple_length}.s{seed}.{digest}'
+        corpus = ProbeCorpus(values, version)
+        _corpora[key] = corpus
+        return corpus
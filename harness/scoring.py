@@ -0,0 +1,558 @@
+"""
+Vectorized evaluation of rule lambdas over columns of probe inputs.
+
+Lambdas are recompiled from their source with an AST rewrite that maps the
+scalar constructs used in WILT rules (chained comparisons, and/or/not, max,
+min, abs, int, all, any, math.*) onto NumPy equivalents, so a rule can be run
+once over x, y, z column vectors instead of once per tuple. Anything outside
+that vocabulary, or anything that raises (including floating point errors),
+falls back to calling the original lambda element by element, which keeps the
+verdict identical to the pure-Python scorer.
+"""
+
+import ast
+import functools
+import inspect
+import math
+import textwrap
+import threading
+import weakref
+
+import numpy as np
+
+_ARITH_OPS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+_BIT_OPS = (ast.BitAnd, ast.BitOr, ast.BitXor)
+_CMP_OPS = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+_BUILTIN_CALLS = {
+    'abs': '_wilt_abs',
+    'max': '_wilt_max',
+    'min': '_wilt_min',
+    'int': '_wilt_int',
+    'float': '_wilt_float',
+    'round': '_wilt_round',
+    'all': '_wilt_all',
+    'any': '_wilt_any',
+    'sum': '_wilt_sum',
+}
+
+_MATH_CALLS = {
+    'floor': '_wilt_floor',
+    'ceil': '_wilt_ceil',
+    'trunc': '_wilt_trunc',
+    'fabs': '_wilt_fabs',
+    'sqrt': '_wilt_sqrt',
+    'exp': '_wilt_exp',
+    'log': '_wilt_log',
+    'log2': '_wilt_log2',
+    'log10': '_wilt_log10',
+    'sin': '_wilt_sin',
+    'cos': '_wilt_cos',
+    'tan': '_wilt_tan',
+    'gcd': '_wilt_gcd',
+}
+
+_MATH_CONSTANTS = {'pi', 'e', 'tau'}
+
+
+class NotVectorizable(Exception):
+    """
+    Raised when a lambda uses constructs the vectorizer does not translate.
+    """
+
+
+def _truth(a):
+    a = np.asarray(a)
+    if a.dtype == bool:
+        return a
+    if a.dtype.kind not in 'iuf':
+        raise NotVectorizable(f"cannot take truth value of dtype {a.dtype}")
+    return a != 0
+
+
+def _num(a):
+    a = np.asarray(a)
+    if a.dtype == bool:
+        return a.astype(np.int64)
+    if a.dtype.kind not in 'iuf':
+        raise NotVectorizable(f"non-numeric operand of dtype {a.dtype}")
+    return a
+
+
+def _finite(a):
+    if a.dtype.kind == 'f' and not np.isfinite(a).all():
+        raise ValueError("cannot convert non-finite float to integer")
+    return a
+
+
+def _and(a, b):
+    return np.where(_truth(a), b, a)
+
+
+def _or(a, b):
+    return np.where(_truth(a), a, b)
+
+
+def _not(a):
+    return ~_truth(a)
+
+
+def _int(a):
+    a = _num(a)
+    if a.dtype.kind == 'f':
+        a = np.trunc(_finite(a))
+        if (np.abs(a) >= 2 ** 63).any():
+            raise NotVectorizable("integer conversion overflows int64")
+        return a.astype(np.int64)
+    return a
+
+
+def _float(a):
+    return _num(a).astype(np.float64)
+
+
+def _round(a, *ndigits):
+    if ndigits:
+        raise NotVectorizable("round() with ndigits")
+    return np.rint(_finite(_num(a).astype(np.float64)))
+
+
+def _reduce(ufunc, args):
+    if len(args) < 2:
+        raise NotVectorizable("reduction over a single iterable argument")
+    return ufunc.reduce(np.broadcast_arrays(*[_num(a) for a in args]))
+
+
+def _max(*args):
+    return _reduce(np.maximum, args)
+
+
+def _min(*args):
+    return _reduce(np.minimum, args)
+
+
+def _all(items):
+    result = True
+    for item in items:
+        result = np.logical_and(result, _truth(item))
+    return np.asarray(result)
+
+
+def _any(items):
+    result = False
+    for item in items:
+        result = np.logical_or(result, _truth(item))
+    return np.asarray(result)
+
+
+def _sum(items):
+    result = 0
+    for item in items:
+        result = result + _num(item)
+    return np.asarray(result)
+
+
+def _pow(a, b):
+    a, b = _num(a), _num(b)
+    if a.dtype.kind == 'f' or b.dtype.kind == 'f':
+        return a ** b
+    # Python ints never overflow, int64 wraps silently
+    result = a.astype(np.float64) ** b.astype(np.float64)
+    if (np.abs(result) >= 2 ** 53).any():
+        raise NotVectorizable("integer power exceeds exact float range")
+    if (b < 0).any():
+        return result
+    return result.astype(np.int64)
+
+
+def _floor_ceil_trunc(fn):
+    return lambda a: fn(_finite(_num(a).astype(np.float64)))
+
+
+def _gcd(a, b):
+    a, b = _num(a), _num(b)
+    if a.dtype.kind == 'f' or b.dtype.kind == 'f':
+        raise NotVectorizable("math.gcd() of floats")
+    return np.gcd(a, b)
+
+
+def _log(a, base=None):
+    a = _num(a).astype(np.float64)
+    if base is None:
+        return np.log(a)
+    return np.log(a) / np.log(_num(base).astype(np.float64))
+
+
+_HELPERS = {
+    '_wilt_and': _and,
+    '_wilt_or': _or,
+    '_wilt_not': _not,
+    '_wilt_num': _num,
+    '_wilt_pow': _pow,
+    '_wilt_abs': lambda a: np.abs(_num(a)),
+    '_wilt_max': _max,
+    '_wilt_min': _min,
+    '_wilt_int': _int,
+    '_wilt_float': _float,
+    '_wilt_round': _round,
+    '_wilt_all': _all,
+    '_wilt_any': _any,
+    '_wilt_sum': _sum,
+    '_wilt_floor': _floor_ceil_trunc(np.floor),
+    '_wilt_ceil': _floor_ceil_trunc(np.ceil),
+    '_wilt_trunc': _floor_ceil_trunc(np.trunc),
+    '_wilt_fabs': lambda a: np.abs(_float(a)),
+    '_wilt_sqrt': lambda a: np.sqrt(_float(a)),
+    '_wilt_exp': lambda a: np.exp(_float(a)),
+    '_wilt_log': _log,
+    '_wilt_log2': lambda a: np.log2(_float(a)),
+    '_wilt_log10': lambda a: np.log10(_float(a)),
+    '_wilt_sin': lambda a: np.sin(_float(a)),
+    '_wilt_cos': lambda a: np.cos(_float(a)),
+    '_wilt_tan': lambda a: np.tan(_float(a)),
+    '_wilt_gcd': _gcd,
+}
+
+
+def _call(name, args, node):
+    return ast.copy_location(
+        ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=args, keywords=[]),
+        node
+    )
+
+
+class _Vectorizer(ast.NodeTransformer):
+    """
+    Rewrites a lambda body into an expression that works on NumPy columns.
+    Only a whitelist of node types is accepted; anything else is rejected so
+    that the caller falls back to element-wise evaluation.
+    """
+
+    def __init__(self, bound_names):
+        self.bound_names = set(bound_names)
+
+    def generic_visit(self, node):
+        raise NotVectorizable(f"unsupported construct: {type(node).__name__}")
+
+    def visit_Expression(self, node):
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_Lambda(self, node):
+        args = node.args
+        if args.vararg or args.kwarg or args.kwonlyargs or args.defaults:
+            raise NotVectorizable("lambda with non-positional arguments")
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_Constant(self, node):
+        if type(node.value) not in (int, float, bool):
+            raise NotVectorizable(f"non-numeric constant {node.value!r}")
+        return node
+
+    def visit_Name(self, node):
+        if node.id not in self.bound_names:
+            raise NotVectorizable(f"free variable {node.id}")
+        return node
+
+    def visit_Attribute(self, node):
+        if isinstance(node.value, ast.Name) and node.value.id == 'math' and node.attr in _MATH_CONSTANTS:
+            return node
+        raise NotVectorizable("attribute access")
+
+    def visit_Tuple(self, node):
+        node.elts = [self.visit(e) for e in node.elts]
+        return node
+
+    visit_List = visit_Tuple
+
+    def visit_BoolOp(self, node):
+        helper = '_wilt_and' if isinstance(node.op, ast.And) else '_wilt_or'
+        values = [self.visit(v) for v in node.values]
+        result = values[-1]
+        for value in reversed(values[:-1]):
+            result = _call(helper, [value, result], node)
+        return result
+
+    def visit_UnaryOp(self, node):
+        operand = self.visit(node.operand)
+        if isinstance(node.op, ast.Not):
+            return _call('_wilt_not', [operand], node)
+        node.operand = _call('_wilt_num', [operand], node)
+        return node
+
+    def visit_BinOp(self, node):
+        if not isinstance(node.op, _ARITH_OPS + _BIT_OPS):
+            raise NotVectorizable(f"unsupported operator {type(node.op).__name__}")
+        left, right = self.visit(node.left), self.visit(node.right)
+        if isinstance(node.op, ast.Pow):
+            return _call('_wilt_pow', [left, right], node)
+        if isinstance(node.op, _ARITH_OPS):
+            # NumPy treats bool + bool as logical or, Python as integer addition
+            left, right = _call('_wilt_num', [left], node), _call('_wilt_num', [right], node)
+        node.left, node.right = left, right
+        return node
+
+    def visit_Compare(self, node):
+        if not all(isinstance(op, _CMP_OPS) for op in node.ops):
+            raise NotVectorizable("membership or identity comparison")
+        operands = [self.visit(node.left)] + [self.visit(c) for c in node.comparators]
+        pairs = [
+            ast.copy_location(ast.Compare(left=a, ops=[op], comparators=[b]), node)
+            for a, op, b in zip(operands, node.ops, operands[1:])
+        ]
+        result = pairs[-1]
+        for pair in reversed(pairs[:-1]):
+            result = _call('_wilt_and', [pair, result], node)
+        return result
+
+    def visit_Call(self, node):
+        if node.keywords:
+            raise NotVectorizable("keyword arguments")
+        func = node.func
+        if isinstance(func, ast.Name) and func.id in _BUILTIN_CALLS and func.id not in self.bound_names:
+            name = _BUILTIN_CALLS[func.id]
+        elif (isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name)
+              and func.value.id == 'math' and func.attr in _MATH_CALLS):
+            name = _MATH_CALLS[func.attr]
+        else:
+            raise NotVectorizable(f"call to {ast.dump(func)}")
+        return _call(name, [self.visit(a) for a in node.args], node)
+
+    def _visit_comprehension_expr(self, node):
+        outer = set(self.bound_names)
+        for gen in node.generators:
+            if gen.ifs or gen.is_async:
+                raise NotVectorizable("filtered comprehension")
+            gen.iter = self.visit(gen.iter)
+            for target in ast.walk(gen.target):
+                if isinstance(target, ast.Name):
+                    self.bound_names.add(target.id)
+                elif not isinstance(target, (ast.Tuple, ast.Store)):
+                    raise NotVectorizable("unsupported comprehension target")
+        node.elt = self.visit(node.elt)
+        self.bound_names = outer
+        return node
+
+    visit_GeneratorExp = _visit_comprehension_expr
+    visit_ListComp = _visit_comprehension_expr
+
+
+_SOURCES = weakref.WeakKeyDictionary()
+_COMPILED = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def remember_source(func, source):
+    """
+    Record the source of a lambda built with eval(), where inspect cannot see it.
+    """
+    with _lock:
+        _SOURCES[func] = source
+    return func
+
+
+def lambda_source(func):
+    """
+    Return the source text of a lambda, or None if it is not available.
+    """
+    with _lock:
+        source = _SOURCES.get(func)
+    if source is not None:
+        return source
+    try:
+        return inspect.getsource(func)
+    except (OSError, TypeError):
+        return None
+
+
+@functools.lru_cache(maxsize=32)
+def _parse_file(filename):
+    with open(filename, 'r') as f:
+        return ast.parse(f.read())
+
+
+def _find_lambda(func, source):
+    """
+    Locate the Lambda node matching func inside a source snippet. Source lines
+    from inspect.getsource may carry dict keys or trailing commas around the
+    lambda, so we fall back to parsing the whole defining file.
+    """
+    code = func.__code__
+    argnames = list(code.co_varnames[:code.co_argcount])
+
+    candidates = []
+    for text in (source.strip(), textwrap.dedent(source).strip().rstrip(',')):
+        try:
+            candidates.append(ast.parse(text, mode='eval'))
+            break
+        except SyntaxError:
+            continue
+    if not candidates:
+        try:
+            tree = _parse_file(inspect.getsourcefile(func))
+        except (OSError, TypeError, SyntaxError):
+            raise NotVectorizable("source could not be parsed")
+        candidates = [
+            node for node in ast.walk(tree)
+            if isinstance(node, ast.Lambda) and node.lineno == code.co_firstlineno
+        ]
+    else:
+        candidates = [node for node in ast.walk(candidates[0]) if isinstance(node, ast.Lambda)]
+
+    matches = [node for node in candidates if [a.arg for a in node.args.args] == argnames]
+    if len(matches) != 1:
+        raise NotVectorizable("lambda not uniquely identifiable in source")
+    return matches[0]
+
+
+def vectorize(func, source=None):
+    """
+    Compile a NumPy-column version of func. Raises NotVectorizable if the
+    lambda cannot be translated.
+    """
+    with _lock:
+        if func in _COMPILED:
+            compiled = _COMPILED[func]
+            if compiled is None:
+                raise NotVectorizable("previously rejected")
+            return compiled
+
+    try:
+        if func.__code__.co_freevars:
+            raise NotVectorizable("closures are not supported")
+        source = source or lambda_source(func)
+        if source is None:
+            raise NotVectorizable("no source available")
+        node = _find_lambda(func, source)
+        bound = [a.arg for a in node.args.args]
+        tree = ast.Expression(body=_Vectorizer(bound).visit(node))
+        ast.fix_missing_locations(tree)
+        namespace = dict(func.__globals__)
+        namespace.update(_HELPERS)
+        namespace.setdefault('math', math)
+        compiled = eval(compile(tree, '<vectorized>', 'eval'), namespace)
+    except NotVectorizable:
+        with _lock:
+            _COMPILED[func] = None
+        raise
+
+    with _lock:
+        _COMPILED[func] = compiled
+    return compiled
+
+
+def python_rows(columns):
+    """
+    Rebuild the Python tuples a rule would originally have been called with.
+    Integral values are passed as ints, as they were in the itertools grid.
+    """
+    stacked = np.column_stack(columns)
+    integral = np.mod(stacked, 1) == 0
+    return [
+        tuple(int(v) if is_int else float(v) for v, is_int in zip(row, flags))
+        for row, flags in zip(stacked.tolist(), integral.tolist())
+    ]
+
+
+def evaluate_scalar(func, rows, reference=None):
+    """
+    Call func on each row in order. Returns the values computed before the first
+    exception, and the exception (or None). If reference values are given,
+    stops right after the first row whose value differs from the reference.
+    """
+    if isinstance(reference, np.ndarray):
+        reference = reference.tolist()
+    values = []
+    for i, row in enumerate(rows):
+        try:
+            value = func(*row)
+        except Exception as e:
+            return values, e
+        values.append(value)
+        if reference is not None and i < len(reference) and reference[i] != value:
+            break
+    return values, None
+
+
+def evaluate_columns(func, columns, source=None):
+    """
+    Evaluate func over a probe set given as a list of column vectors. Returns
+    an array of results, or raises NotVectorizable if the vector path failed.
+    """
+    vec = vectorize(func, source)
+    n = len(columns[0])
+    try:
+        with np.errstate(all='raise', under='ignore'):
+            result = np.asarray(vec(*columns))
+    except NotVectorizable:
+        raise
+    except Exception as e:
+        raise NotVectorizable(f"vectorized evaluation failed: {e}")
+    if result.dtype.kind not in 'biuf' or result.ndim > 1:
+        raise NotVectorizable(f"unexpected result dtype {result.dtype}")
+    return np.broadcast_to(result, (n,))
+
+
+def evaluate(func, columns, source=None, rows=None, reference=None):
+    """
+    Evaluate func over the probe set, vectorized when possible. Returns
+    (values, error) where error is the first exception raised by the
+    element-wise fallback and values covers only the rows before it.
+
+    rows may be given as the tuples themselves or as a callable returning
+    them, so they are only built if the fallback is needed.
+    """
+    try:
+        return evaluate_columns(func, columns, source), None
+    except NotVectorizable:
+        pass
+    if rows is None:
+        rows = python_rows(columns)
+    elif callable(rows):
+        rows = rows()
+    values, error = evaluate_scalar(func, rows, reference)
+    return np.array(values, dtype=object), error
+
+
+def disagreement(rule_values, guess_values):
+    """
+    Element-wise rule != guess over the rows both sides evaluated, using
+    Python equality semantics.
+    """
+    n = min(len(rule_values), len(guess_values))
+    a, b = rule_values[:n], guess_values[:n]
+    if a.dtype == object or b.dtype == object:
+        return np.fromiter((x != y for x, y in zip(a.tolist(), b.tolist())), dtype=bool, count=n)
+    return np.asarray(a != b)
+
+
+def score(guessed_lambda, rule, columns, rows=None, guess_source=None,
+          rule_source=None, exhaustive=False):
+    """
+    Compare a guessed lambda against the hidden rule over the probe columns.
+
+    Returns (points, mask) where points is 1000 if they agree everywhere and 0
+    otherwise, and mask flags the probe rows on which they disagree. Exceptions
+    are re-raised only if they occur before the first disagreement, matching
+    the short-circuiting all() the harness used to run.
+
+    A guess that cannot be vectorized is called row by row and, unless
+    exhaustive is set, stops at its first disagreement, so its mask holds only
+    that row.
+    """
+    rule_values, rule_error = evaluate(rule, columns, rule_source, rows)
+    reference = None if exhaustive else rule_values
+    guess_values, guess_error = evaluate(guessed_lambda, columns, guess_source, rows, reference)
+
+    mask = np.zeros(len(columns[0]), dtype=bool)
+    checked = disagreement(rule_values, guess_values)
+    mask[:len(checked)] = checked
+
+    if not checked.any():
+        # The rule is called before the guess on each row, so it wins ties
+        error = rule_error if len(rule_values) <= len(guess_values) else guess_error
+        if error is not None:
+            raise error
+
+    return (0 if mask.any() else 1000), mask
@@ -0,0 +1,111 @@
+"""
+Size principle check for final guesses.
+
+A guess follows the size principle if the hypothesis it is closest to is also
+the smallest hypothesis still consistent with the observed tests. Closeness is
+the number of probe rows on which the guess agrees with a hypothesis, computed
+for every remaining hypothesis at once from their packed truth tables.
+"""
+
+import threading
+import weakref
+
+import numpy as np
+
+from harness import scoring
+from harness.truth_tables import get_truth_table, popcount
+
+_sizes = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def set_size(rule, tuple_length, inclusive_int_range=(1, 100)):
+    """
+    Number of integers n in the range with rule(n, ..., n) true, or None if the
+    rule raises on any of them.
+    """
+    key = (tuple_length, inclusive_int_range)
+    with _lock:
+        cached = _sizes.get(rule, {})
+        if key in cached:
+            return cached[key]
+
+    diagonal = np.arange(*inclusive_int_range, dtype=np.float64)
+    values, error = scoring.evaluate(rule, [diagonal] * tuple_length)
+    size = None
+    if error is None:
+        size = int(sum(bool(v) for v in values.tolist()))
+
+    with _lock:
+        _sizes.setdefault(rule, {})[key] = size
+    return size
+
+
+def guess_bits(guessed_lambda, corpus):
+    """
+    Packed masks of probe rows where the guess equals True and equals False.
+    Rows past an exception count as neither.
+    """
+    values, _ = scoring.evaluate(guessed_lambda, corpus.columns, rows=corpus.python_rows)
+    is_true = np.zeros(len(corpus), dtype=bool)
+    is_false = np.zeros(len(corpus), dtype=bool)
+    if values.dtype == object:
+        is_true[:len(values)] = [v == True for v in values.tolist()]
+        is_false[:len(values)] = [v == False for v in values.tolist()]
+    else:
+        is_true[:len(values)] = values == 1
+        is_false[:len(values)] = values == 0
+    return np.packbits(is_true), np.packbits(is_false)
+
+
+def agreement_counts(guessed_lambda, rules, corpus):
+    """
+    For each rule, the number of probe rows on which the guess agrees with it.
+    Rules with a truth table are scored together as one packed matrix operation.
+    """
+    true_bits, false_bits = guess_bits(guessed_lambda, corpus)
+    counts = np.zeros(len(rules), dtype=np.int64)
+
+    tables = [get_truth_table(rule, corpus) for rule in rules]
+    cached = [i for i, table in enumerate(tables) if table is not None]
+    if cached:
+        matrix = np.stack([tables[i].bits for i in cached])
+        counts[cached] = popcount(matrix & true_bits) + popcount(~matrix & false_bits)
+
+    uncached = [i for i, table in enumerate(tables) if table is None]
+    if uncached:
+        is_true = np.unpackbits(true_bits, count=len(corpus)).astype(bool)
+        is_false = np.unpackbits(false_bits, count=len(corpus)).astype(bool)
+        for i in uncached:
+            values, _ = scoring.evaluate(rules[i], corpus.columns, rows=corpus.python_rows)
+            truthy = np.array([v == True for v in values.tolist()], dtype=bool)
+            n = len(truthy)
+            counts[i] = (truthy & is_true[:n]).sum() + (~truthy & is_false[:n]).sum()
+    return counts
+
+
+def size_principle_points(guessed_lambda, rules, corpus):
+    """
+    1 if the hypothesis closest to the guess is the smallest remaining one.
+    """
+    if not rules:
+        return 0
+    counts = agreement_counts(guessed_lambda, rules, corpus)
+    sizes = [set_size(rule, corpus.tuple_length) for rule in rules]
+    sizes = np.array([np.inf if s is None else s for s in sizes])
+
+    closest_hyp = int(np.argmax(counts))
+    smallest_hyp = int(np.argmin(sizes))
+    return 1 if closest_hyp == smallest_hyp else 0
+
+
+def space_size_principle_points(guessed_lambda, space, indices):
+    """
+    size_principle_points for a hypothesis space that scores agreement and set
+    sizes itself, such as a GrammarSpace, given the surviving indices.
+    """
+    if len(indices) == 0:
+        return 0
+    counts = space.agreement_counts(guessed_lambda, indices)
+    sizes = space.set_sizes(indices)
+    return 1 if int(np.argmax(counts)) == int(np.argmin(sizes)) else 0
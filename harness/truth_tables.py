@@ -0,0 +1,170 @@
+"""
+On-disk cache of rule truth tables over the probe corpus.
+
+A truth table is the rule's boolean verdict on every probe row, packed eight
+rows to a byte. Tables are keyed by rule id, a hash of the rule source and the
+probe corpus version, built lazily the first time a rule is scored, and
+replaced whenever the rule source or the corpus changes. Scoring a guess then
+only needs the guess to be evaluated.
+"""
+
+import glob
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from harness import scoring
+from harness.probe_corpus import CACHE_DIR
+
+TRUTH_TABLE_DIR = os.path.join(CACHE_DIR, 'truth_tables')
+
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(packed, axis=-1):
+    """
+    Number of set bits in a uint8 array, summed along axis.
+    """
+    return POPCOUNT[packed].sum(axis=axis, dtype=np.int64)
+
+
+class TruthTable:
+    """
+    Packed boolean verdicts of one rule over a probe corpus.
+    """
+
+    def __init__(self, bits, size):
+        self.bits = bits
+        self.size = size
+        self._values = None
+
+    def unpack(self):
+        if self._values is None:
+            self._values = np.unpackbits(self.bits, count=self.size).astype(bool)
+        return self._values
+
+    def disagreement(self, values):
+        """
+        Rows where values differ from the table, with Python equality semantics.
+        """
+        if values.dtype == bool and len(values) == self.size:
+            diff = np.bitwise_xor(np.packbits(values), self.bits)
+            return np.unpackbits(diff, count=self.size).astype(bool)
+        return scoring.disagreement(self.unpack(), values)
+
+
+def rule_id(rule):
+    """
+    Stable identifier for a rule: where it is defined, or 'src' for rules
+    built from a source string.
+    """
+    code = rule.__code__
+    if code.co_filename.startswith('<'):
+        return 'src'
+    stem = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f'{stem}_{code.co_firstlineno}'
+
+
+def source_hash(source):
+    return hashlib.sha1(source.strip().encode('utf-8')).hexdigest()[:16]
+
+
+def build_truth_table(rule, corpus, source=None):
+    """
+    Evaluate rule over the corpus. Returns None if the rule raises anywhere or
+    returns something other than booleans, since those cannot be cached as bits.
+    """
+    values, error = scoring.evaluate(rule, corpus.columns, source, corpus.python_rows)
+    if error is not None:
+        return None
+    if values.dtype != bool:
+        if values.dtype == object and not all(type(v) is bool for v in values.tolist()):
+            return None
+        if values.dtype != object and not np.isin(values, (0, 1)).all():
+            return None
+        values = values == 1
+    return TruthTable(np.packbits(values), len(corpus))
+
+
+class TruthTableCache:
+    """
+    Process-wide cache of truth tables, backed by .npy files in cache_dir.
+    """
+
+    def __init__(self, cache_dir=TRUTH_TABLE_DIR):
+        self.cache_dir = cache_dir
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, '-'.join(key) + '.npy')
+
+    def get(self, rule, corpus, source=None):
+        """
+        Return the TruthTable for rule over corpus, or None if it is not cacheable.
+        """
+        source = source or scoring.lambda_source(rule)
+        if source is None:
+            return None
+        key = (rule_id(rule), source_hash(source), corpus.version)
+
+        with self._lock:
+            if key in self._tables:
+                return self._tables[key]
+
+        path = self._path(key)
+        if os.path.exists(path):
+            table = TruthTable(np.load(path), len(corpus))
+        else:
+            table = build_truth_table(rule, corpus, source)
+            if table is not None:
+                self._save(key, table)
+
+        with self._lock:
+            self._tables[key] = table
+        return table
+
+    def _save(self, key, table):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        if key[0] != 'src':
+            # Tables for an older source or corpus of the same rule are stale
+            for stale in glob.glob(os.path.join(self.cache_dir, f'{key[0]}-*.npy')):
+                if stale != path:
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, table.bits)
+        os.replace(tmp_path, path)
+
+
+_cache = TruthTableCache()
+
+
+def get_truth_table(rule, corpus, source=None):
+    return _cache.get(rule, corpus, source)
+
+
+def score(guessed_lambda, table, corpus, guess_source=None, exhaustive=False):
+    """
+    Same contract as scoring.score, with the hidden rule replaced by its
+    precomputed truth table.
+    """
+    reference = None if exhaustive else table.unpack()
+    guess_values, guess_error = scoring.evaluate(
+        guessed_lambda, corpus.columns, guess_source, corpus.python_rows, reference
+    )
+
+    mask = np.zeros(len(corpus), dtype=bool)
+    checked = table.disagreement(guess_values)
+    mask[:len(checked)] = checked
+
+    if guess_error is not None and not checked.any():
+        raise guess_error
+
+    return (0 if mask.any() else 1000), mask
@@ -1,14 +1,24 @@
-import openai
-import pydantic
-import os
+from functools import lru_cache
 from typing import Literal
 
-class LLMJudgment(pydantic.BaseModel):
-    reasoning: str
-    judgment: Literal["Correct",
-                      "Missing Edge Case",
-                      "Near-Miss Magnitudes",
-                      "Completely Different"]
+from harness.integer_domain import membership
+
+@lru_cache(maxsize=None)
+def judgment_format():
+    """
+    Structured output schema for judge; pydantic is only needed once a guess
+    is judged.
+    """
+    import pydantic
+
+    class LLMJudgment(pydantic.BaseModel):
+        reasoning: str
+        judgment: Literal["Correct",
+                          "Missing Edge Case",
+                          "Near-Miss Magnitudes",
+                          "Completely Different"]
+
+    return LLMJudgment
 
 class HarnessUtils:
     @staticmethod
@@ -16,8 +26,13 @@ class HarnessUtils:
         """
         NOTE(thwu): Only use this for rules that check for set membership
         """
-        set_size = 0
         num_args = rule.__code__.co_argcount
+        mask = membership(rule, num_args, (inclusive_int_range[0], inclusive_int_range[1] - 1))
+        if mask is not None:
+            return int(mask.sum())
+
+        # Not a clean boolean membership test, so call it the slow way
+        set_size = 0
         for i in range(inclusive_int_range[0], inclusive_int_range[1]):
             if num_args == 1:
                 if rule(i):
@@ -39,8 +54,8 @@ class HarnessUtils:
         """
         NOTE(Eryk): used to score responses for near-misses
         """
-        openai.api_key = os.environ["OPENAI_API_KEY"]
-        client = openai.OpenAI()
+        from models.clients import get_openai_client
+        client = get_openai_client('openai')
 
         with open('./prompts/judge_prompt.txt', 'r') as f:
             system_prompt = f.read()
@@ -51,7 +66,7 @@ class HarnessUtils:
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": f"First function: {gt}\n\nSecond function: {guess}"}
             ],
-            response_format=LLMJudgment
+            response_format=judgment_format()
         )
 
         return response.choices[0].message.parsed.judgment
@@ -1,21 +1,28 @@
 import argparse
 import json
 import re
-import threading
-from concurrent.futures import ThreadPoolExecutor
+import asyncio
 
 import numpy as np
 
 from harness.llm_reasoning_harness import LLMReasoningHarness
+from harness.lockstep import run_lockstep
 from harness.test_cases import TESTS_LITE, TESTS_FULL, TESTS_BAYESIAN, TESTS_BAYESIAN_SINGLE
+from models.actions import PROTOCOLS, TEXT_PROTOCOL, TOOLS_PROTOCOL, action_tools
+from models.batch import BATCH_POLL, set_batch_poll
+from models.concurrency import AIMDController
+from models.deadlines import TEST_BUDGET, TURN_TIMEOUT, set_timeouts
+from models.executor import run_cpu, run_sync, set_sync_workers
+from models.hedging import MAX_HEDGE_RATE, hedging_summary, set_hedging
 from models.model_factory import ModelFactory
+from models.rate_limiter import RATE_LIMITS_PATH, load_rate_limits
 from utils.checkpoint import load_checkpoint, save_checkpoint
 from utils.metrics import get_novelty_scores
 from utils.result_handler import dump_results
 
 
 def run_test(model, test_idx, tuple_length, test_rule, sleep=0,
-            use_bayesian=False, old_context=None):
+            use_bayesian=False, old_context=None, hypothesis_space='library'):
     print(f"Running test {test_idx}")
     print(f"Tuple length is {tuple_length}")
     harness = LLMReasoningHarness(
@@ -23,10 +30,34 @@ def run_test(model, test_idx, tuple_length, test_rule, sleep=0,
         rule_lambda=test_rule,
         tuple_length=tuple_length,
         use_bayesian=use_bayesian,
-        old_context=old_context
+        old_context=old_context,
+        hypothesis_space=hypothesis_space
     )
     test_success = harness.interact_with_llm(sleep=sleep)
+    return test_result(test_idx, harness, test_success)
 
+
+async def run_test_async(model, test_idx, tuple_length, test_rule, sleep=0,
+                         use_bayesian=False, old_context=None, hypothesis_space='library'):
+    print(f"Running test {test_idx}")
+    print(f"Tuple length is {tuple_length}")
+    # Building the hypothesis space and truth tables is CPU-bound, so keep it
+    # off the event loop
+    harness = await run_cpu(
+        LLMReasoningHarness,
+        model=model,
+        rule_lambda=test_rule,
+        tuple_length=tuple_length,
+        use_bayesian=use_bayesian,
+        old_context=old_context,
+        hypothesis_space=hypothesis_space
+    )
+    test_success = await harness.interact_with_llm_async(sleep=sleep)
+    # Novelty scoring calls the embeddings API synchronously
+    return await run_sync(test_result, test_idx, harness, test_success)
+
+
+def test_result(test_idx, harness, test_success):
     return {
         'test_index': test_idx,
         'conversation_history': harness.conversation_history,
@@ -35,11 +66,21 @@ def run_test(model, test_idx, tuple_length, test_rule, sleep=0,
         'guesses': test_success.get('guesses', 0),
         'repeats': test_success.get('reused tests', 0),
         'confirms bias': 1,  # Placeholder value
-        'novelty': get_novelty_scores(harness.conversation_history)
+        'novelty': get_novelty_scores(harness.conversation_history),
+        'query_efficiency': test_success.get('query_efficiency', []),
+        'turn_timeouts': test_success.get('turn_timeouts', 0),
+        'timed_out': test_success.get('timed_out', False),
+        'action_protocol': test_success.get('action_protocol', TEXT_PROTOCOL),
+        'input_tokens': test_success.get('input_tokens', []),
+        'cached_tokens': test_success.get('cached_tokens', []),
+        'session': test_success.get('session'),
+        'probe_corpus_version': test_success.get('probe_corpus_version')
     }
 
 
-def main(model_name, multi, split, resume, sleep=0, single=None):
+def main(model_name, multi, split, resume, sleep=0, single=None, hypothesis_space='library',
+         sync_workers=None, adaptive=False, stream=False, action_protocol=TEXT_PROTOCOL,
+         sessions=False, batch=False):
     select_split = {
         'lite': TESTS_LITE,
         'full': TESTS_FULL,
@@ -51,7 +92,35 @@ def main(model_name, multi, split, resume, sleep=0, single=None):
     if TESTS is None:
         raise ValueError(f"Invalid split name: {split}")
 
+    if sync_workers is not None:
+        set_sync_workers(sync_workers)
     model = ModelFactory.create_model(model_name)
+    if stream:
+        if model.supports_streaming:
+            model.stream = True
+        else:
+            print(f"{type(model).__name__} does not support streaming, waiting for full replies")
+    if action_protocol == TOOLS_PROTOCOL:
+        if model.supports_tools:
+            model.actions = action_tools(1 if split == "bayesian_single" else 3,
+                                         integers=split in ['bayesian', 'bayesian_single'])
+        else:
+            print(f"{type(model).__name__} does not support tool calls, using the text protocol")
+    if sessions:
+        if not model.supports_sessions:
+            print(f"{type(model).__name__} does not support sessions, resending the full conversation")
+        elif model.stream or model.actions:
+            print("Sessions don't combine with --stream or tool calls, resending the full conversation")
+        else:
+            model.sessions = True
+    if batch:
+        if not model.supports_batch:
+            print(f"{type(model).__name__} has no batch API, running tests interactively")
+            batch = False
+        elif model.stream or model.sessions:
+            print("Batch requests are sent whole, ignoring --stream and --stateful")
+            model.stream = False
+            model.sessions = False
     checkpoint = load_checkpoint(model_name, split=split)
 
     use_bayesian = split in ['bayesian', 'bayesian_single']
@@ -73,7 +142,8 @@ def main(model_name, multi, split, resume, sleep=0, single=None):
             tuple_length=3,
             test_rule=TESTS[str(single)],
             sleep=sleep,
-            use_bayesian=False
+            use_bayesian=False,
+            hypothesis_space=hypothesis_space
         )
 
         full_context[single - 1] = fixed_run
@@ -108,6 +178,8 @@ def main(model_name, multi, split, resume, sleep=0, single=None):
         attempts = checkpoint.get('attempts', [])
         novelty_scores = checkpoint.get('novelty_scores', [])
         full_context = checkpoint.get('full_context', [])
+        active_states = {int(k): v for k, v in checkpoint.get('active', {}).items()}
+        pending_batch = checkpoint.get('pending_batch')
     else:
         current_test_idx = 1
         correct_answers = 0
@@ -117,59 +189,122 @@ def main(model_name, multi, split, resume, sleep=0, single=None):
         attempts = []
         novelty_scores = []
         full_context = []
+        active_states = {}
+        pending_batch = None
 
     num_tests = len(TESTS)
-    lock = threading.Lock()
+    if active_states and not batch:
+        print(f"Checkpoint has {len(active_states)} unfinished tests from a --batch run; "
+              "resume with --batch to finish them")
 
     def process_result(result):
         nonlocal correct_answers, total_answers, total_repeats, points, \
             attempts, novelty_scores, full_context
-        with lock:
-            if result['points'] >= 1000:
-                correct_answers += 1
-            points += result['points']
-            total_answers += 1
-            total_repeats += result['repeats']
-            attempts.append(result['guesses'])
-            novelty_scores.append(result['novelty'])
-            full_context.append(result)
-            save_checkpoint(
-                model_name,
-                current_test_idx=result['test_index'] + 1,
-                correct_answers=correct_answers,
-                total_answers=total_answers,
-                total_repeats=total_repeats,
-                points=points,
-                attempts=attempts,
-                novelty_scores=novelty_scores,
-                full_context=full_context,
-                split=split
-            )
+        # Called from the event loop only, so no locking is needed
+        if result['points'] >= 1000:
+            correct_answers += 1
+        points += result['points']
+        total_answers += 1
+        total_repeats += result['repeats']
+        attempts.append(result['guesses'])
+        novelty_scores.append(result['novelty'])
+        full_context.append(result)
+
+    def progress(current_test_idx):
+        # Copies of the lists, so a save on a worker thread isn't affected
+        # by results the event loop records meanwhile
+        return dict(
+            current_test_idx=current_test_idx,
+            correct_answers=correct_answers,
+            total_answers=total_answers,
+            total_repeats=total_repeats,
+            points=points,
+            attempts=list(attempts),
+            novelty_scores=list(novelty_scores),
+            full_context=list(full_context),
+            split=split
+        )
 
-    with ThreadPoolExecutor(max_workers=multi) as executor:
-        futures = []
+    # With --adaptive, `multi` is the ceiling and the controller finds the
+    # sustainable number of conversations; otherwise it is a fixed limit
+    if adaptive:
+        controller = AIMDController(initial=min(4, multi), maximum=multi)
+    else:
+        controller = AIMDController(initial=multi, minimum=multi, maximum=multi)
+    model.controller = controller
+
+    # Saves run one at a time, so an older checkpoint never overwrites a newer one
+    checkpoint_lock = asyncio.Lock()
+
+    async def run_one(test_idx, tuple_len, test_rule):
+        await controller.acquire()
+        try:
+            result = await run_test_async(
+                model,
+                test_idx,
+                tuple_length=tuple_len,
+                test_rule=test_rule,
+                sleep=sleep,
+                use_bayesian=use_bayesian,
+                hypothesis_space=hypothesis_space
+            )
+        finally:
+            await controller.release()
+        process_result(result)
+        async with checkpoint_lock:
+            await run_sync(save_checkpoint, model_name, **progress(result['test_index'] + 1))
+
+    async def run_all():
+        tasks = []
         for test_idx in range(current_test_idx, num_tests + 1):
             tuple_len = 1 if split == "bayesian_single" else 3
             test_rule = TESTS.get(str(test_idx))
             if not test_rule:
                 print(f"No test rule found for test index {test_idx}. Skipping.")
                 continue
+            tasks.append(run_one(test_idx, tuple_len, test_rule))
+        await asyncio.gather(*tasks)
 
-            future = executor.submit(
-                run_test,
-                model,
-                test_idx,
+    def batch_harnesses():
+        harnesses = {}
+        tuple_len = 1 if split == "bayesian_single" else 3
+        for test_idx in sorted(active_states) + list(range(current_test_idx, num_tests + 1)):
+            test_rule = TESTS.get(str(test_idx))
+            if not test_rule:
+                print(f"No test rule found for test index {test_idx}. Skipping.")
+                continue
+            harness = LLMReasoningHarness(
+                model=model,
+                rule_lambda=test_rule,
                 tuple_length=tuple_len,
-                test_rule=test_rule,
-                sleep=sleep,
-                use_bayesian=use_bayesian
+                use_bayesian=use_bayesian,
+                hypothesis_space=hypothesis_space
             )
-            future.add_done_callback(lambda f: process_result(f.result()))
-            futures.append(future)
+            if test_idx in active_states:
+                harness.restore_state(active_states[test_idx])
+            harnesses[test_idx] = harness
+        return harnesses
+
+    def batch_result(test_idx, harness, outcome):
+        process_result(test_result(test_idx, harness, outcome))
+
+    def batch_checkpoint(active, pending):
+        # Every test has started, so resuming only finishes the active ones
+        save_checkpoint(
+            model_name,
+            **progress(num_tests + 1),
+            active={str(test_idx): harness.checkpoint_state() for test_idx, harness in active.items()},
+            pending_batch=pending
+        )
 
-        # Wait for all futures to complete
-        for future in futures:
-            future.result()
+    if batch:
+        # Local models generate their batches in process, so those don't
+        # survive a restart and are simply run again
+        if model.provider is None:
+            pending_batch = None
+        run_lockstep(model, batch_harnesses(), batch_result, batch_checkpoint, pending_batch)
+    else:
+        asyncio.run(run_all())
 
     acc = correct_answers / total_answers if total_answers > 0 else 0.0
     avg_guesses = np.mean(attempts) if attempts else 0.0
@@ -182,8 +317,30 @@ def main(model_name, multi, split, resume, sleep=0, single=None):
     print(f"Average Minimum Novelty = {np.mean(min_novelties):.2f}" if min_novelties else "Average Minimum Novelty = N/A")
     print(f"Total Repeated Tests = {total_repeats}")
     print(f"Total Points = {points}")
-
-    dump_results(model_name, acc, avg_guesses, points, full_context, split)
+    efficiencies = [e for r in full_context for e in r.get('query_efficiency', []) if e is not None]
+    concurrency = controller.summary()
+    print(f"Concurrency: current {concurrency['current_concurrency']}, peak {concurrency['peak_concurrency']} "
+          f"({concurrency['rate_limit_signals']} rate limit, {concurrency['timeout_signals']} timeout signals)")
+    print(f"Average Query Efficiency = {np.mean(efficiencies):.2f}" if efficiencies else "Average Query Efficiency = N/A")
+    print(f"Timeouts: {sum(r.get('turn_timeouts', 0) for r in full_context)} turns, "
+          f"{sum(1 for r in full_context if r.get('timed_out'))} tests out of time")
+    input_tokens = sum(t or 0 for r in full_context for t in r.get('input_tokens', []))
+    cached_tokens = sum(t or 0 for r in full_context for t in r.get('cached_tokens', []))
+    print(f"Prompt Cache: {cached_tokens} / {input_tokens} input tokens cached"
+          + (f" ({cached_tokens / input_tokens:.1%})" if input_tokens else ""))
+    session_stats = [r['session'] for r in full_context if r.get('session')]
+    if session_stats:
+        print(f"Sessions: {sum(s['delta_turns'] for s in session_stats)} turns sent only the newest message, "
+              f"{sum(s['full_turns'] for s in session_stats)} full resends, "
+              f"{sum(s['resets'] for s in session_stats)} sessions lost")
+    hedging = hedging_summary()
+    for key, stats in hedging.items():
+        print(f"Hedging {key}: {stats['hedges']} / {stats['calls']} calls hedged "
+              f"({stats['hedge_rate']:.1%}), {stats['hedge_wins']} hedges won")
+
+    run_metrics = {'action_protocol': model.action_protocol, 'batch': batch, 'concurrency': concurrency,
+                   'hedging': hedging}
+    dump_results(model_name, acc, avg_guesses, points, full_context, split, run_metrics)
 
 
 def testswap_test(model_name, swap, sleep=0):
@@ -256,7 +413,8 @@ def testswap_test(model_name, swap, sleep=0):
             'guesses': 0,
             'repeats': 0,
             'confirms bias': 1,
-            'novelty': [1.0]
+            'novelty': [1.0],
+            'probe_corpus_version': test_success.get('probe_corpus_version')
         }
 
         if result['points'] >= 1000:
@@ -300,13 +458,53 @@ if __name__ == '__main__':
     parser.add_argument('--resume', action='store_true',
                         help='Resume from checkpoint')
     parser.add_argument('--sleep', type=float, default=0.0,
-                        help='Sleep timer between calls')
+                        help='Sleep timer between calls (prefer --rate-limits)')
+    parser.add_argument('--rate-limits', type=str, default=RATE_LIMITS_PATH,
+                        help='JSON file of per-provider/model rpm and tpm limits')
     parser.add_argument('--single', type=int, default=None,
                         help='Finish a single test if interrupted')
     parser.add_argument('--swap', type=str, default=None,
                         help='If set, load test cases from another model for each test')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Tune the number of parallel tests up to --multi from rate limits and latency')
+    parser.add_argument('--sync-workers', type=int, default=None,
+                        help='Threads for model adapters without an async client')
+    parser.add_argument('--turn-timeout', type=float, default=TURN_TIMEOUT,
+                        help='Seconds allowed per model call attempt (0 disables)')
+    parser.add_argument('--test-budget', type=float, default=None,
+                        help=f'Wall-clock seconds allowed per test (default {TEST_BUDGET}, 0 disables; '
+                             'not available with --batch)')
+    parser.add_argument('--hedge', type=float, default=None,
+                        help='Send a second request when a call is slower than this latency percentile (e.g. 95)')
+    parser.add_argument('--max-hedge-rate', type=float, default=MAX_HEDGE_RATE,
+                        help='Largest fraction of calls that may be hedged')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream replies and stop generating once the test case or final guess is complete')
+    parser.add_argument('--action-protocol', type=str, default=TEXT_PROTOCOL, choices=PROTOCOLS,
+                        help='How the model submits test cases and guesses: fenced text or tool calls')
+    parser.add_argument('--stateful', action='store_true',
+                        help='Keep a provider session per test and send only the newest message each turn')
+    parser.add_argument('--batch', action='store_true',
+                        help='Run all tests in lockstep through the provider batch API (OpenAI, Anthropic) '
+                             'or batched local generation (hf: models)')
+    parser.add_argument('--batch-poll', type=float, default=BATCH_POLL,
+                        help='Seconds between status checks of a submitted batch')
+    parser.add_argument('--hypothesis-space', type=str, default='library', choices=['library', 'grammar'],
+                        help='Hypothesis space to track exploration against')
 
     args = parser.parse_args()
+    # A batch can take up to a day per round, so per-test wall-clock budgets
+    # don't apply to lockstep runs
+    if args.batch and args.test_budget is not None:
+        parser.error("--test-budget can't be combined with --batch")
+    if args.batch:
+        test_budget = 0
+    else:
+        test_budget = TEST_BUDGET if args.test_budget is None else args.test_budget
+    load_rate_limits(args.rate_limits)
+    set_timeouts(args.turn_timeout, test_budget)
+    set_hedging(args.hedge, args.max_hedge_rate)
+    set_batch_poll(args.batch_poll)
 
     if args.swap is None:
         main(
@@ -315,7 +513,14 @@ if __name__ == '__main__':
             split=args.split,
             resume=args.resume,
             sleep=args.sleep,
-            single=args.single
+            single=args.single,
+            hypothesis_space=args.hypothesis_space,
+            sync_workers=args.sync_workers,
+            adaptive=args.adaptive,
+            stream=args.stream,
+            action_protocol=args.action_protocol,
+            sessions=args.stateful,
+            batch=args.batch
         )
     else:
         testswap_test(
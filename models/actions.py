@@ -0,0 +1,94 @@
+"""
+Tool-call action protocol.
+
+Instead of parsing "Test Case: ```...```" out of free text, the model is
+given test_case and final_guess tools to call, with its reasoning as a tool
+argument. Adapters that support tools pass the definitions below in their
+provider's format and turn the call back into the canonical text block, so
+the harness, the conversation history and the saved results look the same
+under both protocols. Tool use is left to the model's choice: forcing a
+call would make it skip the free-text reasoning the prompt asks for, and a
+reply without a call is parsed as text, as under the text protocol.
+"""
+
+import json
+
+TEXT_PROTOCOL = 'text'
+TOOLS_PROTOCOL = 'tools'
+PROTOCOLS = [TEXT_PROTOCOL, TOOLS_PROTOCOL]
+
+
+def action_tools(tuple_length, integers=False):
+    """
+    Provider-neutral definitions of the two actions: name, description and
+    JSON schema of the arguments.
+    """
+    reasoning = {'type': 'string', 'description': 'Your reasoning about the rule so far and why you chose this action.'}
+    number = {'type': 'integer'} if integers else {'type': 'number'}
+    return [
+        {
+            'name': 'test_case',
+            'description': f'Ask whether a tuple of {tuple_length} numbers satisfies the hidden rule.',
+            'parameters': {
+                'type': 'object',
+                'properties': {
+                    'reasoning': reasoning,
+                    'inputs': {'type': 'array', 'items': number, 'minItems': tuple_length, 'maxItems': tuple_length}
+                },
+                'required': ['reasoning', 'inputs']
+            }
+        },
+        {
+            'name': 'final_guess',
+            'description': 'Give your final answer as a Python lambda, e.g. "lambda x, y, z: x < y < z". Ends the game.',
+            'parameters': {
+                'type': 'object',
+                'properties': {
+                    'reasoning': reasoning,
+                    'guess': {'type': 'string', 'description': 'The rule as a Python lambda expression.'}
+                },
+                'required': ['reasoning', 'guess']
+            }
+        }
+    ]
+
+
+def openai_tools(tools):
+    return [{'type': 'function', 'function': tool} for tool in tools]
+
+
+def anthropic_tools(tools):
+    return [{'name': t['name'], 'description': t['description'], 'input_schema': t['parameters']} for t in tools]
+
+
+def bedrock_tools(tools):
+    return [{'toolSpec': {'name': t['name'], 'description': t['description'],
+                          'inputSchema': {'json': t['parameters']}}} for t in tools]
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def action_text(name, arguments, text=""):
+    """
+    The reply a text-protocol model would have written for this tool call:
+    any free text, the reasoning, then the action block. arguments is a dict
+    or a JSON string; if it can't be read the action block is left out and
+    the harness treats the reply like any malformed one.
+    """
+    if isinstance(arguments, str):
+        try:
+            arguments = json.loads(arguments)
+        except ValueError:
+            arguments = {}
+    if not isinstance(arguments, dict):
+        arguments = {}
+    lines = [part for part in (text.strip(), str(arguments.get('reasoning', '')).strip()) if part]
+    if name == 'test_case' and isinstance(arguments.get('inputs'), list):
+        lines.append(f"Test Case: ```({', '.join(_number(v) for v in arguments['inputs'])})```")
+    elif name == 'final_guess' and arguments.get('guess'):
+        lines.append(f"Final Guess: ```{arguments['guess']}```")
+    return "\n".join(lines)
@@ -1,28 +1,118 @@
-from .base_model import BaseModel
-from anthropic import Anthropic
+from .actions import action_text, anthropic_tools
+from .base_model import BaseModel, ModelResponse
+from .batch import batch_error, missing_results, wait_for_batch
+from .deadlines import get_turn_timeout
+from .prompt_cache import anthropic_messages, anthropic_system, anthropic_usage
+from .retry import PERMANENT, TRANSIENT
+from .streaming import collect_stream, collect_stream_async
+from anthropic import Anthropic, AsyncAnthropic
 import os
 
 class AnthropicModel(BaseModel):
+    provider = "anthropic"
+    supports_streaming = True
+    supports_tools = True
+    supports_batch = True
+
     def __init__(self, model_name):
         super().__init__(model_name)
         anthropic_api_key = os.environ["ANTHROPIC_API_KEY"]
-        self.client = Anthropic(api_key=anthropic_api_key)
+        self.client = Anthropic(api_key=anthropic_api_key, timeout=get_turn_timeout(), max_retries=0)
+        self.async_client = AsyncAnthropic(api_key=anthropic_api_key, timeout=get_turn_timeout(), max_retries=0)
         
         with open('./prompts/instruction.txt', 'r') as f:
             self.system_prompt = f.read()        
 
-    def perform_step(self, conversation_history):
-        try:
-            response = self.client.messages.create(
-                model=self.model_name,
-                max_tokens=1024,
-                system=self.system_prompt,
-                messages=conversation_history,
-            )
-            return response.content[0].text
-        except Exception as e:
-            print(f"Error in AnthropicModel: {e}")
-            return ""
+    def _delta(self, event):
+        """
+        Text or usage carried by one stream event, if any.
+        """
+        if event.type == "message_start":
+            input_tokens, _, cached_tokens = anthropic_usage(event.message.usage)
+            return ModelResponse("", input_tokens, cached_tokens=cached_tokens)
+        if event.type == "content_block_delta" and event.delta.type == "text_delta":
+            return event.delta.text
+        if event.type == "message_delta":
+            return ModelResponse("", output_tokens=event.usage.output_tokens)
+        return None
+
+    def _deltas(self, stream):
+        for event in stream:
+            delta = self._delta(event)
+            if delta is not None:
+                yield delta
+
+    async def _deltas_async(self, stream):
+        async for event in stream:
+            delta = self._delta(event)
+            if delta is not None:
+                yield delta
+
+    def _request(self, conversation_history, stream=False):
+        """
+        Arguments for messages.create, with cache breakpoints on the system
+        prompt and the newest message.
+        """
+        request = {
+            'model': self.model_name,
+            'max_tokens': 1024,
+            'system': anthropic_system(self.system_prompt),
+            'messages': anthropic_messages(conversation_history),
+        }
+        if stream:
+            request['stream'] = True
+        elif self.actions:
+            request['tools'] = anthropic_tools(self.actions)
+            request['tool_choice'] = {'type': 'auto'}
+        return request
+
+    def _response(self, response):
+        text = "".join(block.text for block in response.content if block.type == "text")
+        for block in response.content:
+            if block.type == "tool_use":
+                text = action_text(block.name, block.input, text)
+                break
+        input_tokens, output_tokens, cached_tokens = anthropic_usage(response.usage)
+        return ModelResponse(text, input_tokens, output_tokens, cached_tokens=cached_tokens)
+
+    def _perform_step(self, conversation_history):
+        if self.stream and not self.actions:
+            stream = self.client.messages.create(**self._request(conversation_history, stream=True))
+            with stream:
+                return collect_stream(self._deltas(stream))
+        response = self.client.messages.create(**self._request(conversation_history))
+        return self._response(response)
+
+    async def _perform_step_async(self, conversation_history):
+        if self.stream and not self.actions:
+            stream = await self.async_client.messages.create(**self._request(conversation_history, stream=True))
+            async with stream:
+                return await collect_stream_async(self._deltas_async(stream))
+        response = await self.async_client.messages.create(**self._request(conversation_history))
+        return self._response(response)
+
+    def submit_batch(self, requests):
+        batch = self.client.messages.batches.create(
+            requests=[{'custom_id': custom_id, 'params': self._request(conversation_history)}
+                      for custom_id, conversation_history in requests.items()])
+        return batch.id
+
+    def collect_batch(self, batch_id, custom_ids):
+        wait_for_batch(self.client.messages.batches.retrieve, batch_id,
+                       lambda b: b.processing_status == "ended", lambda b: b.processing_status)
+        results = {}
+        for entry in self.client.messages.batches.results(batch_id):
+            result = entry.result
+            if result.type == "succeeded":
+                results[entry.custom_id] = self._response(result.message)
+            elif result.type == "errored":
+                error_type = getattr(getattr(result.error, 'error', None), 'type', None)
+                kind = PERMANENT if error_type == "invalid_request_error" else TRANSIENT
+                results[entry.custom_id] = batch_error(entry.custom_id, result.error, kind)
+            else:
+                # Canceled or expired before it ran
+                results[entry.custom_id] = batch_error(entry.custom_id, result.type)
+        return missing_results(custom_ids, results)
 
     def initialize_conversation(self, system_prompt=None):
         if system_prompt:
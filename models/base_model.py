@@ -1,13 +1,316 @@
+import asyncio
+import time
 from abc import ABC, abstractmethod
 
+from .deadlines import DeadlineExceeded, attempt_timeout, call_with_timeout, remaining
+from .actions import TEXT_PROTOCOL, TOOLS_PROTOCOL
+from .executor import run_sync
+from .hedging import get_hedger, hedged_call, hedged_call_async
+from .rate_limiter import estimate_tokens, get_rate_limiter
+from .retry import PERMANENT, TIMEOUT, RetryPolicy, classify_error, get_circuit_breaker
+from .sessions import Session
+
+
+class ModelResponse(str):
+    """
+    Reply text, carrying the token usage the provider reported when known;
+    cached_tokens is the part of the prompt served from the provider's
+    prompt cache. An empty reply after a failed call carries the error kind instead, and a
+    streamed reply cut off after its action block is marked stopped_early.
+    """
+
+    def __new__(cls, text, input_tokens=None, output_tokens=None, error=None, stopped_early=False,
+                cached_tokens=None):
+        response = super().__new__(cls, text or "")
+        response.input_tokens = input_tokens
+        response.output_tokens = output_tokens
+        response.cached_tokens = cached_tokens
+        response.error = error
+        response.stopped_early = stopped_early
+        return response
+
+    @property
+    def total_tokens(self):
+        if self.input_tokens is None and self.output_tokens is None:
+            return None
+        return (self.input_tokens or 0) + (self.output_tokens or 0)
+
+
 class BaseModel(ABC):
+    # Rate limit key; adapters for hosted APIs set this
+    provider = None
+    # Adapters that can stream replies and stop after the action block
+    supports_streaming = False
+    # Adapters that can offer the actions as tool calls
+    supports_tools = False
+    # Adapters that can keep per-test state and send only the newest message
+    supports_sessions = False
+    # Adapters that can submit many requests through a provider batch API
+    supports_batch = False
+
     def __init__(self, model_name):
         self.model_name = model_name
+        # Optional AIMDController fed with call latencies and errors
+        self.controller = None
+        self.retry_policy = RetryPolicy()
+        # Stream replies and stop at the first complete action block
+        self.stream = False
+        # Tool definitions from actions.action_tools when using the tool
+        # protocol, else None
+        self.actions = None
+        # Keep a session per test when the adapter supports it
+        self.sessions = False
+
+    @property
+    def action_protocol(self):
+        return TOOLS_PROTOCOL if self.actions else TEXT_PROTOCOL
+
+    @property
+    def rate_limiter(self):
+        if self.provider is None:
+            return None
+        return get_rate_limiter(self.provider, self.model_name)
+
+    @property
+    def circuit_breaker(self):
+        if self.provider is None:
+            return None
+        return get_circuit_breaker(self.provider)
+
+    @property
+    def hedger(self):
+        return get_hedger(self.provider, self.model_name)
+
+    def _hedge_reserve(self, estimate):
+        """
+        Hedges only go out if the rate limiter can take them without waiting.
+        """
+        limiter = self.rate_limiter
+        if limiter is None:
+            return None
+        return lambda: limiter.try_acquire(estimate)
+
+    def new_session(self):
+        """
+        A Session for one test when session mode is on and the adapter
+        supports it, else None.
+        """
+        if self.sessions and self.supports_sessions:
+            return Session()
+        return None
+
+    def perform_step(self, conversation_history, deadline=None, session=None):
+        """
+        Get the model's next reply, within the provider's rate limits, retrying
+        failures that are not permanent until deadline (a time.monotonic()
+        value). Slow calls are hedged when hedging is on. With a session only
+        the newest message is sent when the session's state allows it.
+        Returns an empty ModelResponse with the error kind once retries or
+        time run out.
+        """
+        estimate = estimate_tokens(conversation_history)
+        attempt = 0
+        while True:
+            wait = self._breaker_wait()
+            while wait > 0:
+                if not self._sleep(min(wait, 1.0), deadline):
+                    return ModelResponse("", error=TIMEOUT)
+                wait = self._breaker_wait()
+            limiter = self.rate_limiter
+            if limiter is not None:
+                limiter.acquire(estimate)
+            start = time.monotonic()
+            delta = None
+            try:
+                timeout = self._attempt_timeout(deadline)
+                if session is None:
+                    response = hedged_call(self._perform_step, (conversation_history,), timeout,
+                                           self.hedger, self._hedge_reserve(estimate))
+                else:
+                    delta = session.delta(conversation_history)
+                    response, state = call_with_timeout(self._session_step, timeout, conversation_history,
+                                                        session.state if delta is not None else None, delta)
+                    session.advance(conversation_history, state, delta)
+            except DeadlineExceeded:
+                self._session_failed(session, delta, None)
+                return ModelResponse("", error=TIMEOUT)
+            except Exception as e:
+                if self._session_failed(session, delta, e):
+                    continue
+                kind, delay = self._record_failure(e, attempt)
+                if delay is None or not self._sleep(delay, deadline):
+                    return ModelResponse("", error=kind)
+                attempt += 1
+                continue
+            self._record_call(response, time.monotonic() - start, estimate)
+            return response
+
+    async def perform_step_async(self, conversation_history, deadline=None, session=None):
+        """
+        Async variant of perform_step; timed-out calls are cancelled.
+        """
+        estimate = estimate_tokens(conversation_history)
+        attempt = 0
+        while True:
+            wait = self._breaker_wait()
+            while wait > 0:
+                if not await self._sleep_async(min(wait, 1.0), deadline):
+                    return ModelResponse("", error=TIMEOUT)
+                wait = self._breaker_wait()
+            limiter = self.rate_limiter
+            if limiter is not None:
+                await limiter.acquire_async(estimate)
+            start = time.monotonic()
+            delta = None
+            try:
+                timeout = self._attempt_timeout(deadline)
+                if session is None:
+                    response = await hedged_call_async(self._perform_step_async, (conversation_history,), timeout,
+                                                       self.hedger, self._hedge_reserve(estimate))
+                else:
+                    delta = session.delta(conversation_history)
+                    response, state = await asyncio.wait_for(
+                        self._session_step_async(conversation_history,
+                                                 session.state if delta is not None else None, delta),
+                        timeout)
+                    session.advance(conversation_history, state, delta)
+            except DeadlineExceeded:
+                self._session_failed(session, delta, None)
+                return ModelResponse("", error=TIMEOUT)
+            except Exception as e:
+                if self._session_failed(session, delta, e):
+                    continue
+                kind, delay = self._record_failure(e, attempt)
+                if delay is None or not await self._sleep_async(delay, deadline):
+                    return ModelResponse("", error=kind)
+                attempt += 1
+                continue
+            self._record_call(response, time.monotonic() - start, estimate)
+            return response
+
+    def _session_failed(self, session, delta, error):
+        """
+        A call that relied on session state failed, so the state can't be
+        trusted any more: the next call resends the full conversation.
+        Returns whether to do so right away, which is when the provider
+        rejected the request outright, as it does for expired state.
+        """
+        if session is None or delta is None:
+            return False
+        session.reset()
+        if error is None or classify_error(error) != PERMANENT:
+            return False
+        print(f"Session state lost in {type(self).__name__} ({error}); resending the full conversation")
+        return True
+
+    def _attempt_timeout(self, deadline):
+        """
+        Time allowed for the next call. Local models are never abandoned
+        mid-generation, only stopped once the deadline has passed.
+        """
+        timeout = attempt_timeout(deadline)
+        return timeout if self.provider is not None else None
+
+    @staticmethod
+    def _sleep(seconds, deadline):
+        """
+        Sleep unless that would run past deadline; returns whether it slept.
+        """
+        left = remaining(deadline)
+        if left is not None and seconds >= left:
+            return False
+        time.sleep(seconds)
+        return True
+
+    @staticmethod
+    async def _sleep_async(seconds, deadline):
+        left = remaining(deadline)
+        if left is not None and seconds >= left:
+            return False
+        await asyncio.sleep(seconds)
+        return True
+
+    def _breaker_wait(self):
+        breaker = self.circuit_breaker
+        return 0.0 if breaker is None else breaker.wait_time()
+
+    def _record_call(self, response, latency, estimate):
+        limiter = self.rate_limiter
+        if limiter is not None:
+            limiter.record(response, estimate)
+        breaker = self.circuit_breaker
+        if breaker is not None:
+            breaker.record_success()
+        if self.controller is not None and response:
+            self.controller.record_success(latency)
+
+    def _record_failure(self, error, attempt):
+        """
+        Report a failed call; returns its error kind and the seconds to wait
+        before retrying, or None to give up.
+        """
+        kind = classify_error(error)
+        print(f"Error in {type(self).__name__} ({kind}): {error}")
+        self.record_error(error)
+        breaker = self.circuit_breaker
+        if breaker is not None:
+            breaker.record_failure(kind)
+        if not self.retry_policy.should_retry(kind, attempt):
+            return kind, None
+        delay = self.retry_policy.delay(attempt, error)
+        print(f"Retrying in {delay:.1f}s (attempt {attempt + 2} of {self.retry_policy.max_attempts})")
+        return kind, delay
+
+    def record_error(self, error):
+        """
+        Forward the exception behind a failed call to the concurrency controller.
+        """
+        if self.controller is not None:
+            self.controller.record_error(error)
 
     @abstractmethod
-    def perform_step(self, conversation_history):
+    def _perform_step(self, conversation_history):
         pass
 
+    async def _perform_step_async(self, conversation_history):
+        """
+        Adapters with an async SDK client override this; the rest run
+        _perform_step on the bounded sync executor.
+        """
+        return await run_sync(self._perform_step, conversation_history)
+
+    def _session_step(self, conversation_history, state, delta):
+        """
+        Adapters with supports_sessions override this. Sends delta on top of
+        state, or the whole conversation when state is None, and returns the
+        ModelResponse with the state to use next turn. The session is only
+        updated once the call returns, and dropped if it fails, so an
+        abandoned call can't spoil it.
+        """
+        raise self._unsupported("sessions", "supports_sessions")
+
+    async def _session_step_async(self, conversation_history, state, delta):
+        return await run_sync(self._session_step, conversation_history, state, delta)
+
+    def submit_batch(self, requests):
+        """
+        Adapters with supports_batch override this and collect_batch.
+        Submits {custom_id: conversation_history} as one provider batch and
+        returns its id.
+        """
+        raise self._unsupported("batch requests", "supports_batch")
+
+    def collect_batch(self, batch_id, custom_ids):
+        """
+        Wait for a submitted batch to end; returns {custom_id: ModelResponse}
+        for every one of custom_ids.
+        """
+        raise self._unsupported("batch requests", "supports_batch")
+
+    def _unsupported(self, capability, flag):
+        return NotImplementedError(f"{type(self).__name__} does not support {capability}; "
+                                   f"check {flag} before calling")
+
     @abstractmethod
     def initialize_conversation(self, system_prompt):
         pass
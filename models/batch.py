@@ -0,0 +1,64 @@
+"""
+Provider batch APIs.
+
+OpenAI and Anthropic take many requests as one batch and answer within a
+day, at about half the price and without the interactive rate limits. An
+adapter with supports_batch submits {custom_id: conversation_history} with
+submit_batch, which returns the batch id, and collect_batch waits for the
+batch to end and returns {custom_id: ModelResponse}. Requests that failed or
+never ran come back as an empty ModelResponse with the error kind, so the
+harness treats them like any failed call.
+"""
+
+import time
+
+from .base_model import ModelResponse
+from .retry import PERMANENT, TRANSIENT
+
+# Seconds between status checks of a submitted batch
+BATCH_POLL = 30
+BATCH_WINDOW = "24h"
+
+_poll_interval = BATCH_POLL
+
+
+def set_batch_poll(seconds):
+    global _poll_interval
+    _poll_interval = seconds
+
+
+def wait_for_batch(retrieve, batch_id, is_done, status):
+    """
+    Poll retrieve(batch_id) until is_done(batch); returns the final batch.
+    """
+    while True:
+        batch = retrieve(batch_id)
+        if is_done(batch):
+            return batch
+        print(f"Batch {batch_id}: {status(batch)}, checking again in {_poll_interval}s")
+        time.sleep(_poll_interval)
+
+
+def batch_error(custom_id, message, kind=TRANSIENT):
+    print(f"Batch request {custom_id} failed ({kind}): {message}")
+    return ModelResponse("", error=kind)
+
+
+def missing_results(requests, results):
+    """
+    Fill in the requests the batch returned nothing for, as when it expired
+    or was cancelled.
+    """
+    for custom_id in requests:
+        if custom_id not in results:
+            results[custom_id] = batch_error(custom_id, "no result in batch")
+    return results
+
+
+def http_error_kind(status_code):
+    """
+    Error kind for a failed request inside a batch, from its HTTP status.
+    """
+    if status_code is not None and 400 <= status_code < 500 and status_code not in (408, 409, 429):
+        return PERMANENT
+    return TRANSIENT
@@ -1,45 +1,74 @@
-from .base_model import BaseModel
-import os
-import time
-import json
+from .actions import action_text, bedrock_tools
+from .base_model import BaseModel, ModelResponse
+from .conversation import translate_messages
+from .deadlines import get_turn_timeout
+from .streaming import collect_stream
 import boto3
-from botocore.exceptions import ClientError
+from botocore.config import Config
+
+
+def bedrock_message(msg):
+    return {
+        "role": "assistant" if msg["role"] == "assistant" else msg["role"],
+        "content": [{"text": msg["content"]}]
+    }
 
 
 class BedrockModel(BaseModel):
+    provider = "bedrock"
+    supports_streaming = True
+    supports_tools = True
+
     def __init__(self, model_name):
         super().__init__(model_name)
         self.model = model_name
-        self.client = boto3.client(service_name="bedrock-runtime", region_name="us-west-2")
+        self.client = boto3.client(service_name="bedrock-runtime", region_name="us-west-2",
+                                   config=Config(read_timeout=get_turn_timeout() or 60,
+                                                 retries={"total_max_attempts": 1}))
+
+    def _perform_step(self, conversation_history):
+        bedrock_messages = translate_messages(conversation_history, "bedrock", bedrock_message)
+
+        inference_config = {
+            "maxTokens": 512,
+            "temperature": 0.5,
+            "topP": 0.9
+        }
+
+        if self.stream and not self.actions:
+            response = self.client.converse_stream(modelId=self.model,
+                                                   messages=bedrock_messages,
+                                                   inferenceConfig=inference_config)
+            return collect_stream(self._deltas(response["stream"]))
+
+        tool_options = {}
+        if self.actions:
+            tool_options["toolConfig"] = {"tools": bedrock_tools(self.actions), "toolChoice": {"auto": {}}}
+
+        response = self.client.converse(modelId=self.model,
+                                        messages=bedrock_messages,
+                                        inferenceConfig=inference_config,
+                                        **tool_options)
+
+        content = response["output"]["message"]["content"]
+        text = "".join(block.get("text", "") for block in content)
+        for block in content:
+            if "toolUse" in block:
+                text = action_text(block["toolUse"]["name"], block["toolUse"]["input"], text)
+                break
+        return ModelResponse(text, response["usage"]["inputTokens"], response["usage"]["outputTokens"])
 
-    def perform_step(self, conversation_history, retry_count=0):
+    def _deltas(self, stream):
         try:
-            bedrock_messages = [
-                {
-                    "role": "assistant" if msg["role"] == "assistant" else msg["role"],
-                    "content": [{"text": msg["content"]}]
-                }
-                for msg in conversation_history
-            ]
-
-            response = self.client.converse(modelId=self.model,
-                                            messages=bedrock_messages,
-                                            inferenceConfig={
-                                                "maxTokens": 512,
-                                                "temperature": 0.5,
-                                                "topP": 0.9
-                                            },)
-
-            return response["output"]["message"]["content"][0]["text"]
-        
-        except Exception as e:
-            print(f"Error in BedrockModel: {e}")
-            time.sleep(30)
-            if retry_count >= 3:
-                return ""
-            else:
-                print(f"attempting retry {retry_count+1}...")
-                return self.perform_step(conversation_history, retry_count+1)
+            for event in stream:
+                if "contentBlockDelta" in event:
+                    yield event["contentBlockDelta"]["delta"].get("text", "")
+                elif "metadata" in event:
+                    usage = event["metadata"].get("usage", {})
+                    yield ModelResponse("", usage.get("inputTokens"), usage.get("outputTokens"))
+        finally:
+            # Dropping the connection ends generation when we stop early
+            stream.close()
 
     def initialize_conversation(self, system_prompt):
         return [{"role": "user", "content": system_prompt}]
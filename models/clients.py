@@ -0,0 +1,115 @@
+"""
+Process-wide HTTP clients for hosted model endpoints.
+
+Each endpoint gets one keep-alive connection pool (HTTP/2 when the h2 package
+is installed), shared by every conversation and thread in the process, so
+hundreds of concurrent tests reuse a handful of connections instead of
+setting up TLS per call. OpenAI-compatible providers are listed in ENDPOINTS
+and get a shared OpenAI SDK client on top of their pool.
+"""
+
+import asyncio
+import os
+import threading
+import weakref
+
+import httpx
+
+from .deadlines import get_turn_timeout
+
+# provider: (base URL, None for the SDK default; API key environment variable)
+ENDPOINTS = {
+    'openai': (None, 'OPENAI_API_KEY'),
+    'deepseek': ('https://api.deepseek.com', 'DEEPSEEK_API_KEY'),
+    'openrouter': ('https://openrouter.ai/api/v1', 'OPENROUTER_API_KEY'),
+    'groq': ('https://api.groq.com/openai/v1', 'GROQ_API_KEY'),
+    'mistral': ('https://api.mistral.ai/v1', 'MISTRAL_API_KEY'),
+}
+
+MAX_CONNECTIONS = 256
+MAX_KEEPALIVE_CONNECTIONS = 64
+KEEPALIVE_EXPIRY = 60.0
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+_http_clients = {}
+_openai_clients = {}
+# Async clients per event loop, dropped with the loop
+_async_clients = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _pool_options():
+    return {
+        'http2': HTTP2,
+        'limits': httpx.Limits(max_connections=MAX_CONNECTIONS,
+                               max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                               keepalive_expiry=KEEPALIVE_EXPIRY),
+        'timeout': httpx.Timeout(get_turn_timeout(), connect=10.0),
+    }
+
+
+def get_http_client(endpoint):
+    """
+    Shared httpx.Client for an endpoint (any hashable key, usually a provider).
+    """
+    with _lock:
+        if endpoint not in _http_clients:
+            _http_clients[endpoint] = httpx.Client(**_pool_options())
+        return _http_clients[endpoint]
+
+
+def get_async_http_client(endpoint):
+    """
+    Shared httpx.AsyncClient for an endpoint. Async connections belong to an
+    event loop, so there is one pool per endpoint and running loop.
+    """
+    key = ('http', endpoint)
+    with _lock:
+        clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+        if key not in clients:
+            clients[key] = httpx.AsyncClient(**_pool_options())
+        return clients[key]
+
+
+def _openai_options(provider):
+    base_url, key_variable = ENDPOINTS[provider]
+    # Retries are handled by BaseModel
+    options = {'api_key': os.environ[key_variable], 'timeout': get_turn_timeout(), 'max_retries': 0}
+    if base_url is not None:
+        options['base_url'] = base_url
+    return options
+
+
+def get_openai_client(provider='openai'):
+    """
+    Shared OpenAI SDK client for an OpenAI-compatible provider in ENDPOINTS.
+    """
+    import openai
+    with _lock:
+        cached = _openai_clients.get(provider)
+    if cached is None:
+        cached = openai.OpenAI(http_client=get_http_client(provider), **_openai_options(provider))
+        with _lock:
+            cached = _openai_clients.setdefault(provider, cached)
+    return cached
+
+
+def get_async_openai_client(provider='openai'):
+    """
+    Shared AsyncOpenAI client for a provider, for the running event loop.
+    """
+    import openai
+    key = ('openai', provider)
+    with _lock:
+        clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+        cached = clients.get(key)
+    if cached is None:
+        cached = openai.AsyncOpenAI(http_client=get_async_http_client(provider), **_openai_options(provider))
+        with _lock:
+            cached = clients.setdefault(key, cached)
+    return cached
@@ -0,0 +1,104 @@
+"""
+Adaptive limit on how many conversations run at once.
+
+The controller follows AIMD: while calls succeed at a healthy latency the limit
+grows by about one conversation per round of calls, and on a rate-limit or
+timeout signal from an adapter it is cut in half. Model adapters report to it
+through BaseModel; main.py waits on it before starting each test.
+"""
+
+import asyncio
+import threading
+import time
+
+from .retry import RATE_LIMIT, TIMEOUT, classify_error
+
+# Latency above this multiple of the best latency seen counts as congestion
+LATENCY_TOLERANCE = 2.0
+# Cut the limit at most once per this many seconds, so one burst of 429s
+# from calls already in flight only counts once
+DECREASE_COOLDOWN = 5.0
+
+
+def congestion_signal(error):
+    """
+    'rate_limit' or 'timeout' if the error means the provider is overloaded,
+    otherwise None.
+    """
+    kind = classify_error(error)
+    return kind if kind in (RATE_LIMIT, TIMEOUT) else None
+
+
+class AIMDController:
+    """
+    Additive-increase, multiplicative-decrease concurrency limit.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=256, decrease=0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self.peak = 0
+        self.rate_limits = 0
+        self.timeouts = 0
+        self._best_latency = None
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._condition = None
+
+    @property
+    def current(self):
+        return int(self.limit)
+
+    def record_success(self, latency):
+        with self._lock:
+            if self._best_latency is None or latency < self._best_latency:
+                self._best_latency = latency
+            if latency <= LATENCY_TOLERANCE * self._best_latency:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def record_error(self, error):
+        signal = congestion_signal(error)
+        if signal is None:
+            return
+        with self._lock:
+            if signal == 'rate_limit':
+                self.rate_limits += 1
+            else:
+                self.timeouts += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= DECREASE_COOLDOWN:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                self._last_decrease = now
+
+    async def acquire(self):
+        """
+        Wait until another conversation may start.
+        """
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            while self.in_flight >= self.current:
+                try:
+                    # Successes reported from worker threads raise the limit
+                    # without a notify, so check again periodically
+                    await asyncio.wait_for(self._condition.wait(), 0.5)
+                except asyncio.TimeoutError:
+                    pass
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+
+    async def release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def summary(self):
+        return {
+            'current_concurrency': self.current,
+            'peak_concurrency': self.peak,
+            'rate_limit_signals': self.rate_limits,
+            'timeout_signals': self.timeouts
+        }
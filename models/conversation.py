@@ -0,0 +1,53 @@
+"""
+Conversations that keep provider-format copies of their messages.
+
+The OpenAI-style conversation_history stays the canonical log. Adapters whose
+API wants another message format used to rebuild the whole translated list
+every turn, which costs O(n) per turn and O(n^2) per test. A Conversation
+instead remembers each provider's translation and, since the harness only
+appends, translates just the messages added since the previous turn.
+"""
+
+import threading
+
+
+class Conversation(list):
+    """
+    A conversation_history list that caches per-provider translations of its
+    messages, each made once.
+    """
+
+    def __init__(self, messages=()):
+        super().__init__(messages)
+        # provider key -> (source messages, translated messages)
+        self._translations = {}
+        # Hedged calls for the same turn may translate at the same time
+        self._lock = threading.Lock()
+
+    def translated(self, key, translate):
+        """
+        The messages passed through translate, caching the result under key.
+        If the cached messages are no longer a prefix of the conversation,
+        for instance after it was edited in place, the cache is rebuilt.
+        """
+        with self._lock:
+            sources, messages = self._translations.get(key, ([], []))
+            n = len(sources)
+            if n > len(self) or (n and self[n - 1] is not sources[-1]):
+                sources, messages = [], []
+            for msg in self[len(sources):]:
+                sources.append(msg)
+                messages.append(translate(msg))
+            self._translations[key] = (sources, messages)
+            return messages
+
+
+def translate_messages(conversation_history, key, translate):
+    """
+    Provider-format messages for conversation_history: incremental for a
+    Conversation, a fresh translation for a plain list. Callers must not
+    modify the returned list.
+    """
+    if isinstance(conversation_history, Conversation):
+        return conversation_history.translated(key, translate)
+    return [translate(msg) for msg in conversation_history]
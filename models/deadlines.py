@@ -0,0 +1,90 @@
+"""
+Per-turn timeouts and per-test wall-clock budgets for model calls.
+
+Each attempt at a hosted model call gets at most TURN_TIMEOUT seconds, and
+never more than is left of the test's budget: async calls are cancelled,
+blocking calls are abandoned to their worker thread (the SDK clients are
+built with the same timeout, so those threads come back too, and
+executor.abandon bounds how many may be out at once). A timed-out
+attempt is retried like any other transient failure until the budget runs
+out.
+"""
+
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from .executor import abandon, get_sync_executor, wait_for_abandoned
+
+TURN_TIMEOUT = 180.0
+TEST_BUDGET = 3600.0
+
+_turn_timeout = TURN_TIMEOUT
+_test_budget = TEST_BUDGET
+_lock = threading.Lock()
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    The test's wall-clock budget ran out.
+    """
+
+
+def set_timeouts(turn_timeout=None, test_budget=None):
+    """
+    Timeouts used from now on; None leaves a value unchanged, 0 disables it.
+    Set the turn timeout before creating models, whose clients read it.
+    """
+    global _turn_timeout, _test_budget
+    with _lock:
+        if turn_timeout is not None:
+            _turn_timeout = turn_timeout or None
+        if test_budget is not None:
+            _test_budget = test_budget or None
+
+
+def get_turn_timeout():
+    return _turn_timeout
+
+
+def test_deadline():
+    """
+    Monotonic time at which a test starting now must stop, or None.
+    """
+    return None if _test_budget is None else time.monotonic() + _test_budget
+
+
+def remaining(deadline):
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def attempt_timeout(deadline):
+    """
+    Seconds one call attempt may take: the turn timeout, clipped to what is
+    left before the deadline. Raises DeadlineExceeded once it has passed.
+    """
+    left = remaining(deadline)
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("test time budget exhausted")
+    if _turn_timeout is None:
+        return left
+    return _turn_timeout if left is None else min(_turn_timeout, left)
+
+
+def call_with_timeout(func, timeout, *args):
+    """
+    func(*args) on the sync pool, raising TimeoutError if it takes longer than
+    timeout seconds. The call is abandoned, not interrupted. Waiting for too
+    many abandoned calls to finish counts towards the timeout.
+    """
+    if timeout is None:
+        return func(*args)
+    end = time.monotonic() + timeout
+    if not wait_for_abandoned(timeout):
+        raise TimeoutError(f"model call timed out after {timeout:.0f}s waiting for abandoned calls")
+    future = get_sync_executor().submit(func, *args)
+    try:
+        return future.result(max(0.0, end - time.monotonic()))
+    except FutureTimeoutError:
+        abandon(future)
+        raise TimeoutError(f"model call timed out after {timeout:.0f}s")
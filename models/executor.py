@@ -0,0 +1,120 @@
+"""
+Thread pools for running blocking work from asyncio code.
+
+Adapters without an async SDK client run perform_step on the bounded I/O
+pool, so a process can drive many conversations from one event loop while
+capping how many blocking requests are in flight at once. Harness work that
+is CPU-bound (building hypothesis spaces, scoring replies) runs on a
+separate small pool, so it neither waits behind slow requests nor takes
+their workers.
+
+A call that times out can't be interrupted, only abandoned, and it holds
+its I/O worker until the request returns. At most a quarter of the I/O
+workers may be held that way: further calls wait for an abandoned one to
+finish rather than leave the pool with no workers for live requests.
+"""
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+SYNC_WORKERS = 32
+CPU_WORKERS = min(4, os.cpu_count() or 1)
+# Seconds between checks while async callers wait for abandoned calls
+ABANDONED_POLL = 0.05
+
+_executor = None
+_cpu_executor = None
+_workers = SYNC_WORKERS
+_lock = threading.Lock()
+
+_abandoned = 0
+_abandoned_changed = threading.Condition()
+
+
+def set_sync_workers(workers):
+    """
+    Size of the pool used by run_sync. Takes effect if the pool has not been
+    created yet.
+    """
+    global _workers
+    with _lock:
+        _workers = workers
+
+
+def get_sync_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_workers, thread_name_prefix='sync-model')
+        return _executor
+
+
+def get_cpu_executor():
+    global _cpu_executor
+    with _lock:
+        if _cpu_executor is None:
+            _cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix='harness-cpu')
+        return _cpu_executor
+
+
+def max_abandoned():
+    return max(1, _workers // 4)
+
+
+def abandon(future):
+    """
+    Give up on a future from the I/O pool. It counts against max_abandoned
+    until it finishes.
+    """
+    global _abandoned
+    if future.cancel() or future.done():
+        return
+    with _abandoned_changed:
+        _abandoned += 1
+    future.add_done_callback(_abandoned_done)
+
+
+def _abandoned_done(future):
+    global _abandoned
+    with _abandoned_changed:
+        _abandoned -= 1
+        _abandoned_changed.notify_all()
+
+
+def abandoned_calls():
+    return _abandoned
+
+
+def wait_for_abandoned(timeout=None):
+    """
+    Block until fewer than max_abandoned calls are abandoned, for at most
+    timeout seconds; returns whether they are.
+    """
+    with _abandoned_changed:
+        return _abandoned_changed.wait_for(lambda: _abandoned < max_abandoned(), timeout)
+
+
+async def run_sync(func, *args, **kwargs):
+    """
+    Await func(*args, **kwargs) running on the bounded I/O pool. If the
+    awaiting task is cancelled, as on a timeout, the call is abandoned.
+    """
+    while _abandoned >= max_abandoned():
+        await asyncio.sleep(ABANDONED_POLL)
+    future = get_sync_executor().submit(functools.partial(func, *args, **kwargs))
+    try:
+        return await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        abandon(future)
+        raise
+
+
+async def run_cpu(func, *args, **kwargs):
+    """
+    Await func(*args, **kwargs) running on the CPU pool.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_cpu_executor(), functools.partial(func, *args, **kwargs))
@@ -1,36 +1,43 @@
-from .base_model import BaseModel
+from .base_model import BaseModel, ModelResponse
+from .conversation import translate_messages
+from .deadlines import get_turn_timeout
 import google.generativeai as genai
-from google.generativeai.types import RequestOptions
-from google.api_core import retry
 import os
 
+def gemini_message(msg):
+    return {"role": "model" if msg["role"] == "assistant" else msg["role"],
+            "parts": [msg["content"]]}
+
+
 class GeminiModel(BaseModel):
+    provider = "gemini"
+    supports_sessions = True
+
     def __init__(self, model_name):
         super().__init__(model_name)
         genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
         self.model = genai.GenerativeModel(model_name)
 
-    def perform_step(self, conversation_history):
-        try:
-            gemini_messages = [
-                {"role": "model" if msg["role"] == "assistant" else msg["role"],
-                 "parts": [msg["content"]]}
-                for msg in conversation_history[:-1]
-            ]
-
-            chat = self.model.start_chat(history=gemini_messages)
-            
-            response = chat.send_message(conversation_history[-1]["content"],
-                                         request_options=RequestOptions(
-                                             retry=retry.Retry(initial=10, multiplier=2,
-                                                               maximum=60, timeout=300)
-                                         ))
-
-            return response.text
-        
-        except Exception as e:
-            print(f"Error in GeminiModel: {e}")
-            return ""
+    def _start_chat(self, conversation_history):
+        gemini_messages = translate_messages(conversation_history, "gemini", gemini_message)
+        return self.model.start_chat(history=gemini_messages[:-1])
+
+    def _send(self, chat, message):
+        response = chat.send_message(message["content"],
+                                     request_options={"timeout": get_turn_timeout()})
+
+        return ModelResponse(response.text,
+                             response.usage_metadata.prompt_token_count,
+                             response.usage_metadata.candidates_token_count)
+
+    def _perform_step(self, conversation_history):
+        return self._send(self._start_chat(conversation_history), conversation_history[-1])
+
+    def _session_step(self, conversation_history, state, delta):
+        # The chat object keeps the history, including the model's own
+        # replies, so only the newest message needs translating
+        chat = state if state is not None else self._start_chat(conversation_history)
+        return self._send(chat, conversation_history[-1]), chat
 
     def initialize_conversation(self, system_prompt):
         return [{"role": "user", "content": system_prompt}]
@@ -0,0 +1,213 @@
+"""
+Hedged requests for hosted models with a long latency tail.
+
+When hedging is on, a call that has not returned by the chosen percentile of
+that model's recent latencies gets a second, identical request; whichever
+reply arrives first is used and the other request is cancelled (or, for
+blocking clients, abandoned). Hedges are capped at a fraction of all calls,
+so a provider that is slow across the board is not sent double the traffic.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import numpy as np
+
+from .deadlines import call_with_timeout
+from .executor import abandon, get_sync_executor, wait_for_abandoned
+
+HEDGE_PERCENTILE = 95
+MAX_HEDGE_RATE = 0.1
+# Latencies kept per model, and needed before the first hedge
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 20
+
+_percentile = None
+_max_rate = MAX_HEDGE_RATE
+_hedgers = {}
+_lock = threading.Lock()
+
+
+class Hedger:
+    """
+    Recent latencies and hedge counts for one model.
+    """
+
+    def __init__(self, percentile, max_rate):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    def record_latency(self, latency):
+        with self._lock:
+            self.latencies.append(latency)
+
+    def hedge_delay(self):
+        """
+        Seconds to wait before hedging a call starting now, or None if it must
+        not be hedged. Counts the call.
+        """
+        with self._lock:
+            self.calls += 1
+            if len(self.latencies) < MIN_SAMPLES:
+                return None
+            return float(np.percentile(self.latencies, self.percentile))
+
+    def start_hedge(self, reserve=None):
+        """
+        Claim a hedge if the rate cap allows one and reserve(), typically the
+        rate limiter, agrees.
+        """
+        with self._lock:
+            if self.hedges + 1 > self.max_rate * self.calls:
+                return False
+            if reserve is not None and not reserve():
+                return False
+            self.hedges += 1
+            return True
+
+    def record_win(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def summary(self):
+        with self._lock:
+            return {
+                'percentile': self.percentile,
+                'max_hedge_rate': self.max_rate,
+                'calls': self.calls,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'hedge_rate': self.hedges / self.calls if self.calls else 0.0
+            }
+
+
+def hedged_call(func, args, timeout, hedger, reserve=None):
+    """
+    func(*args) on the sync pool, hedged by a second identical call if it is
+    slow; raises TimeoutError after timeout seconds. Losing calls are
+    abandoned. Without a hedger this is call_with_timeout.
+    """
+    delay = hedger.hedge_delay() if hedger is not None else None
+    if delay is None:
+        start = time.monotonic()
+        result = call_with_timeout(func, timeout, *args)
+        _record_first(hedger, result, start)
+        return result
+    end = None if timeout is None else time.monotonic() + timeout
+    if not wait_for_abandoned(timeout):
+        raise TimeoutError(f"model call timed out after {timeout:.0f}s waiting for abandoned calls")
+    executor = get_sync_executor()
+    start = time.monotonic()
+    first = executor.submit(func, *args)
+    pending = {first}
+    done, pending = wait(pending, timeout=delay if end is None else min(delay, max(0.0, end - time.monotonic())))
+    if not done and (end is None or time.monotonic() < end) and hedger.start_hedge(reserve):
+        pending.add(executor.submit(func, *args))
+    while pending:
+        done, pending = wait(pending, timeout=None if end is None else max(0.0, end - time.monotonic()),
+                             return_when=FIRST_COMPLETED)
+        if not done:
+            for future in pending:
+                abandon(future)
+            raise TimeoutError(f"model call timed out after {timeout:.0f}s")
+        for future in done:
+            if future.exception() is None:
+                if future is first:
+                    _record_first(hedger, future.result(), start)
+                else:
+                    hedger.record_win()
+                for other in pending:
+                    abandon(other)
+                return future.result()
+    # The first request was done before the hedge delay, or every request
+    # failed and this reports the first one's error
+    result = first.result()
+    _record_first(hedger, result, start)
+    return result
+
+
+async def hedged_call_async(coroutine_func, args, timeout, hedger, reserve=None):
+    """
+    Async variant of hedged_call; the losing request is cancelled.
+    """
+    delay = hedger.hedge_delay() if hedger is not None else None
+    if delay is None:
+        start = time.monotonic()
+        result = await asyncio.wait_for(coroutine_func(*args), timeout)
+        _record_first(hedger, result, start)
+        return result
+    return await asyncio.wait_for(_race(coroutine_func, args, delay, hedger, reserve), timeout)
+
+
+def _record_first(hedger, result, start):
+    """
+    Add the latency of a call answered by its first request to the window.
+    When a hedge won, how long the first request would have taken is
+    unknown, so those calls are left out rather than pull the percentile
+    down to the hedge's latency.
+    """
+    if hedger is not None and result:
+        hedger.record_latency(time.monotonic() - start)
+
+
+async def _race(coroutine_func, args, delay, hedger, reserve):
+    start = time.monotonic()
+    first = asyncio.ensure_future(coroutine_func(*args))
+    tasks = [first]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done and hedger.start_hedge(reserve):
+            tasks.append(asyncio.ensure_future(coroutine_func(*args)))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is first:
+                        _record_first(hedger, task.result(), start)
+                    else:
+                        hedger.record_win()
+                    return task.result()
+        return first.result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+def set_hedging(percentile=HEDGE_PERCENTILE, max_rate=MAX_HEDGE_RATE):
+    """
+    Hedge calls slower than this latency percentile, for at most max_rate of
+    calls. A percentile of None turns hedging off.
+    """
+    global _percentile, _max_rate
+    with _lock:
+        _percentile = percentile
+        _max_rate = max_rate
+        _hedgers.clear()
+
+
+def get_hedger(provider, model_name):
+    """
+    Process-wide Hedger for a model, or None when hedging is off.
+    """
+    if _percentile is None or provider is None:
+        return None
+    key = f'{provider}/{model_name}'
+    with _lock:
+        if key not in _hedgers:
+            _hedgers[key] = Hedger(_percentile, _max_rate)
+        return _hedgers[key]
+
+
+def hedging_summary():
+    with _lock:
+        return {key: hedger.summary() for key, hedger in _hedgers.items()}
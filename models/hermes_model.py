@@ -21,7 +21,7 @@ class LocalModel(BaseModel):
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)        
         self.model = guidance.models.Transformers(model_obj, self.tokenizer, echo=False)
 
-    def perform_step(self, conversation_history):
+    def _perform_step(self, conversation_history):
 
         ## add result from previous test case here
         @guidance
@@ -0,0 +1,191 @@
+"""
+Local Hugging Face model serving many conversations at once.
+
+The guidance-based adapters (hermes_model, phi_model) accumulate a single
+conversation in their model object, so they can only run one test at a time.
+Here the conversation history is the only per-conversation state: every turn
+is rendered from it with the tokenizer's chat template. One worker thread
+owns the weights and collects the turns that concurrent tests are waiting
+on into a single left-padded generate call. Each row stops as soon as its
+action block is complete, and the batch ends when every row has stopped.
+Runs on CUDA when available, otherwise on CPU.
+"""
+
+import asyncio
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList
+
+from .base_model import BaseModel, ModelResponse
+from .batch import batch_error, missing_results
+from .streaming import ActionBlockDetector
+
+# Model names are "hf:" followed by a hub id or local path
+MODEL_PREFIX = "hf:"
+# Most turns generated in one forward pass, and how long the worker waits
+# for more requests to join a batch before starting it
+MAX_BATCH = 16
+BATCH_WAIT = 0.05
+MAX_NEW_TOKENS = 512
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+class ActionBlockStop(StoppingCriteria):
+    """
+    Per-row stop once the generated text holds a complete action block.
+    """
+
+    def __init__(self, tokenizer, prompt_length):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.done = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.done is None:
+            self.done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        for row in range(input_ids.shape[0]):
+            # A block can only close on a backtick, so skip the full decode
+            # for every other token
+            if self.done[row] or '`' not in self.tokenizer.decode(input_ids[row, -1:]):
+                continue
+            text = self.tokenizer.decode(input_ids[row, self.prompt_length:], skip_special_tokens=True)
+            if ActionBlockDetector().feed(text) is not None:
+                self.done[row] = True
+        return self.done.clone()
+
+
+class GenerationBatcher:
+    """
+    Worker thread that owns one set of weights and generates queued turns
+    in batches of up to max_batch.
+    """
+
+    def __init__(self, model_path, max_batch=MAX_BATCH, wait=BATCH_WAIT):
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        if self.tokenizer.pad_token_id is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        dtype = torch.float16 if self.device == "cuda" else torch.float32
+        self.model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=dtype).to(self.device)
+        self.model.eval()
+        self.max_batch = max_batch
+        self.wait = wait
+        self.passes = 0
+        self.generated = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='hf-batcher', daemon=True)
+        self._thread.start()
+
+    def prompt_ids(self, conversation_history):
+        messages = [{"role": msg["role"], "content": msg["content"]} for msg in conversation_history]
+        if self.tokenizer.chat_template:
+            return self.tokenizer.apply_chat_template(messages, add_generation_prompt=True)
+        # Same ChatML layout as hermes_model for tokenizers without a template
+        text = "\n".join(f"<|im_start|>{m['role']}\n{m['content']}<|im_end|>" for m in messages)
+        return self.tokenizer.encode(text + "\n<|im_start|>assistant\n")
+
+    def submit(self, conversation_history):
+        """
+        Queue the next turn of a conversation; returns a Future of its
+        ModelResponse.
+        """
+        future = Future()
+        self._queue.put((self.prompt_ids(conversation_history), future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            end = time.monotonic() + self.wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, end - time.monotonic())))
+                except queue.Empty:
+                    break
+            batch = [(ids, future) for ids, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                responses = self._generate([ids for ids, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), response in zip(batch, responses):
+                future.set_result(response)
+
+    def _generate(self, prompts):
+        pad = self.tokenizer.pad_token_id
+        length = max(len(ids) for ids in prompts)
+        input_ids = torch.tensor([[pad] * (length - len(ids)) + list(ids) for ids in prompts], device=self.device)
+        attention_mask = torch.tensor([[0] * (length - len(ids)) + [1] * len(ids) for ids in prompts],
+                                      device=self.device)
+        with torch.no_grad():
+            output = self.model.generate(input_ids=input_ids, attention_mask=attention_mask,
+                                         max_new_tokens=MAX_NEW_TOKENS, do_sample=False, pad_token_id=pad,
+                                         stopping_criteria=StoppingCriteriaList(
+                                             [ActionBlockStop(self.tokenizer, length)]))
+        self.passes += 1
+        responses = []
+        for ids, row in zip(prompts, output[:, length:].tolist()):
+            if self.tokenizer.eos_token_id in row:
+                row = row[:row.index(self.tokenizer.eos_token_id)]
+            text = self.tokenizer.decode(row, skip_special_tokens=True)
+            end = ActionBlockDetector().feed(text)
+            if end is not None:
+                text = text[:end]
+            self.generated += len(row)
+            responses.append(ModelResponse(text, len(ids), len(row), stopped_early=end is not None))
+        return responses
+
+
+def get_batcher(model_path):
+    with _batchers_lock:
+        if model_path not in _batchers:
+            _batchers[model_path] = GenerationBatcher(model_path)
+        return _batchers[model_path]
+
+
+class BatchedHFModel(BaseModel):
+    # Lockstep batch mode just queues every test's turn at once
+    supports_batch = True
+
+    def __init__(self, model_name):
+        super().__init__(model_name)
+        model_path = model_name[len(MODEL_PREFIX):] if model_name.startswith(MODEL_PREFIX) else model_name
+        self.batcher = get_batcher(model_path)
+        self._batches = {}
+        self._batch_ids = itertools.count(1)
+
+    def _perform_step(self, conversation_history):
+        return self.batcher.submit(conversation_history).result()
+
+    async def _perform_step_async(self, conversation_history):
+        # No executor thread per waiting conversation, only the worker's
+        return await asyncio.wrap_future(self.batcher.submit(conversation_history))
+
+    def submit_batch(self, requests):
+        batch_id = f"local-{next(self._batch_ids)}"
+        self._batches[batch_id] = {custom_id: self.batcher.submit(conversation_history)
+                                   for custom_id, conversation_history in requests.items()}
+        return batch_id
+
+    def collect_batch(self, batch_id, custom_ids):
+        results = {}
+        for custom_id, future in self._batches.pop(batch_id, {}).items():
+            try:
+                results[custom_id] = future.result()
+            except Exception as e:
+                results[custom_id] = batch_error(custom_id, e)
+        return missing_results(custom_ids, results)
+
+    def initialize_conversation(self, system_prompt):
+        # Not every chat template accepts a system message
+        return [{"role": "user", "content": system_prompt}]
@@ -11,17 +11,15 @@ class LLamaCPPModel(BaseModel):
             chat_format="llama-3",
             verbose=False,
         )
+        # Reuse the evaluated prompt prefix from the previous turn
+        self.client.set_cache(llama_cpp.LlamaRAMCache())
 
-    def perform_step(self, conversation_history):
-        try:
-            response = self.client.create_chat_completion(
-                model=self.model_name,
-                messages=conversation_history
-            )
-            return response['choices'][0]["message"]["content"]
-        except Exception as e:
-            print(f"Error in LlamaCPPModel: {e}")
-            return ""
+    def _perform_step(self, conversation_history):
+        response = self.client.create_chat_completion(
+            model=self.model_name,
+            messages=conversation_history
+        )
+        return response['choices'][0]["message"]["content"]
 
     def initialize_conversation(self, system_prompt):
         return [{"role": "system", "content": system_prompt}]
@@ -0,0 +1,150 @@
+import json
+
+from .actions import action_text, openai_tools
+from .base_model import BaseModel, ModelResponse
+from .batch import BATCH_WINDOW, batch_error, http_error_kind, missing_results, wait_for_batch
+from .clients import get_async_openai_client, get_openai_client
+from .prompt_cache import openai_cached_tokens, prefix_stable_messages
+from .streaming import collect_stream, collect_stream_async
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_ENDED = ("completed", "failed", "expired", "cancelled")
+
+
+class OpenAICompatibleModel(BaseModel):
+    """
+    Chat completions against any endpoint speaking the OpenAI API. Subclasses
+    set provider to one of models.clients.ENDPOINTS, which supplies the base
+    URL and API key; clients and connection pools are shared per provider.
+    """
+    provider = "openai"
+    supports_streaming = True
+    supports_tools = True
+    tool_choice = "auto"
+    # Whether the endpoint accepts stream_options to report usage when streaming
+    stream_usage = False
+
+    def __init__(self, model_name):
+        super().__init__(model_name)
+        self.client = get_openai_client(self.provider)
+
+    @property
+    def async_client(self):
+        return get_async_openai_client(self.provider)
+
+    def _tool_options(self):
+        if not self.actions:
+            return {}
+        return {'tools': openai_tools(self.actions), 'tool_choice': self.tool_choice}
+
+    def _response(self, response):
+        usage = response.usage
+        message = response.choices[0].message
+        text = message.content
+        if getattr(message, 'tool_calls', None):
+            call = message.tool_calls[0]
+            text = action_text(call.function.name, call.function.arguments, text or "")
+        return ModelResponse(text, getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None),
+                             cached_tokens=openai_cached_tokens(usage))
+
+    def _usage(self, usage):
+        return ModelResponse("", getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None),
+                             cached_tokens=openai_cached_tokens(usage))
+
+    def _stream_options(self):
+        return {'stream_options': {'include_usage': True}} if self.stream_usage else {}
+
+    def _deltas(self, stream):
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, 'usage', None) is not None:
+                yield self._usage(chunk.usage)
+
+    async def _deltas_async(self, stream):
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, 'usage', None) is not None:
+                yield self._usage(chunk.usage)
+
+    def _stream_step(self, conversation_history):
+        stream = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=prefix_stable_messages(conversation_history),
+            stream=True,
+            **self._stream_options()
+        )
+        with stream:
+            return collect_stream(self._deltas(stream))
+
+    async def _stream_step_async(self, conversation_history):
+        stream = await self.async_client.chat.completions.create(
+            model=self.model_name,
+            messages=prefix_stable_messages(conversation_history),
+            stream=True,
+            **self._stream_options()
+        )
+        async with stream:
+            return await collect_stream_async(self._deltas_async(stream))
+
+    def _perform_step(self, conversation_history):
+        if self.stream and not self.actions:
+            return self._stream_step(conversation_history)
+        response = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=prefix_stable_messages(conversation_history),
+            **self._tool_options()
+        )
+        return self._response(response)
+
+    async def _perform_step_async(self, conversation_history):
+        if self.stream and not self.actions:
+            return await self._stream_step_async(conversation_history)
+        response = await self.async_client.chat.completions.create(
+            model=self.model_name,
+            messages=prefix_stable_messages(conversation_history),
+            **self._tool_options()
+        )
+        return self._response(response)
+
+    def _batch_line(self, custom_id, conversation_history):
+        body = {'model': self.model_name, 'messages': prefix_stable_messages(conversation_history)}
+        body.update(self._tool_options())
+        return {'custom_id': custom_id, 'method': 'POST', 'url': BATCH_ENDPOINT, 'body': body}
+
+    def submit_batch(self, requests):
+        lines = "\n".join(json.dumps(self._batch_line(custom_id, conversation_history))
+                          for custom_id, conversation_history in requests.items())
+        batch_file = self.client.files.create(file=("batch.jsonl", lines.encode()), purpose="batch")
+        batch = self.client.batches.create(input_file_id=batch_file.id, endpoint=BATCH_ENDPOINT,
+                                           completion_window=BATCH_WINDOW)
+        return batch.id
+
+    def collect_batch(self, batch_id, custom_ids):
+        from openai.types.chat import ChatCompletion
+
+        batch = wait_for_batch(self.client.batches.retrieve, batch_id,
+                               lambda b: b.status in BATCH_ENDED, lambda b: b.status)
+        results = {}
+        # Successful requests land in the output file, failed ones in the
+        # error file, in the same line format
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id is None:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                custom_id = entry['custom_id']
+                response = entry.get('response') or {}
+                status_code = response.get('status_code')
+                if entry.get('error') or status_code != 200:
+                    results[custom_id] = batch_error(custom_id, entry.get('error') or response.get('body'),
+                                                     http_error_kind(status_code))
+                else:
+                    results[custom_id] = self._response(ChatCompletion.model_validate(response['body']))
+        return missing_results(custom_ids, results)
+
+    def initialize_conversation(self, system_prompt):
+        return [{"role": "system", "content": system_prompt}]
@@ -1,23 +1,39 @@
-from .base_model import BaseModel
-import openai
-import os
+from .base_model import ModelResponse
+from .openai_compatible import OpenAICompatibleModel
+from .prompt_cache import openai_cached_tokens, prefix_stable_messages
 
-class OpenAIModel(BaseModel):
-    def __init__(self, model_name):
-        super().__init__(model_name)
-        openai.api_key = os.environ["OPENAI_API_KEY"]
-        self.client = openai.OpenAI()
+class OpenAIModel(OpenAICompatibleModel):
+    provider = "openai"
+    stream_usage = True
+    supports_sessions = True
+    supports_batch = True
 
-    def perform_step(self, conversation_history):
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=conversation_history
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"Error in OpenAIModel: {e}")
-            return ""
+    def _session_request(self, conversation_history, state, delta):
+        """
+        Responses API arguments: the whole conversation, or only the delta
+        chained on the previous response, which OpenAI stores for us.
+        """
+        request = {'model': self.model_name, 'store': True}
+        if state is None:
+            request['input'] = prefix_stable_messages(conversation_history)
+        else:
+            request['input'] = prefix_stable_messages(delta)
+            request['previous_response_id'] = state
+        return request
+
+    def _session_response(self, response):
+        usage = response.usage
+        return ModelResponse(response.output_text, getattr(usage, 'input_tokens', None),
+                             getattr(usage, 'output_tokens', None), cached_tokens=openai_cached_tokens(usage))
+
+    def _session_step(self, conversation_history, state, delta):
+        response = self.client.responses.create(**self._session_request(conversation_history, state, delta))
+        return self._session_response(response), response.id
+
+    async def _session_step_async(self, conversation_history, state, delta):
+        response = await self.async_client.responses.create(
+            **self._session_request(conversation_history, state, delta))
+        return self._session_response(response), response.id
 
     def initialize_conversation(self, system_prompt):
         if self.model_name in ["o1-preview-2024-09-12",
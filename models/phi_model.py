@@ -25,7 +25,7 @@ class PhiModel(BaseModel):
                                                        trust_remote_code=True)
         self.model = models.Transformers(model_obj, self.tokenizer, echo=False)
 
-    def perform_step(self, conversation_history):
+    def _perform_step(self, conversation_history):
 
         ## add result from previous test case here
         @guidance
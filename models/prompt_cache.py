@@ -0,0 +1,78 @@
+"""
+Prompt caching helpers.
+
+Every turn resends the system prompt and the whole conversation so far, so
+consecutive requests of a test share everything but the newest messages.
+Anthropic caches a prompt prefix up to a cache_control breakpoint: we mark
+the system prompt and the newest message, so each turn reads the prefix the
+previous turn wrote. OpenAI-style providers cache matching prefixes
+automatically, as long as the request bytes are identical, which
+prefix_stable_messages makes sure of. Adapters report the cached part of
+the prompt as ModelResponse.cached_tokens.
+"""
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def _field(obj, name):
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def prefix_stable_messages(conversation_history):
+    """
+    Messages with only role and content, in a fixed key order, so a
+    conversation's earlier turns serialize to the same bytes every time.
+    """
+    return [{"role": msg["role"], "content": msg["content"]} for msg in conversation_history]
+
+
+def openai_cached_tokens(usage):
+    """
+    Prompt tokens served from cache, as reported by OpenAI chat completions
+    (prompt_tokens_details.cached_tokens), the OpenAI Responses API
+    (input_tokens_details.cached_tokens) or DeepSeek (prompt_cache_hit_tokens).
+    """
+    cached = _field(_field(usage, "prompt_tokens_details"), "cached_tokens")
+    if cached is None:
+        cached = _field(_field(usage, "input_tokens_details"), "cached_tokens")
+    if cached is None:
+        cached = _field(usage, "prompt_cache_hit_tokens")
+    return cached
+
+
+def anthropic_system(system_prompt):
+    """
+    System prompt as a cached content block.
+    """
+    return [{"type": "text", "text": system_prompt, "cache_control": CACHE_CONTROL}]
+
+
+def anthropic_messages(conversation_history):
+    """
+    Messages with a cache breakpoint on the newest one, leaving the
+    conversation itself untouched.
+    """
+    messages = prefix_stable_messages(conversation_history)
+    if messages and isinstance(messages[-1]["content"], str):
+        messages[-1] = {"role": messages[-1]["role"],
+                        "content": [{"type": "text", "text": messages[-1]["content"],
+                                     "cache_control": CACHE_CONTROL}]}
+    return messages
+
+
+def anthropic_usage(usage):
+    """
+    (prompt tokens, output tokens, cached prompt tokens). Anthropic's
+    input_tokens leaves out cache reads and writes; they are added back so
+    the prompt size means the same for every provider.
+    """
+    cache_read = _field(usage, "cache_read_input_tokens") or 0
+    cache_write = _field(usage, "cache_creation_input_tokens") or 0
+    input_tokens = _field(usage, "input_tokens")
+    if input_tokens is not None:
+        input_tokens += cache_read + cache_write
+    return input_tokens, _field(usage, "output_tokens"), cache_read
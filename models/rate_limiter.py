@@ -0,0 +1,164 @@
+"""
+Shared request and token rate limits per provider and model.
+
+Limits are read from a JSON file mapping "provider/model" or "provider" to
+{"rpm": requests per minute, "tpm": tokens per minute}; the most specific
+entry wins and providers without an entry are not limited. Every harness in
+the process draws from the same buckets, and BaseModel acquires from them
+before each call, so concurrent tests together stay within the budget.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+
+RATE_LIMITS_PATH = './rate_limits.json'
+# Output tokens reserved per call before the provider reports actual usage
+ESTIMATED_OUTPUT_TOKENS = 1024
+
+
+class TokenBucket:
+    """
+    Bucket refilled continuously at per_minute / 60 per second, holding at most
+    one minute's worth. Callers reserve first and wait afterwards, so the
+    bucket can go into debt and waiters are served in the order they arrived.
+    """
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """
+        Take amount from the bucket and return the seconds to wait before
+        using it.
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def try_reserve(self, amount):
+        """
+        Take amount only if it is available now.
+        """
+        with self._lock:
+            self._refill()
+            if self.tokens < min(amount, self.capacity):
+                return False
+            self.tokens -= min(amount, self.capacity)
+            return True
+
+    def adjust(self, amount):
+        """
+        Take (or give back, if negative) amount without waiting, to correct an
+        earlier estimate.
+        """
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budgets for one provider or model.
+    """
+
+    def __init__(self, key, rpm=None, tpm=None):
+        self.key = key
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+
+    def _reserve(self, estimated_tokens):
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(estimated_tokens))
+        return wait
+
+    def acquire(self, estimated_tokens):
+        wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, estimated_tokens):
+        wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def try_acquire(self, estimated_tokens):
+        """
+        Reserve a request without waiting, for optional extra calls such as
+        hedges; False if either budget is short.
+        """
+        if self.requests is not None and not self.requests.try_reserve(1):
+            return False
+        if self.tokens is not None and not self.tokens.try_reserve(estimated_tokens):
+            if self.requests is not None:
+                self.requests.adjust(-1)
+            return False
+        return True
+
+    def record(self, response, estimated_tokens):
+        """
+        Replace the estimate with the usage the provider reported, if any.
+        """
+        used = getattr(response, 'total_tokens', None)
+        if self.tokens is not None and used is not None:
+            self.tokens.adjust(used - estimated_tokens)
+
+
+def estimate_tokens(conversation_history):
+    """
+    Rough token count of a request: about four characters per token for the
+    prompt, plus the output allowance.
+    """
+    chars = sum(len(str(msg.get('content', ''))) for msg in conversation_history)
+    return chars // 4 + ESTIMATED_OUTPUT_TOKENS
+
+
+_limits = None
+_limiters = {}
+_lock = threading.Lock()
+
+
+def load_rate_limits(path=RATE_LIMITS_PATH):
+    """
+    Use the limits in path from now on. A missing file means no limits.
+    """
+    global _limits
+    limits = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            limits = json.load(f)
+    with _lock:
+        _limits = limits
+        _limiters.clear()
+    return limits
+
+
+def get_rate_limiter(provider, model_name):
+    """
+    Process-wide limiter for a model: the "provider/model" entry if there is
+    one, else the shared "provider" entry, else None.
+    """
+    if _limits is None:
+        load_rate_limits()
+    with _lock:
+        for key in (f'{provider}/{model_name}', provider):
+            if key in _limits:
+                if key not in _limiters:
+                    _limiters[key] = RateLimiter(key, _limits[key].get('rpm'), _limits[key].get('tpm'))
+                return _limiters[key]
+    return None
@@ -0,0 +1,166 @@
+"""
+Retry policy and circuit breakers shared by all model adapters.
+
+Adapters let provider errors propagate; BaseModel classifies each one as a
+rate limit, timeout, transient server error or permanent error. The first
+three are retried with jittered exponential backoff, or after the delay the
+provider asked for in a retry-after header. A circuit breaker per provider
+stops every conversation from hammering an endpoint that keeps failing: after
+enough consecutive failures calls wait until the endpoint has had time to
+recover, then a single trial call decides whether to resume.
+"""
+
+import asyncio
+import email.utils
+import random
+import threading
+import time
+
+RATE_LIMIT = 'rate_limit'
+TIMEOUT = 'timeout'
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+MAX_ATTEMPTS = 5
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+
+BREAKER_THRESHOLD = 5
+BREAKER_RESET = 30.0
+
+
+def _status(error):
+    for source in (error, getattr(error, 'response', None)):
+        status = getattr(source, 'status_code', None) or getattr(source, 'status', None)
+        if isinstance(status, int):
+            return status
+    # botocore ClientError
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        return response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return None
+
+
+def classify_error(error):
+    """
+    RATE_LIMIT, TIMEOUT, TRANSIENT or PERMANENT.
+    """
+    status = _status(error)
+    name = type(error).__name__.lower()
+    text = str(error).lower()
+    if status == 429 or any(s in name for s in ('ratelimit', 'throttl', 'resourceexhausted', 'toomanyrequests')) \
+            or 'throttl' in text or 'rate limit' in text:
+        return RATE_LIMIT
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)) or status in (408, 504) \
+            or 'timeout' in name or 'deadline' in name or 'timed out' in text:
+        return TIMEOUT
+    if (status is not None and status >= 500) or any(s in name for s in (
+            'connection', 'serviceunavailable', 'internalserver', 'overloaded', 'apierror')) \
+            or 'overloaded' in text:
+        return TRANSIENT
+    return PERMANENT
+
+
+def retry_after(error):
+    """
+    Seconds the provider asked us to wait, from retry-after(-ms) headers, or None.
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers is None:
+        return None
+    value = headers.get('retry-after-ms')
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        date = email.utils.parsedate_to_datetime(value)
+        return max(0.0, date.timestamp() - time.time()) if date is not None else None
+
+
+class RetryPolicy:
+    """
+    Which failures to retry and how long to wait before each attempt.
+    """
+
+    def __init__(self, max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, kind, attempt):
+        return kind != PERMANENT and attempt + 1 < self.max_attempts
+
+    def delay(self, attempt, error):
+        hinted = retry_after(error)
+        if hinted is not None:
+            return min(self.max_delay, hinted) + random.uniform(0, self.base_delay)
+        # Full jitter keeps conversations that failed together from retrying together
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker for one provider. Closed: calls go through.
+    Open: calls wait out the reset period. Half-open: one trial call goes
+    through and its outcome closes or reopens the breaker.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset=BREAKER_RESET):
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    def wait_time(self):
+        """
+        0 if a call may go ahead now (claiming the trial slot if half-open),
+        otherwise seconds to wait before asking again.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            remaining = self.opened_at + self.reset - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if self.trial_running:
+                return 1.0
+            self.trial_running = True
+            return 0.0
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self, kind):
+        if kind == PERMANENT:
+            return
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    print(f"Circuit breaker open after {self.failures} failures")
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+
+_breakers = {}
+_lock = threading.Lock()
+
+
+def get_circuit_breaker(provider):
+    with _lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker()
+        return _breakers[provider]
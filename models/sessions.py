@@ -0,0 +1,60 @@
+"""
+Per-test model sessions that send only the newest message each turn.
+
+Normally every turn uploads the whole conversation. An adapter that supports
+sessions instead keeps state for the test, such as the id of the previous
+response to chain on or a persistent chat object, and sends only what the
+harness appended since its last reply. The harness only ever appends, so the
+state stays valid as long as the conversation is exactly one message longer
+than what the provider has seen; anything else, or an error that suggests
+the provider lost the state, falls back to resending the full conversation.
+"""
+
+
+class Session:
+    """
+    Provider-side state for one test's conversation.
+    """
+
+    def __init__(self):
+        self.state = None
+        # Messages of the conversation the provider has seen, counting its reply
+        self.sent = 0
+        self.delta_turns = 0
+        self.full_turns = 0
+        self.resets = 0
+
+    def delta(self, conversation_history):
+        """
+        Messages to send on top of the stored state, or None if the
+        conversation no longer extends what the provider has seen.
+        """
+        if self.state is None or len(conversation_history) != self.sent + 1:
+            return None
+        if self.sent and conversation_history[self.sent - 1]["role"] != "assistant":
+            return None
+        return conversation_history[self.sent:]
+
+    def advance(self, conversation_history, state, delta):
+        """
+        Record a successful call that sent conversation_history (all of it,
+        or only the delta) and produced state.
+        """
+        self.state = state
+        self.sent = len(conversation_history) + 1
+        if delta:
+            self.delta_turns += 1
+        else:
+            self.full_turns += 1
+
+    def reset(self):
+        self.state = None
+        self.sent = 0
+        self.resets += 1
+
+    def summary(self):
+        return {
+            'delta_turns': self.delta_turns,
+            'full_turns': self.full_turns,
+            'resets': self.resets
+        }
@@ -0,0 +1,111 @@
+"""
+Streamed replies that stop as soon as the model has committed to an action.
+
+The harness only acts on a "Test Case: ```...```" or "Final Guess: ```...```"
+block, so once one has closed there is nothing left to wait or pay for.
+Adapters that support streaming turn their provider's stream into a
+generator of text deltas, yielding an empty ModelResponse to report token
+usage; collect_stream reads it through an ActionBlockDetector and closes the
+generator, and with it the provider's stream, at the end of the first
+complete block.
+"""
+
+import re
+
+from .base_model import ModelResponse
+
+ACTION_KEYWORD = re.compile(r'test case|final guess', re.IGNORECASE)
+# A keyword, a little text (colon, markdown, "is:"), then a closed fence
+ACTION_BLOCK = re.compile(r'(test case|final guess)[^`]{0,80}?```(?:python)?(.+?)```', re.IGNORECASE | re.DOTALL)
+TEST_CASE_TUPLE = re.compile(r'\(.*?\)', re.DOTALL)
+
+
+class ActionBlockDetector:
+    """
+    Incremental search for the first well-formed action block: a test case
+    whose fence holds a parenthesised tuple, or a non-empty final guess.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.length = 0
+        self.text = ""
+        # Blocks can only start at a keyword, so never rescan text before the
+        # first one
+        self._start = None
+
+    def feed(self, delta):
+        """
+        Add streamed text; returns the end of the first complete action block
+        once there is one, otherwise None.
+        """
+        if not delta:
+            return None
+        self.parts.append(delta)
+        self.length += len(delta)
+        if '`' not in delta and self._start is not None:
+            return None
+        self.text = "".join(self.parts)
+        self.parts = [self.text]
+        if self._start is None:
+            keyword = ACTION_KEYWORD.search(self.text, max(0, self.length - len(delta) - len("final guess")))
+            if keyword is None:
+                return None
+            self._start = keyword.start()
+        for match in ACTION_BLOCK.finditer(self.text, self._start):
+            content = match.group(2).strip()
+            if match.group(1).lower() == 'test case':
+                if TEST_CASE_TUPLE.search(content):
+                    return match.end()
+            elif content:
+                return match.end()
+        return None
+
+    def received(self):
+        return "".join(self.parts)
+
+
+def _usage(piece, usage):
+    if isinstance(piece, ModelResponse):
+        for i, value in enumerate((piece.input_tokens, piece.output_tokens, piece.cached_tokens)):
+            if value is not None:
+                usage[i] = value
+
+
+def _response(text, usage, stopped_early=False):
+    return ModelResponse(text, usage[0], usage[1], stopped_early=stopped_early, cached_tokens=usage[2])
+
+
+def collect_stream(deltas):
+    """
+    Read a generator of text deltas until the first action block closes or
+    the stream ends. Returns the text up to there as a ModelResponse.
+    """
+    detector = ActionBlockDetector()
+    usage = [None, None, None]
+    try:
+        for piece in deltas:
+            _usage(piece, usage)
+            end = detector.feed(piece)
+            if end is not None:
+                return _response(detector.text[:end], usage, stopped_early=True)
+    finally:
+        deltas.close()
+    return _response(detector.received(), usage)
+
+
+async def collect_stream_async(deltas):
+    """
+    collect_stream for an async generator of text deltas.
+    """
+    detector = ActionBlockDetector()
+    usage = [None, None, None]
+    try:
+        async for piece in deltas:
+            _usage(piece, usage)
+            end = detector.feed(piece)
+            if end is not None:
+                return _response(detector.text[:end], usage, stopped_early=True)
+    finally:
+        await deltas.aclose()
+    return _response(detector.received(), usage)
@@ -0,0 +1,108 @@
+"""
+Fake model adapters and provider errors for the unit tests.
+"""
+
+import itertools
+
+from models.base_model import BaseModel, ModelResponse
+from models.retry import RetryPolicy
+
+_providers = itertools.count()
+
+
+class ProviderError(Exception):
+    """
+    Exception shaped like the SDK errors: an HTTP status and response headers.
+    """
+
+    def __init__(self, status_code, message="error", headers=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = type('Response', (), {'headers': headers or {}})()
+
+
+class ScriptedModel(BaseModel):
+    """
+    Raises the queued errors in order, then answers every call. Each instance
+    gets its own provider name, so rate limiters and circuit breakers are not
+    shared between tests.
+    """
+
+    def __init__(self, errors=(), reply="Test Case: ```(1, 2, 3)```"):
+        super().__init__('scripted')
+        self.provider = f'fake-{next(_providers)}'
+        self.retry_policy = RetryPolicy(base_delay=0.0)
+        self.errors = list(errors)
+        self.reply = reply
+        self.calls = 0
+
+    def _perform_step(self, conversation_history):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return ModelResponse(self.reply, 10, 5)
+
+    def initialize_conversation(self, system_prompt):
+        return [{"role": "system", "content": system_prompt}]
+
+
+class BatchModel(ScriptedModel):
+    """
+    In-memory batch API. Each reply counts the assistant turns so far, and
+    custom ids listed in fail_once get an error result the first time.
+    """
+    supports_batch = True
+
+    def __init__(self, fail_once=(), submit_errors=()):
+        super().__init__(submit_errors)
+        self.fail_once = set(fail_once)
+        self.batches = {}
+        self.submitted = []
+
+    def submit_batch(self, requests):
+        if self.errors:
+            raise self.errors.pop(0)
+        batch_id = f'batch-{len(self.batches)}'
+        self.batches[batch_id] = {custom_id: list(history) for custom_id, history in requests.items()}
+        self.submitted.append(sorted(requests))
+        return batch_id
+
+    def collect_batch(self, batch_id, custom_ids):
+        results = {}
+        for custom_id, history in self.batches[batch_id].items():
+            if custom_id in self.fail_once:
+                self.fail_once.discard(custom_id)
+                results[custom_id] = ModelResponse("", error='transient')
+            else:
+                turn = sum(1 for msg in history if msg['role'] == 'assistant')
+                results[custom_id] = ModelResponse(f"turn {turn}")
+        return results
+
+
+class TurnHarness:
+    """
+    The part of LLMReasoningHarness that run_lockstep drives: finishes after
+    turns successful replies, or fails once max_attempts replies were spent.
+    """
+
+    def __init__(self, turns, max_attempts=5):
+        self.turns = turns
+        self.max_attempts = max_attempts
+        self.attempts = 0
+        self.conversation_history = [{"role": "system", "content": "rules"}]
+
+    def apply_response(self, response):
+        self.attempts += 1
+        if not response:
+            return None
+        self.conversation_history.append({"role": "assistant", "content": str(response)})
+        if sum(1 for msg in self.conversation_history if msg['role'] == 'assistant') >= self.turns:
+            return {'points': 1000, 'attempts': self.attempts}
+        self.conversation_history.append({"role": "user", "content": "go on"})
+        return None
+
+    def out_of_attempts(self):
+        return self.attempts >= self.max_attempts
+
+    def unfinished_result(self):
+        return {'points': 0, 'attempts': self.attempts}
@@ -0,0 +1,217 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from harness.lockstep import custom_id, run_lockstep
+from models.batch import set_batch_poll
+from models.retry import PERMANENT, TRANSIENT
+
+from fakes import BatchModel, ProviderError, ScriptedModel, TurnHarness
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def no_polling_delay():
+    set_batch_poll(0)
+    yield
+    set_batch_poll(30)
+
+
+def run(model, harnesses, pending=None):
+    results, rounds = {}, []
+    run_lockstep(model, harnesses, lambda idx, harness, result: results.__setitem__(idx, result),
+                 lambda active, batch: rounds.append((sorted(active), batch)), pending)
+    return results, rounds
+
+
+def test_lockstep_runs_every_test_to_completion():
+    model = BatchModel()
+    results, rounds = run(model, {1: TurnHarness(1), 2: TurnHarness(3), 3: TurnHarness(2)})
+    assert results == {1: {'points': 1000, 'attempts': 1}, 2: {'points': 1000, 'attempts': 3},
+                       3: {'points': 1000, 'attempts': 2}}
+    assert [len(ids) for ids in model.submitted] == [3, 2, 1]
+    # Checkpoint after each submission and after each round
+    assert rounds[-1] == ([], None)
+
+
+def test_failed_requests_are_retried_next_round_until_attempts_run_out():
+    model = BatchModel(fail_once={'test-1-turn-1'})
+    results, _ = run(model, {1: TurnHarness(2), 2: TurnHarness(1, max_attempts=1)})
+    assert results[1] == {'points': 1000, 'attempts': 3}
+    assert model.submitted[1] == ['test-1-turn-1']
+
+    model = BatchModel(fail_once={'test-1-turn-1'})
+    results, _ = run(model, {1: TurnHarness(2, max_attempts=1)})
+    assert results[1] == {'points': 0, 'attempts': 1}
+
+
+def test_transient_submit_errors_are_retried():
+    model = BatchModel(submit_errors=[ProviderError(503)])
+    results, _ = run(model, {1: TurnHarness(1)})
+    assert results[1]['points'] == 1000
+    assert len(model.submitted) == 1
+
+
+def test_permanent_submit_errors_propagate():
+    model = BatchModel(submit_errors=[ProviderError(400)])
+    with pytest.raises(ProviderError):
+        run(model, {1: TurnHarness(1)})
+
+
+def test_resume_collects_the_pending_batch_instead_of_resubmitting():
+    model = BatchModel()
+    harnesses = {1: TurnHarness(2), 2: TurnHarness(2)}
+    batch_id = model.submit_batch({custom_id(idx, h): h.conversation_history for idx, h in harnesses.items()})
+    results, rounds = run(model, harnesses, {'id': batch_id, 'requests': [custom_id(2, harnesses[2]),
+                                                                          custom_id(1, harnesses[1])]})
+    assert rounds[0][1]['id'] == batch_id
+    assert len(model.submitted) == 2
+    assert results == {1: {'points': 1000, 'attempts': 2}, 2: {'points': 1000, 'attempts': 2}}
+
+
+def test_resume_resubmits_a_pending_batch_for_other_requests():
+    model = BatchModel()
+    harnesses = {1: TurnHarness(1)}
+    stale = model.submit_batch({'test-1-turn-9': []})
+    results, rounds = run(model, harnesses, {'id': stale, 'requests': ['test-1-turn-9']})
+    assert rounds[0][1]['id'] != stale
+    assert results[1]['points'] == 1000
+
+
+def test_models_without_a_batch_api_are_rejected():
+    with pytest.raises(ValueError):
+        run(ScriptedModel(), {1: TurnHarness(1)})
+    with pytest.raises(NotImplementedError, match='supports_batch'):
+        ScriptedModel().submit_batch({})
+
+
+def _completion(text):
+    return {"id": "x", "object": "chat.completion", "created": 0, "model": "m",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15,
+                      "prompt_tokens_details": {"cached_tokens": 8}}}
+
+
+class FakeOpenAIClient:
+    """
+    files and batches endpoints of the OpenAI client; a batch completes on
+    the second status check.
+    """
+
+    def __init__(self, output, errors=None):
+        self.uploads = []
+        self.checks = 0
+        self.file_text = {'out': "\n".join(json.dumps(line) for line in output)}
+        if errors:
+            self.file_text['err'] = "\n".join(json.dumps(line) for line in errors)
+        self.files = SimpleNamespace(create=self._upload,
+                                     content=lambda file_id: SimpleNamespace(text=self.file_text[file_id]))
+        self.batches = SimpleNamespace(create=lambda **kwargs: SimpleNamespace(id='batch_1', **kwargs),
+                                       retrieve=self._retrieve)
+
+    def _upload(self, file, purpose):
+        self.uploads.append(file[1].decode())
+        return SimpleNamespace(id='in')
+
+    def _retrieve(self, batch_id):
+        self.checks += 1
+        return SimpleNamespace(status='completed' if self.checks > 1 else 'in_progress', output_file_id='out',
+                               error_file_id='err' if 'err' in self.file_text else None)
+
+
+@pytest.fixture
+def openai_model(monkeypatch):
+    pytest.importorskip('openai')
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    from models.openai_model import OpenAIModel
+    return OpenAIModel('gpt-4o-mini')
+
+
+def test_openai_batch_submit_and_collect(openai_model):
+    ok = {"custom_id": "a", "error": None, "response": {"status_code": 200, "body": _completion("hello")}}
+    client = FakeOpenAIClient([ok], [
+        {"custom_id": "b", "error": None, "response": {"status_code": 500, "body": {"error": "boom"}}},
+        {"custom_id": "c", "error": None, "response": {"status_code": 400, "body": {"error": "bad"}}},
+    ])
+    openai_model.client = client
+    assert openai_model.submit_batch({'a': [{"role": "user", "content": "hi"}]}) == 'batch_1'
+    line = json.loads(client.uploads[0])
+    assert line['custom_id'] == 'a' and line['body']['messages'] == [{"role": "user", "content": "hi"}]
+
+    results = openai_model.collect_batch('batch_1', ['a', 'b', 'c', 'd'])
+    assert results['a'] == "hello" and results['a'].cached_tokens == 8 and results['a'].error is None
+    assert (results['b'].error, results['c'].error, results['d'].error) == (TRANSIENT, PERMANENT, TRANSIENT)
+    assert client.checks == 2
+
+
+class FakeAnthropicBatches:
+    def __init__(self, entries):
+        self.entries = entries
+        self.requests = None
+        self.checks = 0
+
+    def create(self, requests):
+        self.requests = requests
+        return SimpleNamespace(id='msgbatch_1')
+
+    def retrieve(self, batch_id):
+        self.checks += 1
+        return SimpleNamespace(processing_status='ended' if self.checks > 1 else 'in_progress')
+
+    def results(self, batch_id):
+        return iter(self.entries)
+
+
+def _entry(custom_id, result_type, text=None, error_type=None):
+    message = None
+    if text is not None:
+        message = SimpleNamespace(content=[SimpleNamespace(type='text', text=text)],
+                                  usage={'input_tokens': 2, 'output_tokens': 3, 'cache_read_input_tokens': 40})
+    error = SimpleNamespace(error=SimpleNamespace(type=error_type)) if error_type else None
+    return SimpleNamespace(custom_id=custom_id, result=SimpleNamespace(type=result_type, message=message, error=error))
+
+
+def test_anthropic_batch_submit_and_collect(monkeypatch):
+    pytest.importorskip('anthropic')
+    monkeypatch.setenv('ANTHROPIC_API_KEY', 'test')
+    monkeypatch.chdir(REPO_ROOT)
+    from models.anthropic_model import AnthropicModel
+    model = AnthropicModel('claude-3-5-sonnet-20240620')
+    batches = FakeAnthropicBatches([
+        _entry('a', 'succeeded', text='hello'),
+        _entry('b', 'errored', error_type='invalid_request_error'),
+        _entry('c', 'errored', error_type='overloaded_error'),
+        _entry('d', 'expired'),
+    ])
+    model.client = SimpleNamespace(messages=SimpleNamespace(batches=batches))
+
+    assert model.submit_batch({'a': [{"role": "user", "content": "hi"}]}) == 'msgbatch_1'
+    assert batches.requests[0]['custom_id'] == 'a' and batches.requests[0]['params']['model'] == model.model_name
+
+    results = model.collect_batch('msgbatch_1', ['a', 'b', 'c', 'd', 'e'])
+    assert results['a'] == 'hello' and results['a'].input_tokens == 42 and results['a'].cached_tokens == 40
+    assert [results[k].error for k in 'bcde'] == [PERMANENT, TRANSIENT, TRANSIENT, TRANSIENT]
+    assert batches.checks == 2
+
+
+def test_harness_checkpoint_round_trip(monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)
+    from harness.llm_reasoning_harness import LLMReasoningHarness
+
+    def rule(x, y, z):
+        return x < y < z
+
+    harness = LLMReasoningHarness(ScriptedModel(), rule)
+    for reply in ("Test Case: ```(1, 2, 3)```", "Test Case: ```(3, 2, 1)```"):
+        assert harness.apply_response(ScriptedModel(reply=reply).perform_step(harness.conversation_history)) is None
+    state = json.loads(json.dumps(harness.checkpoint_state()))
+
+    resumed = LLMReasoningHarness(ScriptedModel(), rule)
+    resumed.restore_state(state)
+    assert resumed.conversation_history == harness.conversation_history
+    assert resumed.test_cases == harness.test_cases and resumed.attempts == harness.attempts
+    assert resumed.hypothesis_tracker.num_remaining() == harness.hypothesis_tracker.num_remaining()
+    assert resumed.hypothesis_tracker.num_remaining() < resumed.hypothesis_tracker.total_hypotheses
@@ -0,0 +1,117 @@
+import asyncio
+import queue
+import threading
+
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('transformers')
+
+from models import hf_batched_model
+from models.base_model import ModelResponse
+from models.hf_batched_model import ActionBlockStop, BatchedHFModel, GenerationBatcher
+from models.retry import TRANSIENT
+
+
+class FakeBatcher(GenerationBatcher):
+    """
+    GenerationBatcher without weights: a prompt is its conversation length,
+    and generating records the batch sizes. Holds its first batch until
+    released, so a test can queue requests deterministically.
+    """
+
+    def __init__(self, fail=False):
+        self.max_batch = 4
+        self.wait = 0.05
+        self.passes = 0
+        self.generated = 0
+        self.fail = fail
+        self.sizes = []
+        self.release = threading.Event()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def prompt_ids(self, conversation_history):
+        return [len(conversation_history)]
+
+    def _generate(self, prompts):
+        self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("out of memory")
+        self.sizes.append(len(prompts))
+        return [ModelResponse(f"reply to {ids[0]}", ids[0], 1) for ids in prompts]
+
+
+@pytest.fixture
+def model(monkeypatch):
+    batcher = FakeBatcher()
+    monkeypatch.setattr(hf_batched_model, 'get_batcher', lambda path: batcher)
+    return BatchedHFModel('hf:fake/tiny')
+
+
+def conversations(n):
+    return {f'test-{i}': [{"role": "user", "content": "hi"}] * i for i in range(1, n + 1)}
+
+
+def test_batch_of_turns_is_generated_in_as_few_passes_as_fit(model):
+    batch_id = model.submit_batch(conversations(6))
+    model.batcher.release.set()
+    results = model.collect_batch(batch_id, list(conversations(6)) + ['test-missing'])
+    assert [results[f'test-{i}'] for i in range(1, 7)] == [f"reply to {i}" for i in range(1, 7)]
+    assert results['test-missing'].error == TRANSIENT
+    assert sum(model.batcher.sizes) == 6 and max(model.batcher.sizes) <= 4
+    assert len(model.batcher.sizes) == 2
+
+
+def test_generation_errors_come_back_as_failed_requests(monkeypatch):
+    batcher = FakeBatcher(fail=True)
+    monkeypatch.setattr(hf_batched_model, 'get_batcher', lambda path: batcher)
+    model = BatchedHFModel('hf:fake/tiny')
+    batch_id = model.submit_batch(conversations(2))
+    batcher.release.set()
+    results = model.collect_batch(batch_id, ['test-1', 'test-2'])
+    assert results['test-1'] == "" and results['test-1'].error == TRANSIENT
+    # The worker keeps serving after a failed pass
+    batcher.fail = False
+    assert model.perform_step([{"role": "user", "content": "hi"}]) == "reply to 1"
+
+
+def test_concurrent_async_turns_share_a_pass(model):
+    async def turns():
+        return await asyncio.gather(*[model.perform_step_async(history) for history in conversations(3).values()])
+
+    model.batcher.release.set()
+    replies = asyncio.run(turns())
+    assert replies == ["reply to 1", "reply to 2", "reply to 3"]
+    assert model.batcher.sizes == [3]
+
+
+def test_model_name_prefix_is_stripped(monkeypatch):
+    paths = []
+    monkeypatch.setattr(hf_batched_model, 'get_batcher', lambda path: paths.append(path))
+    BatchedHFModel('hf:org/model')
+    BatchedHFModel('/local/model')
+    assert paths == ['org/model', '/local/model']
+
+
+class CharTokenizer:
+    """
+    One token per character.
+    """
+
+    def decode(self, ids, skip_special_tokens=False):
+        return "".join(chr(int(i)) for i in ids)
+
+
+def test_rows_stop_once_their_action_block_is_complete():
+    prompt = "Q: "
+    rows = [prompt + "Test Case: ```(1, 2, 3)``` and more", prompt + "Still thinking about it, maybe"]
+    width = max(len(row) for row in rows)
+    ids = torch.tensor([[ord(c) for c in row.ljust(width)] for row in rows])
+    stop = ActionBlockStop(CharTokenizer(), len(prompt))
+    end = len(prompt + "Test Case: ```(1, 2, 3)```")
+    assert stop(ids[:, :end - 1], None).tolist() == [False, False]
+    assert stop(ids[:, :end], None).tolist() == [True, False]
+    # A stopped row stays stopped
+    assert stop(ids, None).tolist() == [True, False]
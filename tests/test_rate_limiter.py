@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from models import rate_limiter
+from models.base_model import ModelResponse
+from models.concurrency import AIMDController
+from models.rate_limiter import RateLimiter, TokenBucket, get_rate_limiter, load_rate_limits
+
+from fakes import ProviderError, ScriptedModel
+
+
+@pytest.fixture
+def limits(tmp_path):
+    """
+    Load rate limits from a temporary file; limits are off again afterwards.
+    """
+    def load(entries):
+        path = tmp_path / 'rate_limits.json'
+        path.write_text(json.dumps(entries))
+        return load_rate_limits(str(path))
+    yield load
+    load_rate_limits(str(tmp_path / 'missing.json'))
+
+
+def test_bucket_waits_only_once_in_debt():
+    bucket = TokenBucket(60)
+    assert bucket.reserve(60) == 0.0
+    # One token per second, so the next 2 take about 2s to come back
+    assert bucket.reserve(2) == pytest.approx(2.0, abs=0.05)
+
+
+def test_bucket_try_reserve_takes_nothing_when_short():
+    bucket = TokenBucket(60)
+    assert bucket.try_reserve(50)
+    assert not bucket.try_reserve(20)
+    assert bucket.tokens == pytest.approx(10, abs=0.1)
+
+
+def test_try_acquire_returns_the_request_when_tokens_are_short():
+    limiter = RateLimiter('fake', rpm=10, tpm=100)
+    assert limiter.try_acquire(80)
+    assert not limiter.try_acquire(50)
+    assert limiter.requests.tokens == pytest.approx(9, abs=0.01)
+    assert limiter.try_acquire(20)
+
+
+def test_record_replaces_the_estimate_with_reported_usage():
+    limiter = RateLimiter('fake', tpm=1000)
+    limiter.acquire(400)
+    limiter.record(ModelResponse("ok", 100, 50), 400)
+    assert limiter.tokens.tokens == pytest.approx(850, abs=1)
+
+
+def test_most_specific_limit_wins(limits):
+    limits({'fake': {'rpm': 10}, 'fake/big': {'rpm': 100, 'tpm': 1000}})
+    assert get_rate_limiter('fake', 'big').key == 'fake/big'
+    assert get_rate_limiter('fake', 'small').key == 'fake'
+    assert get_rate_limiter('fake', 'small') is get_rate_limiter('fake', 'other')
+    assert get_rate_limiter('unlisted', 'model') is None
+
+
+def test_perform_step_draws_from_the_shared_limiter(limits):
+    model = ScriptedModel()
+    limits({model.provider: {'rpm': 60}})
+    for _ in range(3):
+        model.perform_step([{"role": "user", "content": "hi"}])
+    assert rate_limiter._limiters[model.provider].requests.tokens == pytest.approx(57, abs=0.1)
+
+
+def test_controller_backs_off_on_rate_limits_and_grows_on_success():
+    controller = AIMDController(initial=8, maximum=16)
+    controller.record_error(ProviderError(429))
+    assert controller.current == 4
+    # A second signal within the cooldown counts but does not cut again
+    controller.record_error(ProviderError(429))
+    assert controller.current == 4 and controller.rate_limits == 2
+    controller.record_error(ProviderError(400))
+    assert controller.summary()['rate_limit_signals'] == 2
+    for _ in range(8):
+        controller.record_success(0.1)
+    assert controller.current == 5
@@ -0,0 +1,110 @@
+import pytest
+
+from models.prompt_cache import anthropic_usage, openai_cached_tokens
+from models.retry import (PERMANENT, RATE_LIMIT, TIMEOUT, TRANSIENT, CircuitBreaker, RetryPolicy,
+                          classify_error, retry_after)
+
+from fakes import ProviderError, ScriptedModel
+
+
+class ThrottlingException(Exception):
+    pass
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+class BotoError(Exception):
+    def __init__(self, status):
+        super().__init__("boto")
+        self.response = {'ResponseMetadata': {'HTTPStatusCode': status}}
+
+
+@pytest.mark.parametrize('error, kind', [
+    (ProviderError(429), RATE_LIMIT),
+    (ThrottlingException("slow down"), RATE_LIMIT),
+    (Exception("Rate limit reached for requests"), RATE_LIMIT),
+    (TimeoutError("model call timed out"), TIMEOUT),
+    (ProviderError(504), TIMEOUT),
+    (ProviderError(503), TRANSIENT),
+    (ProviderError(529, "Overloaded"), TRANSIENT),
+    (APIConnectionError("reset by peer"), TRANSIENT),
+    (BotoError(500), TRANSIENT),
+    (ProviderError(400, "invalid request"), PERMANENT),
+    (ProviderError(401), PERMANENT),
+    (ValueError("bad"), PERMANENT),
+])
+def test_classify_error(error, kind):
+    assert classify_error(error) == kind
+
+
+def test_retry_after_headers():
+    assert retry_after(ProviderError(429, headers={'retry-after-ms': '1500'})) == 1.5
+    assert retry_after(ProviderError(429, headers={'retry-after': '7'})) == 7.0
+    assert retry_after(ProviderError(429)) is None
+    assert retry_after(ValueError()) is None
+
+
+def test_policy_retries_all_but_permanent_errors_within_the_attempt_cap():
+    policy = RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=10.0)
+    assert policy.should_retry(TRANSIENT, 0) and policy.should_retry(RATE_LIMIT, 1)
+    assert not policy.should_retry(TIMEOUT, 2)
+    assert not policy.should_retry(PERMANENT, 0)
+    assert 0 <= policy.delay(2, ValueError()) <= 4.0
+    # A hint from the provider is honoured, plus jitter, up to max_delay
+    assert 5.0 <= policy.delay(0, ProviderError(429, headers={'retry-after': '5'})) <= 6.0
+    assert policy.delay(0, ProviderError(429, headers={'retry-after': '99'})) <= 11.0
+
+
+def test_breaker_opens_after_consecutive_failures_and_ignores_permanent_ones():
+    breaker = CircuitBreaker(threshold=3, reset=60.0)
+    breaker.record_failure(TRANSIENT)
+    breaker.record_failure(PERMANENT)
+    breaker.record_failure(TRANSIENT)
+    assert breaker.wait_time() == 0.0
+    breaker.record_failure(RATE_LIMIT)
+    assert breaker.wait_time() > 59.0
+
+
+def test_half_open_breaker_lets_one_trial_through():
+    breaker = CircuitBreaker(threshold=1, reset=0.0)
+    breaker.record_failure(TRANSIENT)
+    assert breaker.wait_time() == 0.0
+    assert breaker.wait_time() == 1.0
+    # A failed trial reopens it, a successful one closes it
+    breaker.record_failure(TRANSIENT)
+    assert breaker.opened_at is not None and not breaker.trial_running
+    assert breaker.wait_time() == 0.0
+    breaker.record_success()
+    assert breaker.wait_time() == 0.0 and breaker.opened_at is None
+
+
+def test_perform_step_retries_transient_errors():
+    model = ScriptedModel([ProviderError(503), ProviderError(429)])
+    response = model.perform_step([{"role": "user", "content": "hi"}])
+    assert response == model.reply and response.error is None
+    assert model.calls == 3
+    assert model.circuit_breaker.failures == 0
+
+
+def test_perform_step_gives_up_on_permanent_errors():
+    model = ScriptedModel([ProviderError(400), ProviderError(503)])
+    response = model.perform_step([{"role": "user", "content": "hi"}])
+    assert response == "" and response.error == PERMANENT
+    assert model.calls == 1
+
+
+def test_perform_step_stops_after_max_attempts():
+    model = ScriptedModel([ProviderError(503)] * 10)
+    response = model.perform_step([{"role": "user", "content": "hi"}])
+    assert response.error == TRANSIENT
+    assert model.calls == model.retry_policy.max_attempts
+
+
+def test_cached_token_usage():
+    assert anthropic_usage({'input_tokens': 10, 'output_tokens': 5,
+                            'cache_read_input_tokens': 100, 'cache_creation_input_tokens': 20}) == (130, 5, 100)
+    assert openai_cached_tokens({'prompt_tokens_details': {'cached_tokens': 64}}) == 64
+    assert openai_cached_tokens({'prompt_cache_hit_tokens': 32}) == 32
+    assert openai_cached_tokens(None) is None
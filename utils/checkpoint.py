@@ -4,7 +4,8 @@ import os
 def sanitize_model_name(model_name):
     return model_name.replace("/", "__")
 
-def save_checkpoint(model_name, current_test_idx, correct_answers, total_answers, total_repeats, points, attempts, novelty_scores, full_context, split):
+def save_checkpoint(model_name, current_test_idx, correct_answers, total_answers, total_repeats, points, attempts, novelty_scores, full_context, split,
+                    active=None, pending_batch=None):
     sanitized_name = sanitize_model_name(model_name)
     qualifier = f"_{split}" if split != "full" else ""    
     checkpoint = {
@@ -17,6 +18,10 @@ def save_checkpoint(model_name, current_test_idx, correct_answers, total_answers
         'novelty_scores': novelty_scores,
         'full_context': full_context
     }
+    # Batch mode: conversations of unfinished tests, and the batch they await
+    if active is not None:
+        checkpoint['active'] = active
+        checkpoint['pending_batch'] = pending_batch
     checkpoint_file = f'./checkpoints/{sanitized_name}{qualifier}_checkpoint.json'
     os.makedirs('./checkpoints', exist_ok=True)
     with open(checkpoint_file, 'w') as f:
@@ -1,17 +1,20 @@
 import numpy as np
-import openai
 from functools import lru_cache
-from retry import retry
 
-@lru_cache(maxsize=10000)
-@retry(tries=3)
-def embed(text):
-    client = openai.OpenAI()
+def _embed(text):
+    from models.clients import get_openai_client
+    client = get_openai_client('openai')
 
     response = client.embeddings.create(
         model="text-embedding-3-large", input=[text])
     return response.data[0].embedding
 
+@lru_cache(maxsize=10000)
+def embed(text):
+    # Imported here so runs that never score novelty don't need retry/openai
+    from retry.api import retry_call
+    return retry_call(_embed, fargs=[text], tries=3)
+
 # Reference: https://github.com/aidanmclaughlin/Aidan-Bench/blob/main/main.py#L82
 def get_novelty_scores(conversation):
     model_responses = [reply["content"] for reply in conversation 
@@ -5,7 +5,7 @@ import json
 def sanitize_model_name(model_name):
     return model_name.replace("/", "__")
 
-def dump_results(model_name, accuracy, avg_guesses, points, full_context, split):
+def dump_results(model_name, accuracy, avg_guesses, points, full_context, split, run_metrics=None):
     model_name = sanitize_model_name(model_name)
     qualifier = f"_{split}" if split != "full" else ""        
     os.makedirs('./results', exist_ok=True)
@@ -22,4 +22,10 @@ def dump_results(model_name, accuracy, avg_guesses, points, full_context, split)
     with open(json_file, 'w') as f:
         json.dump(full_context, f, indent=2)
 
+    # Dump run-level metrics (concurrency, hedging) if any
+    if run_metrics is not None:
+        metrics_file = f'./results/{model_name}{qualifier}_run_metrics.json'
+        with open(metrics_file, 'w') as f:
+            json.dump(run_metrics, f, indent=2)
+
     print(f"Results saved to {csv_file} and {json_file}")